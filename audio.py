@@ -0,0 +1,466 @@
+"""
+Background audio playback.
+
+Everything EarThoseChords plays is queued on one worker thread, so the play
+functions in `musictools` return immediately and the game can prompt the
+user while a chord is still sounding.  Jobs run in the order they were
+submitted (so `play_wait` still spaces things out), and `cancel` drops the
+queued jobs and cuts short the one that's playing.
+
+The live backends lay bars played back to back out on one timeline, so the
+music doesn't drift however long it plays (see `timeline`).
+
+The jobs are played by an audio backend, picked with `use`:
+
+  FluidSynthBackend  live FluidSynth (the default for the game)
+  RenderBackend      clips rendered in-process with NumPy (from the sample
+                     bank, the sound font or a sine synth) and streamed to
+                     the sound card
+  WavBackend         everything played, written to a WAV file
+  ClipBackend        the clips to play, collected for a client to play
+                     (see `server`)
+  NullBackend        nothing at all, with no latency (for tests, benchmarks
+                     and simulations; this is the default until `use` is
+                     called)
+
+Game code only calls the functions at the bottom of this module, so
+backends can be swapped without touching it.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import threading, traceback
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+import timeline, timing
+
+
+LIVE_VELOCITY = 64  # mingus' default, which `fluidsynth.play_Bar` plays at
+LEAD = 0.05  # seconds ahead of time each rendered bar is queued
+
+
+class AudioWorker(object):
+    """Runs submitted playback jobs one at a time on a daemon thread.
+
+    Jobs should wait with `sleep`, which returns early (and False) once the
+    worker is cancelled.  Jobs submitted while `enabled` is False are
+    dropped, which makes for silent, headless runs."""
+
+    def __init__(self):
+        self.enabled = True
+        self._jobs = queue.Queue()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audio")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, fcn, *args, **kwargs):
+        if not self.enabled:
+            return
+        self.start()
+        self._jobs.put((self._generation, fcn, args, kwargs))
+
+    def submit_setup(self, fcn, *args, **kwargs):
+        """Like `submit`, but the job isn't dropped by `cancel` (for setup
+        that later jobs depend on, like loading the sound font)."""
+        if not self.enabled:
+            return
+        self.start()
+        self._jobs.put((None, fcn, args, kwargs))
+
+    def cancel(self):
+        """Drops every queued job and interrupts the one playing."""
+        with self._lock:
+            self._generation += 1
+            self._cancelled.set()
+
+    def sleep(self, seconds):
+        """Waits `seconds`, returning False if cancelled in the meantime."""
+        return not self._cancelled.wait(seconds)
+
+    def wait(self):
+        """Blocks until all submitted jobs have finished."""
+        self._jobs.join()
+
+    def _run(self):
+        while True:
+            generation, fcn, args, kwargs = self._jobs.get()
+            try:
+                with self._lock:
+                    current = generation in (None, self._generation)
+                    if current:
+                        self._cancelled.clear()
+                if current:
+                    fcn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._jobs.task_done()
+
+
+worker = AudioWorker()
+
+
+###############################################################################
+### backends ##################################################################
+###############################################################################
+
+
+class AudioBackend(object):
+    """The interface every backend implements.
+
+    `init`, `play_bar`, `start_notes` and `close` run on the worker thread
+    (unless `queued` is False); `prepare` may be called from any thread and
+    `stop` from the game's, right after the worker is cancelled, so it
+    should leave whatever the worker uses to a job submitted then."""
+    name = None
+    silent = False  # if True, nothing is queued on the worker at all
+    queued = True  # if False, jobs run right away on the game's thread
+
+    def init(self):
+        """Does any slow setup, like loading a sound font."""
+
+    def play_bar(self, bar, bpm):
+        """Plays a mingus Bar, returning when it's over (or cancelled)."""
+        raise NotImplementedError
+
+    def start_notes(self, notes, bpm):
+        """Starts a Note or NoteContainer sounding without waiting (backends
+        that can't leave notes on hold them for a whole note at `bpm`)."""
+        raise NotImplementedError
+
+    def prepare(self, bar, bpm):
+        """Gets ready to play `bar` (e.g. renders it) ahead of time."""
+
+    def stop(self):
+        """Silences whatever is sounding."""
+
+    def close(self):
+        """Finishes up when the game ends."""
+
+    def report(self):
+        """Returns a summary to print when the game ends (or "")."""
+        return ""
+
+
+class NullBackend(AudioBackend):
+    name = "null"
+    silent = True
+
+    def play_bar(self, bar, bpm):
+        pass
+
+    def start_notes(self, notes, bpm):
+        pass
+
+
+class FluidSynthBackend(AudioBackend):
+    """Plays notes live through `mingus.midi.fluidsynth`, dispatching them
+    on a `timeline.Timeline` so bars played back to back stay on the beat
+    (see `timeline`)."""
+    name = "fluidsynth"
+
+    def __init__(self, sf2, channel=1):
+        self.sf2 = sf2
+        self.channel = channel
+        self.timeline = timeline.Timeline()
+        self.sequencer = timeline.Sequencer(self._note_on, self._note_off,
+                                            worker.sleep)
+        self._synth = None
+
+    def init(self):
+        from mingus.midi import fluidsynth  # requires FluidSynth
+        fluidsynth.init(self.sf2)
+        self._synth = fluidsynth.midi.fs
+
+    def _note_on(self, keys):
+        for key in keys:
+            self._synth.noteon(self.channel, key, LIVE_VELOCITY)
+
+    def _note_off(self, keys):
+        for key in keys:
+            self._synth.noteoff(self.channel, key)
+
+    def play_bar(self, bar, bpm):
+        """Plays `bar` as `fluidsynth.play_Bar` would, but on the timeline,
+        stopping as soon as the worker is cancelled."""
+        events = self.timeline.add(timeline.bar_events(bar, bpm))
+        if not self.sequencer.play(events, self.timeline.end):
+            self.timeline.reset()
+
+    def start_notes(self, notes, bpm):
+        keys = tuple(int(x) + 12 for x in
+                     ([notes] if hasattr(notes, "name") else notes))
+        self.sequencer.start(keys, self.timeline.start())
+
+    def stop(self):
+        # the timeline is only touched by the worker: this runs before
+        # anything played after the stop
+        worker.submit(self.timeline.reset)
+        if self._synth is not None:
+            self._synth.cc(self.channel, 123, 0)  # all notes off
+
+    def report(self):
+        jitter = self.sequencer.jitter
+        if not jitter.count:
+            return ""
+        return ("note timing: {} events, jitter mean {:.2f} ms, p99 {:.2f} "
+                "ms, max {:.2f} ms".format(
+                    jitter.count, jitter.mean() / 1e3,
+                    jitter.percentile(99) / 1e3, jitter.max / 1e3))
+
+
+def _note_bar(notes):
+    from mingus.containers import Bar
+    bar = Bar()
+    bar.place_notes(notes, 1)
+    return bar
+
+
+class RenderBackend(AudioBackend):
+    """Renders each Bar in-process (see `render`) and streams the clips to
+    the sound card.  Notes come from the sample bank `bank` if it's been
+    extracted, otherwise from FluidSynth with `sf2`, otherwise from a NumPy
+    sine synth."""
+    name = "render"
+
+    def __init__(self, sf2=None, bank=None, cache_bytes=None):
+        self.sf2 = sf2
+        self.bank = bank
+        self.cache_bytes = cache_bytes
+        self.timeline = timeline.Timeline(self._now)
+
+    @staticmethod
+    def _now():
+        import render
+        return render.player.time()
+
+    def init(self):
+        import render
+        render.init(self.sf2, self.cache_bytes, bank=self.bank)
+
+    def play_bar(self, bar, bpm):
+        """Queues `bar` on the player to start, to the sample, when the
+        last one ends, and returns a little before this one does, so the
+        next is queued in time to follow on from it."""
+        import render
+        start = self.timeline.add(render.bar_events(bar, bpm))[0][0]
+        render.player.play(render.render_bar(bar, bpm), at=start)
+        worker.sleep(self.timeline.end - render.player.time() - LEAD)
+
+    def start_notes(self, notes, bpm):
+        import render
+        render.player.play(render.render_bar(_note_bar(notes), bpm),
+                           at=self.timeline.start())
+
+    def prepare(self, bar, bpm):
+        import render
+        if render.initialized:
+            render.render_bar(bar, bpm)
+
+    def stop(self):
+        import render
+        if render.player is not None:
+            render.player.stop()
+            worker.submit(self.timeline.reset)  # see FluidSynthBackend
+
+    def report(self):
+        import render
+        return render.cache.report()
+
+
+class WavBackend(AudioBackend):
+    """Records everything played to the WAV file `filename`, written when
+    the game ends.  Nothing is heard and nothing waits in real time: each
+    Bar is rendered (as by `RenderBackend`) and laid out after the last."""
+    name = "wav"
+
+    def __init__(self, filename, sf2=None, bank=None, cache_bytes=None):
+        self.filename = filename
+        self.sf2 = sf2
+        self.bank = bank
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._clips = []  # [start, buffer] pairs, in samples
+        self._cursor = 0
+
+    def init(self):
+        import render
+        render.init(self.sf2, self.cache_bytes, bank=self.bank, play=False)
+
+    def _add(self, buf, length):
+        with self._lock:
+            self._clips.append([self._cursor, buf])
+            self._cursor += length
+
+    def play_bar(self, bar, bpm):
+        import render
+        length = sum(length for _, length, _ in render.bar_events(bar, bpm))
+        self._add(render.render_bar(bar, bpm),
+                  int(round(length * render.renderer.sample_rate)))
+
+    def start_notes(self, notes, bpm):
+        import render
+        self._add(render.render_bar(_note_bar(notes), bpm), 0)
+
+    def prepare(self, bar, bpm):
+        import render
+        if render.initialized:
+            render.render_bar(bar, bpm)
+
+    def stop(self):
+        """Cuts off anything still ringing at the current position."""
+        with self._lock:
+            for clip in self._clips:
+                clip[1] = clip[1][:max(self._cursor - clip[0], 0)]
+
+    def close(self):
+        import numpy as np
+        import render
+        with self._lock:
+            end = max([start + len(buf) for start, buf in self._clips] +
+                      [self._cursor])
+            mix = np.zeros((end, render.CHANNELS), dtype=np.int32)
+            for start, buf in self._clips:
+                mix[start:start + len(buf)] += buf
+        render.write_wav(self.filename, np.clip(mix, -32768, 32767),
+                         render.renderer.sample_rate)
+
+    def report(self):
+        return "Audio written to {}".format(self.filename)
+
+
+class ClipBackend(AudioBackend):
+    """Collects what's played, as (bar, bpm, start time) clips, instead of
+    playing it.  Nothing waits: a bar starts where the last one ended, and
+    `take` hands the clips over (e.g. to send them to a web client)."""
+    name = "clips"
+    queued = False
+
+    def __init__(self):
+        self._clips = []
+        self._cursor = 0.0
+        self._stopped = False
+
+    def play_bar(self, bar, bpm):
+        import render
+        self._clips.append((bar, bpm, self._cursor))
+        self._cursor += sum(length for _, length, _ in
+                            render.bar_events(bar, bpm))
+
+    def start_notes(self, notes, bpm):
+        self._clips.append((_note_bar(notes), bpm, self._cursor))
+
+    def stop(self):
+        """Forgets the clips not taken yet, and marks that whatever the 
+        client is playing should stop."""
+        self._clips = []
+        self._cursor = 0.0
+        self._stopped = True
+
+    def take(self):
+        """Returns (stopped, clips): whether audio was stopped since the
+        last call, and the clips played since then, timed from the first."""
+        taken = self._stopped, self._clips
+        self._clips = []
+        self._cursor = 0.0
+        self._stopped = False
+        return taken
+
+
+backend = NullBackend()
+_thread_backends = threading.local()
+
+
+def use(new_backend, thread=False):
+    """Plays everything submitted from now on with `new_backend` (its
+    `init` still has to be run, see `musictools.start_audio`).  If
+    `thread`, only what's played from the calling thread is (e.g. by one of
+    several game sessions), until `use(None, thread=True)`."""
+    global backend
+    if thread:
+        _thread_backends.backend = new_backend
+        if new_backend is not None and not new_backend.silent:
+            worker.enabled = True
+    else:
+        backend = new_backend
+        worker.enabled = not new_backend.silent
+
+
+def current():
+    """Returns the backend playing what the calling thread plays."""
+    return getattr(_thread_backends, "backend", None) or backend
+
+
+###############################################################################
+### playback (called from the game) ###########################################
+###############################################################################
+
+
+def _timed(fcn, submitted, audible, *args):
+    timing.sound_started(submitted, audible)
+    fcn(*args)
+
+
+def _play(player, fcn, audible, *args):
+    if player.silent:
+        return
+    if timing.enabled:
+        args = (fcn, timing.clock(), audible) + args
+        fcn = _timed
+    if player.queued:
+        worker.submit(fcn, *args)
+    else:
+        fcn(*args)
+
+
+def play_bar(bar, bpm):
+    """Queues `bar` to be played after whatever is already queued."""
+    player = current()
+    _play(player, player.play_bar, any(nc for _, _, nc in bar), bar, bpm)
+
+
+def start_notes(notes, bpm):
+    """Queues a Note or NoteContainer to start sounding, without waiting for
+    it to finish before the next job."""
+    player = current()
+    _play(player, player.start_notes, True, notes, bpm)
+
+
+def prepare(bar, bpm):
+    current().prepare(bar, bpm)
+
+
+def stop():
+    """Drops any queued audio and silences whatever is playing."""
+    player = current()
+    if player.silent:
+        return
+    if player.queued:
+        worker.cancel()
+    player.stop()
+
+
+def close():
+    """Lets everything queued finish, then closes the backend."""
+    player = current()
+    if player.silent:
+        return
+    if player.queued:
+        worker.submit(player.close)
+        worker.wait()
+    else:
+        player.close()
@@ -0,0 +1,297 @@
+"""
+Questions in bulk, for analytics and simulations.
+
+`questions(state, mode, number, seed)` draws `number` questions of a game
+mode at once from a seeded NumPy generator, with the same distributions as
+the game's prepare_* functions (and `random_chord`, `random_interval` and
+`random_progression`, with the state's `progressions` model), and returns
+them as a NumPy structured array with a record per question.  Every
+record has the question's `key` and:
+
+  single_chord  numeral  index of the chord's numeral in state.NUMERALS
+                octave   octave of the chord's root
+                Ioctave  octave of the tonic it resolves to
+                notes    the chord's MIDI keys, lowest first (padded with -1)
+                answer   the scale degree to answer (1-7)
+  chord_tone    as single_chord, plus
+                tone     index of the tone asked about in the chord
+                answer   the tone to answer (from state.TONES)
+  interval      Ioctave, number (1-15), ascending
+                notes    the interval's two MIDI keys, lowest first
+                answer   the two scale degrees to answer, lowest first
+                semitones  between the notes (INTERVAL_NAMES[semitones %
+                         12] is the answer with the -n flag)
+  progression   chords   number of chords
+                numerals their indices in state.NUMERALS (padded with -1)
+                strums   times each is played (padded with 0)
+                notes    each chord's MIDI keys as played (padded with -1)
+                answer   the scale degrees to answer (padded with 0)
+
+Keys are drawn at random from `keys` (defaults to the state's key).
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import numpy as np
+
+import progressions
+from musictools import chord_table, Diatonic
+
+
+MODES = ('single_chord', 'chord_tone', 'interval', 'progression')
+
+_tables = {}
+
+
+def _cached(fcn):
+    def tables(*args):
+        try:
+            return _tables[fcn, args]
+        except KeyError:
+            table = _tables[fcn, args] = fcn(*args)
+            return table
+    return tables
+
+
+@_cached
+def _chord_tables(keys, numerals, octaves):
+    """Returns the MIDI keys of every chord `random_chord` can pick, the
+    octave of its root (as spelled, so Cb4 is in octave 4) and the Ioctave
+    that goes with it (all by `_index(key, numeral, octave)`), and the
+    number of notes in each numeral's chord."""
+    notes = np.full((len(keys), len(numerals), len(octaves), 4), -1,
+                    np.int16)
+    roots = np.zeros((len(keys), len(numerals), len(octaves)), np.int8)
+    Ioctaves = np.zeros((len(keys), len(numerals), len(octaves)), np.int8)
+    sizes = np.zeros(len(numerals), np.int8)
+    for k, key in enumerate(keys):
+        table = chord_table(key)
+        for i, numeral in enumerate(numerals):
+            sizes[i] = len(table.base[numeral])
+            for j, octave in enumerate(octaves):
+                midi = table.midi(numeral, octave)
+                notes[k, i, j, :len(midi)] = midi
+                roots[k, i, j] = table.container(numeral, midi)[0].octave
+                if octave is not None:
+                    Ioctaves[k, i, j] = table.Ioctave(numeral, octave)
+    return notes.reshape(-1, 4), roots.ravel(), Ioctaves.ravel(), sizes
+
+
+@_cached
+def _voiced_tables(keys, numerals, Ioctave):
+    """Returns the MIDI keys of each numeral's chord as `progression_chords`
+    voices it, by `_index(key, numeral)`, followed by a row of padding."""
+    notes = np.full((len(keys)*len(numerals) + 1, 4), -1, np.int16)
+    for k, key in enumerate(keys):
+        table = chord_table(key)
+        for i, numeral in enumerate(numerals):
+            midi = table.voiced(numeral, Ioctave)
+            notes[k*len(numerals) + i, :len(midi)] = midi
+    return notes
+
+
+@_cached
+def _transition_tables(model):
+    """Returns the cumulative weights of a `progressions.ProgressionModel`
+    for the first chord, and for the chord after each degree (by row)."""
+    start, following = model.cumulative()
+    return np.asarray(start), np.asarray(following)
+
+
+@_cached
+def _scale_tables(keys, Ioctaves):
+    """Returns the MIDI keys of each key's scale (by `_index(key, Ioctave,
+    degree)`) and the semitones from each degree up and down to the degree
+    k steps away (by `_index(key, degree, k)`), as in `Diatonic`."""
+    scales = np.zeros((len(keys), len(Ioctaves), 7), np.int16)
+    up = np.zeros((len(keys), 7, 7), np.int16)
+    down = np.zeros((len(keys), 7, 7), np.int16)
+    for k, key in enumerate(keys):
+        for j, Ioctave in enumerate(Ioctaves):
+            scales[k, j] = Diatonic.for_key(key, Ioctave).scale
+        up[k] = Diatonic.for_key(key)._up
+        down[k] = Diatonic.for_key(key)._down
+    return scales.ravel(), up.ravel(), down.ravel()
+
+
+def _index(*indices_and_sizes):
+    """Returns the index into a flattened table of the (indices, size)
+    pairs given, first dimension first (like `numpy.ravel_multi_index`,
+    but skipping dimensions of size 1)."""
+    index = 0
+    for indices, size in indices_and_sizes:
+        if size > 1:
+            index = index*size + indices
+    return index
+
+
+def _pick(rng, n, number, dtype=np.intp):
+    """Returns `number` random indices below `n` (all 0 if `n` is 1)."""
+    if n == 1:
+        return np.zeros(number, dtype)
+    return rng.integers(n, size=number, dtype=dtype)
+
+
+def _set_keys(q, keys, k):
+    if len(keys) == 1:
+        q['key'] = keys[0]
+    else:
+        q['key'] = np.asarray(keys)[k]
+
+
+def _chords(state, keys, number, rng, dtype):
+    """Draws chords as `random_chord` does, returning the records (with
+    their chords filled in) and each chord's size."""
+    numerals = tuple(state.NUMERALS)
+    octaves = tuple(state.OCTAVES) if state.MANY_OCTAVES else (None,)
+    notes, roots, Ioctaves, sizes = _chord_tables(keys, numerals, octaves)
+    k = _pick(rng, len(keys), number)
+    i = _pick(rng, len(numerals), number)
+    j = _pick(rng, len(octaves), number)
+    index = _index((k, len(keys)), (i, len(numerals)), (j, len(octaves)))
+
+    q = np.empty(number, dtype)
+    _set_keys(q, keys, k)
+    q['numeral'] = i
+    q['notes'] = notes.take(index, axis=0)
+    q['octave'] = roots.take(index)
+    if state.MANY_OCTAVES:
+        q['Ioctave'] = Ioctaves.take(index)
+    else:
+        q['Ioctave'] = state.DEFAULT_IOCTAVE
+    return q, sizes.take(i)
+
+
+def single_chord(state, keys, number, rng):
+    q, _ = _chords(state, keys, number, rng,
+                   [('key', 'U3'), ('numeral', 'i1'), ('octave', 'i1'),
+                    ('Ioctave', 'i1'), ('notes', 'i2', 4), ('answer', 'i1')])
+    q['answer'] = q['numeral'] + 1
+    return q
+
+
+def chord_tone(state, keys, number, rng):
+    q, sizes = _chords(state, keys, number, rng,
+                       [('key', 'U3'), ('numeral', 'i1'), ('octave', 'i1'),
+                        ('Ioctave', 'i1'), ('notes', 'i2', 4),
+                        ('tone', 'i1'), ('answer', 'i1')])
+    q['tone'] = rng.integers(sizes, dtype=np.int8)
+    q['answer'] = np.asarray(state.TONES, np.int8).take(q['tone'])
+    return q
+
+
+def interval(state, keys, number, rng):
+    mode = state.INTERVAL_MODE
+    if mode not in ('triads', 'sevenths', 'ascending', 'descending',
+                    'mixed'):
+        raise ValueError("Can't understand.  state.INTERVAL_MODE = {}"
+                         "".format(mode))
+    numbers = np.asarray({'triads': [3, 5, 8],
+                          'sevenths': [3, 5, 7, 8]}.get(mode, state.INTERVALS),
+                         np.int16)
+    Ioctaves = (tuple(state.OCTAVES) if state.MANY_OCTAVES else
+                (state.DEFAULT_IOCTAVE,))
+    scales, up, down = _scale_tables(keys, Ioctaves)
+
+    k = _pick(rng, len(keys), number)
+    j = _pick(rng, len(Ioctaves), number)
+    if state.FIXED_ROOT:
+        r = np.full(number, state.FIXED_ROOT - 1)
+    else:
+        r = rng.integers(7, size=number)
+    n = numbers.take(_pick(rng, len(numbers), number))
+    if mode == 'mixed':
+        ascending = rng.integers(2, size=number, dtype=np.int8).view(bool)
+    else:
+        ascending = mode != 'descending'
+
+    steps = (n - 1) % 7
+    octaves = 12*((n - 1) // 7)
+    root = scales.take(_index((k, len(keys)), (j, len(Ioctaves)), (r, 7)))
+    kr = _index((k, len(keys)), (r, 7), (steps, 7))
+    low = np.where(ascending, root, root - down.take(kr) - octaves)
+    high = np.where(ascending, root + up.take(kr) + octaves, root)
+    high[low == high] += 12  # unisons are played as octaves
+    other = np.where(ascending, r + steps, r - steps) % 7 + 1
+
+    q = np.empty(number, [('key', 'U3'), ('Ioctave', 'i1'),
+                          ('number', 'i1'), ('ascending', '?'),
+                          ('notes', 'i2', 2), ('answer', 'i1', 2),
+                          ('semitones', 'i1')])
+    _set_keys(q, keys, k)
+    q['Ioctave'] = np.asarray(Ioctaves).take(j)
+    q['number'] = n
+    q['ascending'] = ascending
+    q['notes'][:, 0] = low
+    q['notes'][:, 1] = high
+    q['answer'][:, 0] = np.where(ascending, r + 1, other)
+    q['answer'][:, 1] = np.where(ascending, other, r + 1)
+    q['semitones'] = high - low
+    return q
+
+
+def progression(state, keys, number, rng):
+    numerals = tuple(state.NUMERALS)
+    lengths = np.asarray(state.PROG_LENGTHS, np.int8)
+    chord_lengths = np.asarray(state.CHORD_LENGTHS, np.int8)
+    most = lengths.max()  # every chord is strummed at least once
+    first, following = _transition_tables(
+        progressions.model(state.PROGRESSIONS))
+
+    # drawn a chord at a time, as `ProgressionModel.progression` does, but
+    # for every question at once: each chord by bisecting the cumulative
+    # weights of the one before, with strums cut short to the length
+    length = lengths.take(_pick(rng, len(lengths), number))
+    u = rng.random((most, number))
+    i = np.empty((most, number), np.int8)
+    i[0] = first.searchsorted(u[0] * first[-1], side='right')
+    strums = chord_lengths.take(_pick(rng, len(chord_lengths),
+                                      (most, number)))
+    played = np.empty((most, number), bool)
+    strummed = np.zeros(number, np.int8)
+    for c in range(most):
+        if c:
+            weights = following.take(i[c - 1], axis=0)
+            u[c] *= weights[:, -1]
+            np.sum(weights <= u[c, :, None], axis=1, out=i[c])
+        np.minimum(strums[c], length - strummed, out=strums[c])
+        np.less(strummed, length, out=played[c])
+        strummed += strums[c]
+    strums *= played
+    unplayed = ~played
+    np.copyto(i, -1, where=unplayed)
+
+    k = _pick(rng, len(keys), number)
+    voiced = _voiced_tables(keys, numerals, 4)
+    index = _index((k, len(keys)), (i.astype(np.intp), len(numerals)))
+    np.copyto(index, len(voiced) - 1, where=unplayed)
+
+    q = np.empty(number, [('key', 'U3'), ('chords', 'i1'),
+                          ('numerals', 'i1', most), ('strums', 'i1', most),
+                          ('notes', 'i2', (most, 4)),
+                          ('answer', 'i1', most)])
+    _set_keys(q, keys, k)
+    q['chords'] = played.sum(axis=0)
+    q['numerals'] = i.T
+    q['strums'] = strums.T
+    q['notes'] = voiced.take(index.T, axis=0)
+    q['answer'] = i.T + 1
+    return q
+
+
+def questions(state, mode, number, seed=None, keys=None):
+    """Returns `number` random questions of `mode` as a structured array
+    (see above), drawn with `numpy.random.default_rng(seed)` from the
+    settings of `state` (a `game_structure.GameState` or a
+    `settings.Config`), in keys picked at random from `keys` (defaults to
+    the state's key)."""
+    draw = {'single_chord': single_chord,
+            'chord_tone': chord_tone,
+            'interval': interval,
+            'progression': progression}[mode]
+    return draw(state, tuple(keys or (state.KEY,)), number,
+                np.random.default_rng(seed))
@@ -0,0 +1,356 @@
+#! /usr/bin/env python
+
+"""
+Microbenchmarks for question generation and answer evaluation.
+
+Runs headless: audio is switched off, so nothing needs FluidSynth or a
+sound card.  Results (microseconds per question or answer) are written as
+JSON so runs from different commits can be compared, e.g.
+
+$ python benchmark.py -o before.json
+$ git checkout some-branch
+$ python benchmark.py -o after.json --compare before.json
+
+It also plays a few seconds of cadences and progressions at high BPM
+through the audio sequencer (see `timeline`), with no synth, and reports
+how late the notes were dispatched (jitter) and how far the music drifted.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import argparse, json, os, platform, subprocess, sys, time
+
+import settings as st
+import audio
+import musictools as mt
+import game_modes as gm
+import progressions
+import timeline
+
+
+KEYS = ['A', 'Bb', 'B', 'C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab']
+KEYS = KEYS + [k.lower() for k in KEYS]
+
+
+class _Silence(object):
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def timeit(fcn, calls, repeat):
+    """Returns the seconds taken by each of `repeat` runs of `calls` calls
+    to `fcn`, with stdout silenced."""
+    stdout, sys.stdout = sys.stdout, _Silence()
+    try:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(calls):
+                fcn()
+            times.append(time.perf_counter() - start)
+    finally:
+        sys.stdout = stdout
+    return times
+
+
+# Benchmarks: each is given a game state (see `game_modes.new_state`) and
+# returns a function to time and how many questions (or answers) one call
+# of it covers.
+def bench_random_chord(state):
+    def run():
+        for key in KEYS:
+            state.KEY = key
+            mt.random_chord(state)
+    return run, len(KEYS)
+
+
+def bench_random_chord_many_octaves(state):
+    def run():
+        state.MANY_OCTAVES = True
+        for key in KEYS:
+            state.KEY = key
+            mt.random_chord(state)
+        state.MANY_OCTAVES = False
+    return run, len(KEYS)
+
+
+def bench_diatonic_interval(state):
+    cases = []
+    for key in KEYS:
+        diatonic = mt.Diatonic.for_key(key, 4)
+        for root in diatonic.notes:
+            for number in state.INTERVALS:
+                for ascending in (True, False):
+                    cases.append((diatonic, number, root, ascending))
+
+    def run():
+        for diatonic, number, root, ascending in cases:
+            diatonic.interval(number, root=root, ascending=ascending)
+    return run, len(cases)
+
+
+def bench_random_interval(state):
+    def run():
+        state.INTERVAL_MODE = 'mixed'
+        for key in KEYS:
+            state.KEY = key
+            gm.random_interval(state)
+    return run, len(KEYS)
+
+
+def bench_random_progression(state):
+    def run():
+        for length in state.PROG_LENGTHS:
+            mt.random_progression(length, state.NUMERALS, 
+                                  state.CHORD_LENGTHS, rng=state.rng)
+    return run, len(state.PROG_LENGTHS)
+
+
+def bench_random_progression_functional(state):
+    model = progressions.model('functional')
+
+    def run():
+        for length in state.PROG_LENGTHS:
+            mt.random_progression(length, state.NUMERALS,
+                                  state.CHORD_LENGTHS, rng=state.rng,
+                                  model=model)
+    return run, len(state.PROG_LENGTHS)
+
+
+def bench_chordname(state):
+    chords = [(mt.chord_table(key).container(numeral), numeral)
+              for key in KEYS for numeral in mt.ChordTable.numerals]
+
+    def run():
+        for chord, numeral in chords:
+            mt.chordname(chord, numeral)
+    return run, len(chords)
+
+
+def bench_progression_chords(state):
+    progs = [(key, list(state.CADENCE) + ["Iup"]) for key in KEYS]
+
+    def run():
+        for key, prog in progs:
+            mt.progression_chords(prog, key, Iup=state.I)
+    return run, len(progs)
+
+
+def bench_eval_interval(state):
+    question = mt.IntervalTable.for_key("C", 4).question(5, 2)
+    answers = ["26", "2 6", "D A", "d a", "3 7", "x"]
+
+    def run():
+        for ans in answers:
+            gm.eval_interval(state, ans, question)
+    return run, len(answers)
+
+
+def bench_eval_interval_name(state):
+    question = mt.IntervalTable.for_key("C", 4).question(3, 2)
+    answers = ["3b", "3", "x"]
+
+    def run():
+        for ans in answers:
+            gm.eval_interval_name(state, ans, question)
+    return run, len(answers)
+
+
+def bench_eval_single_chord(state):
+    answers = [("5", "V", "G"), ("G", "V", "G"), ("g", "V", "G"),
+               ("3", "V", "G"), ("Db", "II", "D"), ("x", "I", "C")]
+
+    def run():
+        for ans, numeral, root in answers:
+            gm.eval_single_chord(state, ans, numeral, root)
+    return run, len(answers)
+
+
+def bench_eval_progression(state):
+    cases = [("145", ["I", "IV", "V"], ["I", "IV", "IV", "V"]),
+             ("C F G", ["I", "IV", "V"], ["I", "IV", "V"]),
+             ("1 2", ["I", "VI", "II"], ["I", "VI", "II"])]
+
+    def run():
+        for ans, prog, strums in cases:
+            gm.eval_progression(state, ans, prog, strums)
+    return run, len(cases)
+
+
+def bench_batch(mode):
+    def setup(state):
+        import batch  # needs numpy
+        batch.questions(state, mode, 1)  # builds its tables
+
+        def run():
+            batch.questions(state, mode, 1000)
+        return run, 1000
+    return setup
+
+
+def jitter_bars(seconds, bpm):
+    """Returns about `seconds` of (bar, bpm) pairs played back to back as
+    in the progression game: the cadence, a pause, a random progression
+    and another pause, over and over."""
+    state = gm.new_state(st.config(), seed=0)
+    bars = []
+    while timeline.duration(timeline.sequence(bars)) < seconds:
+        _, strums = mt.random_progression(max(state.PROG_LENGTHS),
+                                          state.NUMERALS,
+                                          state.CHORD_LENGTHS, rng=state.rng)
+        for notes in (mt.progression_chords(state.CADENCE, "C",
+                                             Iup=state.I),
+                      [None],
+                      mt.progression_chords(strums, "C"),
+                      [None]):
+            bars.append((mt.easy_bar(notes), bpm))
+    return bars
+
+
+def measure_jitter(seconds=2.0, bpm=480):
+    """Plays `jitter_bars` through a `timeline.Sequencer` with no synth,
+    and returns how late its note events were (jitter) and how late it
+    finished (drift), in microseconds, along with the drift of sleeping
+    through the same bars chord by chord, as `fluidsynth.play_Bar` does."""
+    def nothing(keys):
+        pass
+
+    bars = jitter_bars(seconds, bpm)
+    sequencer = timeline.Sequencer(nothing, nothing)
+    line = timeline.Timeline()
+    for bar, bpm in bars:
+        sequencer.play(line.add(timeline.bar_events(bar, bpm)), line.end)
+    drift = timeline.clock() - line.end
+
+    start = timeline.clock()
+    for bar, bpm in bars:
+        for _, length, keys in timeline.bar_events(bar, bpm):
+            nothing(keys)
+            time.sleep(length)
+            nothing(keys)
+    sleep_drift = timeline.clock() - start - \
+        timeline.duration(timeline.sequence(bars))
+
+    jitter = sequencer.jitter
+    return {"events": jitter.count, "bpm": bpm,
+            "mean_us": jitter.mean(), "median_us": jitter.percentile(50),
+            "p99_us": jitter.percentile(99), "max_us": jitter.max,
+            "drift_us": 1e6 * drift, "sleep_drift_us": 1e6 * sleep_drift}
+
+
+BENCHMARKS = [
+    ("random_chord", bench_random_chord),
+    ("random_chord[many_octaves]", bench_random_chord_many_octaves),
+    ("Diatonic.interval", bench_diatonic_interval),
+    ("random_interval", bench_random_interval),
+    ("random_progression", bench_random_progression),
+    ("random_progression[functional]", bench_random_progression_functional),
+    ("chordname", bench_chordname),
+    ("progression_chords", bench_progression_chords),
+    ("eval_interval", bench_eval_interval),
+    ("eval_interval_name", bench_eval_interval_name),
+    ("eval_single_chord", bench_eval_single_chord),
+    ("eval_progression", bench_eval_progression),
+    ("batch[single_chord]", bench_batch('single_chord')),
+    ("batch[chord_tone]", bench_batch('chord_tone')),
+    ("batch[interval]", bench_batch('interval')),
+    ("batch[progression]", bench_batch('progression')),
+]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+            ).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(names=None, calls=200, repeat=5):
+    """Returns {name: stats} for the benchmarks in `names` (all of them by
+    default), in microseconds per question or answer."""
+    audio.use(audio.NullBackend())
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        state = gm.new_state(st.config(), seed=0)
+        state.KEY = "C"
+        fcn, per_call = setup(state)
+        timeit(fcn, 1, 1)  # warm up caches
+        times = sorted(t / (calls * per_call) * 1e6
+                       for t in timeit(fcn, calls, repeat))
+        results[name] = {"min_us": times[0],
+                         "median_us": times[len(times)//2],
+                         "max_us": times[-1],
+                         "calls": calls * per_call, "repeat": repeat}
+    return results
+
+
+def compare(results, baseline):
+    print("\n{:<28} {:>12} {:>12} {:>8}".format("benchmark", "before (us)",
+                                                 "after (us)", "change"))
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["min_us"]
+        after = stats["min_us"]
+        print("{:<28} {:>12.2f} {:>12.2f} {:>+7.0%}".format(
+            name, before, after, after/before - 1))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('-o', '--output', default="bench_output.json",
+                        help="JSON file to write the results to.")
+    parser.add_argument('-n', '--calls', type=int, default=200,
+                        help="Calls per timing run.")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="Number of timing runs (the minimum is "
+                             "reported).")
+    parser.add_argument('-c', '--compare',
+                        help="A previous results file to compare against.")
+    parser.add_argument('-j', '--jitter', type=float, default=2.0,
+                        help="Seconds of music to measure the sequencer's "
+                             "jitter over (0 to skip).")
+    parser.add_argument('names', nargs='*',
+                        help="Benchmarks to run (defaults to all).")
+    user_args = parser.parse_args(args)
+
+    results = run_benchmarks(user_args.names, user_args.calls,
+                             user_args.repeat)
+    for name, stats in results.items():
+        print("{:<28} {:>10.2f} us".format(name, stats["min_us"]))
+
+    jitter = None
+    if user_args.jitter:
+        jitter = measure_jitter(user_args.jitter)
+        print("\nsequencer jitter over {events} events at {bpm} bpm: "
+              "mean {mean_us:.0f} us, p99 {p99_us:.0f} us, max {max_us:.0f} "
+              "us\ndrift {drift_us:.0f} us (sleeping chord by chord: "
+              "{sleep_drift_us:.0f} us)".format(**jitter))
+
+    with open(user_args.output, "w") as f:
+        json.dump({"commit": git_commit(),
+                   "python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "results": results, "jitter": jitter},
+                  f, indent=2, sort_keys=True)
+
+    if user_args.compare:
+        with open(user_args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == '__main__':
+    main()
@@ -24,50 +24,95 @@ from __future__ import division, absolute_import, print_function
 try: input = raw_input
 except: pass
 
-# Internal Dependencies
-from getch import getch
-import game_structure as gs
-
 # External Dependencies
-import argparse, time, sys, random, os
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
-from mingus.core import progressions, intervals, chords as ch
-import mingus.core.notes as notes
-from mingus.containers import NoteContainer, Note
-
-
-# Modes
-def eval_single(usr_ans, question, root_note):
-    correct_ = False
-    if usr_ans == str(numerals.index(question) + 1):
-        correct_ = True
-    else:
-        try:
-            usr_note_val = int(Note(usr_ans[0].upper() + usr_ans[1:])) % 12
-            correct_note_val = int(Note(root_note)) % 12
-            if usr_note_val == correct_note_val:
-                correct_ = True
-        except:
-            pass
-    return correct_
-
-def main():
-    # Initialize
-    import settings as st # parses command-line user arguments and initializes settings
-    fluidsynth.init(st.SOUNDFONT)  # start FluidSynth
+import sys, time
+
+
+class StartupProfile(object):
+    """Times each step of starting up, for the --profile_startup flag."""
+    def __init__(self):
+        self.steps = []
+        self.last = self.start = time.time()
+
+    def step(self, name):
+        now = time.time()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        print("Startup time:")
+        for name, seconds in self.steps:
+            print("  {:<32} {:8.1f} ms".format(name, 1000*seconds))
+        print("  {:<32} {:8.1f} ms".format("total", 
+                                           1000*(self.last - self.start)))
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args[:1] == ["export"]:  # write drills to audio files, see export.py
+        import export
+        return export.main(args[1:])
+
+    profile = StartupProfile()
+
+    # Parse command-line user arguments and initialize settings
+    import settings as st
+    profile.step("import settings")
+    config = st.init(args)
+    profile.step("parse arguments")
+
+    # Import the game; mingus' synth, numpy, etc. are only loaded when used
+    import musictools
+    profile.step("import musictools")
+    import game_modes
+    import game_structure as gs
+    profile.step("import game_modes")
+    state = game_modes.new_state(config)
+
+    # Load the sound font (or samples) on the audio thread, so the first 
+    # question can be asked while it loads
+    def init_audio():
+        start = time.time()
+        musictools.init_audio()
+        if config.PROFILE_STARTUP:
+            print("\n(audio ready after {:.1f} ms in the background)"
+                  "".format(1000*(time.time() - start)))
+    musictools.start_audio(init_audio)
+    profile.step("start audio thread")
+
+    # Time each phase of every question
+    if config.TIMING:
+        import timing
+        timing.enabled = True
+
+    # Save every answer
+    if config.HISTORY_FILE:
+        import history
+        state.answer_log = history.AnswerLog(config.HISTORY_FILE)
+        profile.step("open history")
+
+    # Ask what needs practice most
+    if config.SCHEDULE_FILE:
+        import scheduler
+        state.scheduler = scheduler.Scheduler(config.SCHEDULE_FILE)
+        profile.step("load schedule")
 
     # Change instrument
     # fluidsynth.set_instrument(1, 14)
 
     # Initialize Game
-    from game_modes import game_modes
-    st.CURRENT_MODE = game_modes[st.INITIAL_MODE]
-    st.CURRENT_MODE.intro()
+    musictools.chord_table(state.KEY)
+    profile.step("build chord table")
+    game = gs.Game(game_modes.play, game_modes.game_modes, 
+                   state.CURRENT_MODE, config)
+    state.CURRENT_MODE.intro(state)
+    profile.step("intro")
+    if config.PROFILE_STARTUP:
+        profile.report()
 
-    while 1:
-        st.CURRENT_MODE.new_question()
+    game.play(state)
 
 # Play the Game!!!
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,280 @@
+"""
+Drill packs: questions written to WAV files, with answer keys, to practice
+away from the game (e.g. on a phone).
+
+$ python earthosechords.py export -n 20 --out drills -a synth
+
+asks `-n` questions of each mode in each of the 24 keys (`KEYS`, major and
+minor) and writes
+
+  drills/<key>/cadence.wav          the cadence establishing the key
+  drills/<key>/<mode>/<nnn>.wav     each question
+  drills/answers.csv                key, mode, number, file, question, answer
+
+With --midi, questions in the current key (-k) are written to a Standard
+MIDI File instead, a question at a time, so even 100000 of them take no
+more memory than one.  Each question is marked with its answer, and can be
+followed by the resolution the game plays (--resolve) and preceded by the
+cadence (--cadence):
+
+$ python earthosechords.py export --midi drills.mid -n 1000 --resolve
+
+Questions are picked and voiced by the game's own prepare_* functions and
+played through a `ClipBackend`, so the files sound just like the game.
+Rendering them, which is what takes time, is spread over a pool of
+processes, one per core unless --jobs says otherwise.  Game settings can be
+given as for earthosechords.py (e.g. -s for sevenths, -o for many octaves,
+-a synth to render with the sine synth instead of the sample bank or sound
+font).
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import argparse, csv, multiprocessing, os, time
+
+import settings as st
+import audio
+import midifile
+import render
+
+
+MODES = ('single_chord', 'chord_tone', 'interval', 'progression')
+
+
+def key_dirname(key):
+    """e.g. 'Eb_major' or 'eb' -> 'Eb_minor' (key names differ only in case,
+    which not every file system tells apart)."""
+    if key == key.lower():
+        return key[:1].upper() + key[1:] + "_minor"
+    return key + "_major"
+
+
+def clip_events(clips):
+    """Lays the (bar, bpm, start) clips taken from a `ClipBackend` out as
+    one list of `render.bar_events`-style events."""
+    events = []
+    for bar, bpm, start in clips:
+        events.extend((start + t, length, keys)
+                      for t, length, keys in render.bar_events(bar, bpm))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def play_question(state, q, resolve=False):
+    """Plays question `q` of the current mode the way the game's
+    new_question_* functions do, followed (if `resolve`) by the resolution
+    the game plays after an answer."""
+    from musictools import easy_play, play_wait, play_notes, \
+        resolve_with_chords
+    from game_modes import resolve_chord_tone
+    mode = state.CURRENT_MODE.name
+    easy_play(q['play'], bpm=state.BPM)
+    if mode == 'chord_tone':
+        play_wait(bpm=state.BPM)
+        play_notes(q['tone'], state.BPM)
+    if resolve and mode in ('single_chord', 'chord_tone'):
+        play_wait(bpm=state.BPM)
+        if mode == 'single_chord':
+            resolve_with_chords(q['numeral'], key=state.KEY, 
+                                Ioctave=q['Ioctave'], 
+                                numerals=state.NUMERALS, bpm=state.BPM*2)
+        else:
+            resolve_chord_tone(state, q['chord'], q['tone'], q['Ioctave'])
+        play_wait(bpm=state.BPM)
+
+
+def questions(state, mode, number):
+    """Yields `number` new questions of `mode` in the state's key, each
+    made the current question as it's yielded."""
+    import game_modes as gm
+    prepare = {'single_chord': gm.prepare_single_chord,
+               'chord_tone': gm.prepare_chord_tone,
+               'interval': gm.prepare_interval,
+               'progression': gm.prepare_progression}[mode]
+    state.CURRENT_MODE = gm.game_modes[mode]
+    for _ in range(number):
+        state.CURRENT_Q_INFO = prepare(state)
+        yield state.CURRENT_Q_INFO
+
+
+def drills(state, modes, number, out):
+    """Yields (row, (filename, events)) for the cadence of each key (with
+    no row) and for `number` questions of each of `modes` in each key,
+    where row is the question's line in the answer key."""
+    from musictools import KEYS, chord_table, play_progression
+    from game_modes import question_name, correct_answer
+    clips = audio.ClipBackend()
+    audio.use(clips)
+    try:
+        for key in KEYS + [k.lower() for k in KEYS]:
+            state.KEY = key
+            chord_table(key)
+            folder = os.path.join(out, key_dirname(key))
+            play_progression(state.CADENCE, key, Iup=state.I, 
+                             bpm=state.BPM)
+            yield None, (os.path.join(folder, "cadence.wav"),
+                         clip_events(clips.take()[1]))
+            for mode in modes:
+                for i, q in enumerate(questions(state, mode, number), 1):
+                    play_question(state, q)
+                    filename = os.path.join(folder, mode,
+                                            "{:03d}.wav".format(i))
+                    row = (key, mode, i, os.path.relpath(filename, out),
+                           question_name(state, q), correct_answer(state, q))
+                    yield row, (filename, clip_events(clips.take()[1]))
+    finally:
+        audio.use(audio.NullBackend())
+
+
+def passages(state, modes, number, cadence=False, resolve=False):
+    """Yields (text, events) for `number` questions of each of `modes` in
+    the state's key (see `midifile.write_passages`), after the cadence if
+    `cadence`, and each followed by its resolution if `resolve`."""
+    from musictools import play_progression
+    from game_modes import question_name, correct_answer
+    clips = audio.ClipBackend()
+    audio.use(clips)
+    try:
+        if cadence:
+            play_progression(state.CADENCE, state.KEY, Iup=state.I, 
+                             bpm=state.BPM)
+            yield "cadence", clip_events(clips.take()[1])
+        for mode in modes:
+            for i, q in enumerate(questions(state, mode, number), 1):
+                play_question(state, q, resolve)
+                yield ("{} {}: {} ({})".format(mode, i, 
+                                               question_name(state, q),
+                                               correct_answer(state, q)),
+                       clip_events(clips.take()[1]))
+    finally:
+        audio.use(audio.NullBackend())
+
+
+def export_midi(state, filename, number=10, modes=MODES, cadence=False,
+                resolve=False):
+    """Writes `number` questions of each of `modes` in the state's key to
+    the MIDI file `filename`, at `state.BPM`, a question at a time.  
+    Returns the number of passages written."""
+    from musictools import chord_table
+    chord_table(state.KEY)
+    return midifile.write_passages(
+        filename, passages(state, modes, number, cadence, resolve), 
+        state.BPM)
+
+
+def _init_worker(sf2, bank):
+    render.init(sf2, bank=bank, play=False)
+
+
+def _render(job):
+    """Renders and writes one file in a worker, returning its length (in
+    seconds)."""
+    filename, events = job
+    buf = render.renderer.render_events(events)
+    render.write_wav(filename, buf, render.renderer.sample_rate)
+    return len(buf) / render.renderer.sample_rate
+
+
+def export(state, out, number=10, modes=MODES, jobs=None, sf2=None, 
+           bank=None):
+    """Writes a drill pack of `number` questions of each of `modes` per key
+    to the folder `out` (see above), made with the game `state` (see
+    `game_modes.new_state`) and rendered with
+    `jobs` processes (defaults to one per core).  Returns the number of
+    files written and the seconds of audio in them."""
+    jobs = jobs or multiprocessing.cpu_count()
+    rows = []
+
+    def tasks():
+        for row, (filename, events) in drills(state, modes, number, out):
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            if row is not None:
+                rows.append(row)
+            yield filename, events
+
+    # the questions are all made here, on this thread, before the pool
+    # (whose task thread would otherwise run `tasks`) renders them
+    tasks = list(tasks())
+    if jobs == 1:
+        _init_worker(sf2, bank)
+        lengths = list(map(_render, tasks))
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (sf2, bank))
+        try:
+            lengths = list(pool.imap_unordered(_render, tasks,
+                                               chunksize=8))
+        finally:
+            pool.close()
+            pool.join()
+
+    with open(os.path.join(out, "answers.csv"), "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(("key", "mode", "number", "file", "question",
+                         "answer"))
+        writer.writerows(rows)
+    return len(lengths), sum(lengths)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="earthosechords.py export",
+        description="Writes questions to WAV files, with answer keys.  "
+                    "Other arguments are game settings, as for "
+                    "earthosechords.py.")
+    parser.add_argument('-n', '--questions', type=int, default=10,
+                        help="Questions per mode and key (defaults to 10).")
+    parser.add_argument('--midi', default=None,
+                        help="Write the questions in the current key to "
+                             "this MIDI file, instead of a drill pack.")
+    parser.add_argument('--cadence', action='store_true', default=False,
+                        help="Start the MIDI file with the cadence.")
+    parser.add_argument('--resolve', action='store_true', default=False,
+                        help="Follow each chord in the MIDI file with its "
+                             "resolution.")
+    parser.add_argument('--mode', action='append', choices=MODES,
+                        help="A game mode to export (can be repeated, "
+                             "defaults to all).")
+    parser.add_argument('--out', default="drills",
+                        help="The folder to write to (defaults to drills).")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Processes to render with (defaults to one "
+                             "per core).")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for the random questions, to export the "
+                             "same pack again.")
+    user_args, game_args = parser.parse_known_args(args)
+    config = st.init(game_args)
+    from game_modes import new_state
+    state = new_state(config, seed=user_args.seed)
+
+    if user_args.midi:
+        start = time.time()
+        count = export_midi(state, user_args.midi, user_args.questions,
+                            user_args.mode or MODES, user_args.cadence,
+                            user_args.resolve)
+        print("Wrote {} passages to {} in {:.1f} s".format(
+            count, user_args.midi, time.time() - start))
+        return
+
+    if config.AUDIO_BACKEND == "synth":
+        sf2, bank = None, None
+    else:
+        sf2, bank = config.SOUNDFONT, config.SAMPLE_BANK
+
+    start = time.time()
+    files, seconds = export(state, user_args.out, user_args.questions,
+                            user_args.mode or MODES, user_args.jobs,
+                            sf2, bank)
+    elapsed = time.time() - start
+    print("Wrote {} files ({:.0f} s of audio) to {} in {:.1f} s "
+          "({:.1f} files/s)".format(files, seconds, user_args.out, elapsed,
+                                    files / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,112 +3,293 @@ from __future__ import division, absolute_import, print_function
 try: input = raw_input
 except: pass
 
-from getch import getch
+from getch import getch, readline
 import game_structure as gs
 from musictools import (play_progression, random_progression, 
-    random_key, isvalidnote, resolve_with_chords, chordname, 
-    random_chord, easy_play, play_wait)
-import settings as st
+    random_key, resolve_with_chords, chordname, 
+    random_chord, easy_play, play_wait, chord_table, Diatonic, play_notes,
+    stop_audio, progression_chords, prerender, IntervalTable)
+import audio
+import progressions
+import timing
+import tokens
 
 # External Dependencies
-import time, random, sys
-from copy import copy
-from collections import OrderedDict
-from multiprocessing import Process
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
-from mingus.core import progressions, intervals, chords as ch
+import time, sys
+from collections import OrderedDict, namedtuple
 import mingus.core.notes as notes
 from mingus.containers import NoteContainer, Note, Bar
 
 
+def new_state(config, mode=None, seed=None):
+    """Returns a `gs.GameState` for a new game with the settings in
+    `config` (a `settings.Config`), starting in game mode `mode` (defaults
+    to `config.INITIAL_MODE`).  `seed` seeds its random questions."""
+    state = gs.GameState(config, seed)
+    state.CURRENT_MODE = game_modes[mode or config.INITIAL_MODE]
+    return state
+
+
+def play(state):
+    """Asks question after question, until the user quits."""
+    while 1:
+        state.CURRENT_MODE.new_question(state)
+
+
+# What the game asks: the question functions, and the menu commands that
+# ask for something, are generators yielding Prompts and sent the answer to
+# each, so a game can be stepped from one answer to the next without a
+# thread waiting on the answers (see `server`).  `answering` plays one
+# through with `ask`.
+Prompt = namedtuple("Prompt", ["message", "single_key", "commands"])
+Prompt.__new__.__defaults__ = (False, ())
+
+
+def answering(question_fcn):
+    """Returns a function calling `question_fcn` (a generator function of
+    Prompts) and answering each prompt with `ask`."""
+    def func_wrapper(state, *args, **kwargs):
+        steps = question_fcn(state, *args, **kwargs)
+        try:
+            prompt = next(steps)
+            while True:
+                prompt = steps.send(ask(state, *prompt))
+        except StopIteration:
+            pass
+    return func_wrapper
+
+
+def game(state):
+    """The whole game, from the current mode's intro on, as a generator of
+    Prompts."""
+    state.CURRENT_MODE.intro(state)
+    while 1:
+        yield from state.CURRENT_MODE.question(state)
+
+
+def run_command(state, command):
+    """Runs menu command `command`, yielding any Prompts it asks."""
+    steps = menu_commands[command].action(state)
+    if steps is not None:
+        yield from steps
+
+
+def question_space(state):
+    """The settings that prepared questions depend on."""
+    return (state.CURRENT_MODE.name, state.KEY, tuple(state.NUMERALS), 
+            state.MANY_OCTAVES, state.INTERVAL_MODE, state.FIXED_ROOT, 
+            state.HARMONIC_INTERVALS)
+
+
+def next_question(state, prepare):
+    """Returns a question prepared by `prepare`, usually ahead of time, but
+    never if `state.scheduler` picks it: the scheduler has to know about
+    every answer before it picks the next question."""
+    if scheduled(state):
+        return prepare(state)
+    return state.prefetcher.get(prepare, question_space(state), state)
+
+
+def ask(state, message, single_key=False, commands=()):
+    """Returns the user's response to `message`, read with `getch` if
+    `single_key`, otherwise with `readline` (which returns any of 
+    `commands` as soon as it's typed).  If `state.ANSWER_SOURCE` is set, 
+    it's called with the state, message and single_key flag instead (e.g. 
+    to simulate users)."""
+    start = time.time()
+    if state.ANSWER_SOURCE is not None:
+        response = state.ANSWER_SOURCE(state, message, single_key)
+    elif single_key:
+        response = getch(message)
+    else:
+        response = readline(message, commands)
+    state.response_time = time.time() - start
+    timing.answered(state.response_time)
+    return response
+
+
+def question_items(state):
+    """Returns every question the current mode and settings can ask, as
+    `state.scheduler` items."""
+    mode = state.CURRENT_MODE.name
+    octaves = state.OCTAVES if state.MANY_OCTAVES else [None]
+    if mode == 'single_chord':
+        return [(numeral, octave) for numeral in state.NUMERALS 
+                for octave in octaves]
+    elif mode == 'chord_tone':
+        return [(numeral, octave, tone) for numeral in state.NUMERALS 
+                for octave in octaves for tone in range(len(state.TONES))]
+    elif mode == 'interval':
+        numbers = {'triads': [3, 5, 8], 
+                   'sevenths': [3, 5, 7, 8]}.get(state.INTERVAL_MODE, 
+                                                 state.INTERVALS)
+        directions = {'descending': [False], 
+                      'mixed': [True, False]}.get(state.INTERVAL_MODE, [True])
+        roots = [state.FIXED_ROOT] if state.FIXED_ROOT else range(1, 8)
+        return [(number, root, ascending, octave) for number in numbers 
+                for root in roots for ascending in directions 
+                for octave in octaves]
+    return []
+
+
+def scheduled(state):
+    """Returns whether `state.scheduler` picks the questions of the current
+    mode."""
+    return (state.scheduler is not None and 
+            state.CURRENT_MODE.name != 'progression')
+
+
+def next_item(state):
+    """Returns the `state.scheduler`'s pick of what to ask next, or None to
+    pick at random."""
+    if not scheduled(state):
+        return None
+    return state.scheduler.next(state.CURRENT_MODE.name, 
+                                question_space(state), 
+                                lambda: question_items(state))
+
+
+def question_name(state, q=None):
+    """Returns what question `q` (defaults to the current question) asks
+    about, as saved in the history: its numeral(s), the numeral and tone, 
+    or the scale degrees of the interval."""
+    mode = state.CURRENT_MODE.name
+    q = q or state.CURRENT_Q_INFO
+    if mode == 'progression':
+        return " ".join(q['prog_strums'])
+    elif mode == 'interval':
+        return q['question'].answer
+    elif mode == 'chord_tone':
+        return "{} {}".format(q['numeral'], 
+            state.TONES[[n for n in q['chord']].index(q['tone'])])
+    return q['numeral']
+
+
+def correct_answer(state, q=None):
+    """Returns the right answer to question `q` (defaults to the current 
+    question), as it would be typed."""
+    mode = state.CURRENT_MODE.name
+    q = q or state.CURRENT_Q_INFO
+    if mode == 'single_chord':
+        return str(state.NUMERALS.index(q['numeral']) + 1)
+    elif mode == 'progression':
+        return " ".join(str(state.NUMERALS.index(x) + 1) for x in q['prog'])
+    elif mode == 'chord_tone':
+        return str(state.TONES[[n for n in q['chord']].index(q['tone'])])
+    elif mode == 'interval':
+        if state.NAME_INTERVAL:
+            return q['question'].name
+        return q['question'].answer
+    raise ValueError("Unknown game mode {}".format(mode))
+
+
+def record_answer(state, answer, correct):
+    """Saves the answer to the current question in `state.answer_log` and 
+    reschedules the question in `state.scheduler`."""
+    q = state.CURRENT_Q_INFO
+    if state.scheduler is not None and q.get('item') is not None:
+        state.scheduler.update(state.CURRENT_MODE.name, q['item'], correct)
+    if state.answer_log is None:
+        return
+    state.answer_log.record(state.CURRENT_MODE.name, state.KEY, 
+                            question_name(state), q.get('Ioctave'), answer, 
+                            correct, state.response_time)
+
+
 # Decorators
 def repeat_question(func):
-   def func_wrapper(*args, **kwargs):
-       st.NEWQUESTION = False
-       return func(*args, **kwargs)
+   def func_wrapper(state, *args, **kwargs):
+       state.NEWQUESTION = False
+       return func(state, *args, **kwargs)
    return func_wrapper
 
 
 def new_question(func):
-   def func_wrapper(*args, **kwargs):
-       st.NEWQUESTION = True
-       return func(*args, **kwargs)
+   def func_wrapper(state, *args, **kwargs):
+       state.NEWQUESTION = True
+       return func(state, *args, **kwargs)
    return func_wrapper
 
 
 # Menu Command Actions
 @repeat_question
-def play_cadence():
-    play_progression(st.CADENCE, st.KEY, Iup=st.I, bpm=st.BPM)
-    play_wait()
-    # time.sleep(2 * st.DELAY)
+def play_cadence(state):
+    play_progression(state.CADENCE, state.KEY, Iup=state.I, bpm=state.BPM)
+    play_wait(bpm=state.BPM)
+    # time.sleep(2 * state.DELAY)
 
 
 # @repeat_question
-# def set_delay():
-#     st.DELAY = float(input("Enter the desired delay time (in seconds): "))
+# def set_delay(state):
+#     state.DELAY = float(input("Enter the desired delay time (in seconds): "))
 
 
 @repeat_question
-def set_bpm():
-    st.BPM = float(input("Enter the desired BPM: "))
+def set_bpm(state):
+    state.BPM = float((yield Prompt("Enter the desired BPM: ")))
 
 
 @new_question
-def toggle_triads7ths():
-    if st.I == "I7":
-        st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII = \
-            "I", "II", "III", "IV", "V", "VI", "VII"
+def toggle_triads7ths(state):
+    if state.I == "I7":
+        state.I, state.II, state.III, state.IV, state.V, state.VI, \
+            state.VII = "I", "II", "III", "IV", "V", "VI", "VII"
     else:
-        st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII = \
-            "I7", "II7", "III7", "IV7", "V7", "VI7", "VII7"
-    st.NUMERALS = st.I, st.II, st.III, st.IV, st.V, st.VI, st.VII
+        state.I, state.II, state.III, state.IV, state.V, state.VI, \
+            state.VII = "I7", "II7", "III7", "IV7", "V7", "VI7", "VII7"
+    state.NUMERALS = state.I, state.II, state.III, state.IV, state.V, \
+        state.VI, state.VII
+    state.prefetcher.invalidate()
 
 
 @new_question
-def set_key(reset_score=True):
+def set_key(state, reset_score=True):
     mes = ("Enter the desired key, use upper-case for major "
            "and lower-case for minor (e.g. C or c).\n"
             "Enter R/r for a random major/minor key.")
-    newkey = input(mes)
+    newkey = yield Prompt(mes)
     keys = ['A', 'Bb', 'B', 'C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab']
     if newkey == 'R':
-        st.KEY = random.choice(keys)
+        state.KEY = state.rng.choice(keys)
     elif newkey == 'r':
-        st.KEY = random.choice(keys).lower()
+        state.KEY = state.rng.choice(keys).lower()
     elif notes.is_valid_note(newkey):
-        st.KEY = newkey
+        state.KEY = newkey
     else:
         print("Input key not understood, key unchanged.")
-    st.CURRENT_MODE.intro()
+    chord_table(state.KEY)  # build the new key's chords before they're needed
+    state.prefetcher.invalidate()
+    state.CURRENT_MODE.intro(state)
     if reset_score:
-        st.COUNT = 0
-        st.SCORE = 0
+        state.COUNT = 0
+        state.SCORE = 0
 
 
 @repeat_question
-def toggle_many_octaves():
-    st.MANY_OCTAVES = not st.MANY_OCTAVES
-    print("MANY_OCTAVE : {}".format(st.MANY_OCTAVES))
+def toggle_many_octaves(state):
+    state.MANY_OCTAVES = not state.MANY_OCTAVES
+    state.prefetcher.invalidate()
+    print("MANY_OCTAVE : {}".format(state.MANY_OCTAVES))
 
 
 @repeat_question
-def arpeggiate(invert=False, descending=False, chord=None, bpm=None, 
+def arpeggiate(state, invert=False, descending=False, chord=None, bpm=None, 
         durations=None):
     if not bpm:
-        bpm = st.BPM
+        bpm = state.BPM
 
     # if not delay:
-    #     delay = st.DELAY/2
+    #     delay = state.DELAY/2
 
     if chord:
         pass
-    elif st.CURRENT_MODE.name in ['single_chord', 'chord_tone']:
-        chord = st.CURRENT_Q_INFO["chord"]
-    elif st.CURRENT_MODE.name in ['interval']:
-        chord = st.CURRENT_Q_INFO["interval"]
+    elif state.CURRENT_MODE.name in ['single_chord', 'chord_tone']:
+        chord = state.CURRENT_Q_INFO["chord"]
+    elif state.CURRENT_MODE.name in ['interval']:
+        chord = state.CURRENT_Q_INFO["interval"]
     else:
-        print("Arpeggiation not available in {} mode.".format(st.CURRENT_MODE))
+        print("Arpeggiation not available in {} mode."
+              "".format(state.CURRENT_MODE))
         return
 
     arpeggiation = [x for x in chord]
@@ -118,8 +299,8 @@ def arpeggiate(invert=False, descending=False, chord=None, bpm=None,
         arpeggiation.reverse()
 
     # Play
-    easy_play(arpeggiation, durations, bpm)
-    play_wait()  # play wait
+    easy_play(arpeggiation, durations, bpm=bpm)
+    play_wait(bpm=state.BPM)  # play wait
     # bar = Bar()
     # if not durations:
     #     durations = [4]*len(arpeggiation)
@@ -131,7 +312,7 @@ def arpeggiate(invert=False, descending=False, chord=None, bpm=None,
     #     fluidsynth.play_Note(x)
     #     time.sleep(delay)
 
-def change_mode_settings(mode):
+def change_mode_settings(state, mode):
 
     if mode == "interval":
         interval_modes = \
@@ -139,32 +320,55 @@ def change_mode_settings(mode):
         mes = "Enter:\n"
         mes += "\n".join(["{} for {}".format(k, m) 
                 for k, m in enumerate(interval_modes)])
-        user_response = getch(mes)
-        st.INTERVAL_MODE = interval_modes[user_response]
+        user_response = yield Prompt(mes, single_key=True)
+        state.INTERVAL_MODE = interval_modes[int(user_response)]
+        state.prefetcher.invalidate()
     else:
         pass
 
 
 def change_game_mode(new_mode):
     @new_question
-    def _change_mode():
-        st.COUNT = 0
-        st.SCORE = 0
-        if new_mode == st.CURRENT_MODE.name:
-            change_mode_settings(new_mode)
-        st.CURRENT_MODE = game_modes[new_mode]
+    def _change_mode(state):
+        state.COUNT = 0
+        state.SCORE = 0
+        if new_mode == state.CURRENT_MODE.name:
+            yield from change_mode_settings(state, new_mode)
+        state.CURRENT_MODE = game_modes[new_mode]
+        state.prefetcher.invalidate()
     return _change_mode
 
 @repeat_question
-def play_question_again():
+def play_question_again(state):
     return
 
 @repeat_question
-def toggle_alt_chord_tone_res():
-    st.ALTERNATIVE_CHORD_TONE_RESOLUTION = \
-        (st.ALTERNATIVE_CHORD_TONE_RESOLUTION + 1) % 3
+def toggle_alt_chord_tone_res(state):
+    state.ALTERNATIVE_CHORD_TONE_RESOLUTION = \
+        (state.ALTERNATIVE_CHORD_TONE_RESOLUTION + 1) % 3
     print("Switching to chord tone resolution "
-          "option {}".format(st.ALTERNATIVE_CHORD_TONE_RESOLUTION))
+          "option {}".format(state.ALTERNATIVE_CHORD_TONE_RESOLUTION))
+
+
+@repeat_question
+def show_timing(state):
+    if timing.enabled:
+        print("Time spent in each phase of a question:")
+        print(timing.report())
+    else:
+        print("Timing is off (turn it on with the --timing flag).")
+
+
+def quit_game(state):
+    if state.answer_log is not None:
+        state.answer_log.close()
+    audio.close()
+    report = audio.current().report()
+    if report:
+        print(report)
+    if timing.enabled:
+        print(timing.report())
+    sys.exit()
 
     
 
@@ -193,8 +397,10 @@ menu_commands = [
                         change_game_mode('single_chord')),
     gs.MenuCommand("i", "toggle between chord tone resolutions", 
                         toggle_alt_chord_tone_res),
+    gs.MenuCommand("l", "see where the time goes (with --timing)", 
+                        show_timing),
     gs.MenuCommand("x", "quit", 
-                        sys.exit),
+                        quit_game),
     gs.MenuCommand("", "hear the chord or progression again", 
                         play_question_again,
                  input_description="Press Enter"),
@@ -203,7 +409,7 @@ menu_commands = OrderedDict([(mc.command, mc) for mc in menu_commands])
 
 
 # Game Mode Intro Functions
-def intro(play_cadence=True):
+def intro(state, play_cadence=True):
     print("\n" + "~" * 20 + "\n")
 
     # List menu_commands
@@ -213,18 +419,19 @@ def intro(play_cadence=True):
     print("\n" + "-" * 10 + "\n")
 
     # Display key
-    if st.KEY == st.KEY.lower():
-        print("KEY:", st.KEY.upper(), "min")
+    if state.KEY == state.KEY.lower():
+        print("KEY:", state.KEY.upper(), "min")
     else:
-        print("KEY:", st.KEY, "Maj")
+        print("KEY:", state.KEY, "Maj")
     print("-" * 10)
 
     # Play cadence
     if play_cadence:
-        play_progression(st.CADENCE, st.KEY, Iup=st.I)
-        play_wait()
-        # time.sleep(st.DELAY)
-    # time.sleep(st.DELAY)
+        play_progression(state.CADENCE, state.KEY, Iup=state.I, 
+                         bpm=state.BPM)
+        play_wait(bpm=state.BPM)
+        # time.sleep(state.DELAY)
+    # time.sleep(state.DELAY)
     return
 
 
@@ -233,159 +440,158 @@ def intro(play_cadence=True):
 ###############################################################################
 
 @new_question
-def eval_interval_name(user_answer, interval, diatonic):
-    semitone_distance = int(interval[1]) - int(interval[0])
-    names = ['8', '2b', '2', '3b', '3', '4', '5b', '5', '6b', '6', '7b', '7']
-    correct_answer = names[semitone_distance % 12]
+def eval_interval_name(state, user_answer, question):
+    correct_answer = question.name
 
     user_answer = user_answer.strip()
+    correct = tokens.parse(user_answer).interval == correct_answer
     print("Your answer:   ", user_answer)
     print("Correct Answer:", correct_answer)
-    note_nums = [diatonic.note2num(x) for x in interval]
-    print("Interval Notes:", " ".join([str(x) for x in note_nums]))
-    if user_answer == correct_answer:
-        st.SCORE += 1
+    print("Interval Notes:", question.answer)
+    record_answer(state, user_answer, correct)
+    if correct:
+        state.SCORE += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
-    play_wait()
+    play_wait(bpm=state.BPM)
 
 
 @new_question
-def eval_interval(ans, interval, diatonic):
-    try:
-        int(ans)
-        answers = [x for x in ans]
-    except:
-        answers = ans.split(" ")
+def eval_interval(state, ans, question):
+    diatonic = question.diatonic
+    answers = tokens.split(ans)
 
     def parse_answer(ans):
-        try:
-            return int(ans) % 8
-        except:
-            try:
-                note_name = ans[0].upper() + ans[1:]  # capitalize for mingus
-                return diatonic.note2num(Note(ans))
-            except:
-                return "Err" 
+        token = tokens.parse(ans)
+        if token.degree is not None:
+            return token.degree
+        if token.pitch is not None:
+            return diatonic.pc2num(token.pitch) or "Err"
+        return "Err"
 
     user_answers = [parse_answer(ans) for ans in answers]
-    correct_answers = [diatonic.note2num(x) for x in interval]
+    correct_answers = question.degrees
 
-    if len(answers) < len(interval):
+    if len(answers) < len(correct_answers):
         print("too few answers")
-    if len(answers) > len(interval):
+    if len(answers) > len(correct_answers):
         print("too many answers")
 
     print("Your answer:   ", " ".join([str(x) for x in user_answers]))
-    print("Correct Answer:", " ".join([str(x) for x in correct_answers]))
-
-    ###debug (safe to delete)
-    try: 
-        semitone_distance = int(interval[1]) - int(interval[0])
-    except:
-        print()
-        print(interval)
-        print()
-        raise
-    ###end of debug (safe to delete)
-
-
-    semitone_distance = int(interval[1]) - int(interval[0])
-    names = ['8', '2b', '2','3b', '3', '4', '5b', '5', '6b', '6', '7b', '7']
-    print("Interval:", names[semitone_distance % 12])
-
-    if all([x == y for x, y in zip(user_answers, correct_answers)]):
-        st.SCORE += 1
+    print("Correct Answer:", question.answer)
+    print("Interval:", question.name)
+
+    correct = len(user_answers) >= len(correct_answers) and \
+        all([x == y for x, y in zip(user_answers, correct_answers)])
+    record_answer(state, ans, correct)
+    if correct:
+        state.SCORE += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
-    play_wait()
+    play_wait(bpm=state.BPM)
 
 
-def new_question_interval():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}"
-                  "".format(st.SCORE, st.COUNT, st.SCORE/st.COUNT))
-        st.COUNT += 1
+DEGREES = range(1, 8)
 
-        # Pick Ioctave
-        if st.MANY_OCTAVES:
-            Ioctave = random.choice(st.OCTAVES)
-        else:
-            Ioctave = st.DEFAULT_IOCTAVE
-
-        from musictools import Diatonic
-        diatonic = Diatonic(key=st.KEY, Ioctave=Ioctave)
-        
-        # pick first note
-        if st.FIXED_ROOT:
-            first_note = diatonic.notes[st.FIXED_ROOT - 1]
-        else:
-            first_note = random.choice(diatonic.notes)
-
-        # pick second note
-        if st.INTERVAL_MODE == 'triads':
-            number = random.choice([3, 5, 8])
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'sevenths':
-            number = random.choice([3, 5, 7, 8])
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'ascending':
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=True)
-        elif st.INTERVAL_MODE == 'descending':  # redundant for harmonic intrvls
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=False)
-        elif st.INTERVAL_MODE == 'mixed':  # redundant for harmonic intervals
-            number = random.choice(st.INTERVALS)
-            interval = diatonic.interval(number, root=first_note, 
-                ascending=bool(random.choice([0, 1])))
+
+def random_interval(state):
+    """Returns a random `IntervalQuestion` for the settings of `state`."""
+    # Pick Ioctave
+    if state.MANY_OCTAVES:
+        Ioctave = state.rng.choice(state.OCTAVES)
+    else:
+        Ioctave = state.DEFAULT_IOCTAVE
+
+    table = IntervalTable.for_key(state.KEY, Ioctave)
+    
+    # pick first note
+    if state.FIXED_ROOT:
+        root = state.FIXED_ROOT
+    else:
+        root = state.rng.choice(DEGREES)
+
+    # pick second note
+    if state.INTERVAL_MODE == 'triads':
+        return table.question(state.rng.choice([3, 5, 8]), root)
+    elif state.INTERVAL_MODE == 'sevenths':
+        return table.question(state.rng.choice([3, 5, 7, 8]), root)
+    elif state.INTERVAL_MODE == 'ascending':
+        return table.question(state.rng.choice(state.INTERVALS), root)
+    elif state.INTERVAL_MODE == 'descending':  # redundant for harmonic intrvls
+        return table.question(state.rng.choice(state.INTERVALS), root, 
+                              ascending=False)
+    elif state.INTERVAL_MODE == 'mixed':  # redundant for harmonic intervals
+        number = state.rng.choice(state.INTERVALS)
+        return table.question(number, root, 
+                              ascending=bool(state.rng.choice([0, 1])))
+    raise Exception("Can't understand.  state.INTERVAL_MODE = {}"
+                    "".format(state.INTERVAL_MODE))
+
+
+def prepare_interval(state):
+    item = next_item(state)
+    with timing.span("chords"):
+        if item is not None:
+            number, root, ascending, Ioctave = item
+            if Ioctave is None:
+                Ioctave = state.DEFAULT_IOCTAVE
+            question = IntervalTable.for_key(state.KEY, Ioctave).question(
+                number, root, ascending)
         else:
-            raise Exception("Can't understand.  st.INTERVAL_MODE = {}"
-                            "".format(st.INTERVAL_MODE))
+            question = random_interval(state)
+
+    # notes to play
+    if state.HARMONIC_INTERVALS:
+        play = question.notes
+    else:
+        play = [x for x in question.notes]
+    prerender(play, bpm=state.BPM)
+
+    return {'interval': question.notes,
+            'Ioctave': question.Ioctave,
+            'diatonic': question.diatonic,
+            'question': question,
+            'play': play,
+            'item': item}
 
-        # change Unison intervals to P8 intervals
-        if len(interval) == 1:
-            P8 = copy(interval[0])
-            P8.octave += 1
-            interval = NoteContainer([interval[0], P8])
+
+def question_interval(state):
+    if state.NEWQUESTION:
+        if state.COUNT:
+            print("score: {} / {} = {:.2%}"
+                  "".format(state.SCORE, state.COUNT, state.SCORE/state.COUNT))
+        state.COUNT += 1
 
         # store question info
-        st.CURRENT_Q_INFO = {'interval': interval,
-                             'Ioctave': Ioctave,
-                             'diatonic': diatonic}
+        with timing.span("question"):
+            state.CURRENT_Q_INFO = next_question(state, prepare_interval)
 
-    else:
-        interval = st.CURRENT_Q_INFO['interval']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
-        diatonic = st.CURRENT_Q_INFO['diatonic']
+    question = state.CURRENT_Q_INFO['question']
 
     # Play interval
-    if st.HARMONIC_INTERVALS:
-        easy_play(interval)
-    else:
-        easy_play([x for x in interval])
+    with timing.span("audio submit"):
+        easy_play(state.CURRENT_Q_INFO['play'], bpm=state.BPM)
 
     # Request user's answer
-    ans = input("Enter 1-7 or note names separated by spaces: ").strip()
+    ans = (yield Prompt("Enter 1-7 or note names separated by spaces: ", 
+                        commands=menu_commands)).strip()
+    if state.STOP_AUDIO_ON_ANSWER:
+        stop_audio()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        yield from run_command(state, ans)
     else:
-        if st.NAME_INTERVAL:
-            eval_interval_name(ans, interval, diatonic)
-        else:
-            eval_interval(ans, interval, diatonic)
+        with timing.span("evaluate"):
+            if state.NAME_INTERVAL:
+                eval_interval_name(state, ans, question)
+            else:
+                eval_interval(state, ans, question)
     return
 
 
@@ -395,67 +601,84 @@ def new_question_interval():
 
 
 @new_question
-def eval_single_chord(usr_ans, correct_numeral, root_note):
-    correct_ = False
-    if usr_ans == str(st.NUMERALS.index(correct_numeral) + 1):
-        correct_ = True
-    else:
-        try:
-            usr_note_val = int(Note(usr_ans[0].upper() + usr_ans[1:])) % 12
-            correct_note_val = int(Note(root_note)) % 12
-            if usr_note_val == correct_note_val:
-                correct_ = True
-        except:
-            pass
-    return correct_
-
-
-def new_question_single_chord():
+def eval_single_chord(state, usr_ans, correct_numeral, root_note):
+    token = tokens.parse(usr_ans)
+    if token.degree is not None:
+        return token.degree == state.NUMERALS.index(correct_numeral) + 1
+    return token.pitch is not None and \
+        token.pitch == tokens.parse(root_note).pitch
+
+
+def prepare_single_chord(state):
+    # Pick chord/octave
+    item = next_item(state)
+    with timing.span("chords"):
+        numeral, chord, Ioctave = random_chord(state, *(item or ()))
+        play = progression_chords([numeral], state.KEY, Ioctave=Ioctave)
+    with timing.span("naming"):
+        name = chordname(chord, numeral)
+    prerender(play, bpm=state.BPM)
+
+    return {'numeral': numeral,
+            'chord': chord,
+            'Ioctave': Ioctave,
+            'name': name,
+            'play': play,
+            'item': item}
+
+
+def question_single_chord(state):
     # Choose new chord+octave/Progression
     # Single chord mode
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-
-        # Pick random chord/octave
-        numeral, chord, Ioctave = random_chord()
+    if state.NEWQUESTION:
+        if state.COUNT:
+            print("score: {} / {} = {:.2%}".format(state.SCORE, state.COUNT, 
+                    state.SCORE/state.COUNT))
+        state.COUNT += 1
 
         # store question info
-        st.CURRENT_Q_INFO = {'numeral': numeral,
-                             'chord': chord,
-                             'Ioctave': Ioctave}
-    else:
-        numeral = st.CURRENT_Q_INFO['numeral']
-        chord = st.CURRENT_Q_INFO['chord']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
+        with timing.span("question"):
+            state.CURRENT_Q_INFO = next_question(state, prepare_single_chord)
+
+    numeral = state.CURRENT_Q_INFO['numeral']
+    chord = state.CURRENT_Q_INFO['chord']
+    Ioctave = state.CURRENT_Q_INFO['Ioctave']
+    name = state.CURRENT_Q_INFO['name']
 
     # Play chord
-    play_progression([numeral], st.KEY, Ioctave=Ioctave)
+    with timing.span("audio submit"):
+        easy_play(state.CURRENT_Q_INFO['play'], bpm=state.BPM)
 
     # Request user's answer
-    ans = getch("Enter 1-7 or root of chord: ").strip()
+    ans = (yield Prompt("Enter 1-7 or root of chord: ", 
+                        single_key=True)).strip()
+    if state.STOP_AUDIO_ON_ANSWER:
+        stop_audio()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        yield from run_command(state, ans)
     else:
-        if isvalidnote(ans):
-            if eval_single_chord(ans, numeral, chord[0].name):
-                st.SCORE += 1
-                print("Yes!", chordname(chord, numeral))
-                if st.RESOLVE_WHEN_CORRECT:
-                    resolve_with_chords(numeral, key=st.KEY, Ioctave=Ioctave, 
-                        numerals=st.NUMERALS, bpm=st.BPM*2)
-                    play_wait()
+        with timing.span("evaluate"):
+            if tokens.is_note(ans):
+                correct = eval_single_chord(state, ans, numeral, chord[0].name)
+                record_answer(state, ans, correct)
+                if correct:
+                    state.SCORE += 1
+                    print("Yes!", name)
+                    if state.RESOLVE_WHEN_CORRECT:
+                        resolve_with_chords(numeral, key=state.KEY, 
+                            Ioctave=Ioctave, numerals=state.NUMERALS, 
+                            bpm=state.BPM*2)
+                        play_wait(bpm=state.BPM)
+                else:
+                    print("No!", name)
+                    if state.RESOLVE_WHEN_INCORRECT:
+                        resolve_with_chords(numeral, key=state.KEY, 
+                            Ioctave=Ioctave, numerals=state.NUMERALS, 
+                            bpm=state.BPM*2)
+                        play_wait(bpm=state.BPM)
             else:
-                print("No!", chordname(chord, numeral))
-                if st.RESOLVE_WHEN_INCORRECT:
-                    resolve_with_chords(numeral, key=st.KEY, Ioctave=Ioctave, 
-                        numerals=st.NUMERALS, bpm=st.BPM*2)
-                    play_wait()
-        else:
-            print("User input not understood.  Please try again.")
+                print("User input not understood.  Please try again.")
     return
 
 
@@ -465,86 +688,98 @@ def new_question_single_chord():
 
 
 @new_question
-def eval_progression(ans, prog, prog_strums):
-    try:
-        int(ans)
-        answers = [x for x in ans]
-    except:
-        answers = ans.split(" ")
+def eval_progression(state, ans, prog, prog_strums):
+    answers = tokens.split(ans)
+    names = chord_table(state.KEY).names
 
     answers_correct = []
-    for i, answer in enumerate(answers):
-        try:
-            correct_numeral = prog[i]
-            tmp = progressions.to_chords([correct_numeral], st.KEY)[0]
-            root = NoteContainer(tmp)[0].name
-            user_correct = eval_single_chord(answer, correct_numeral, root)
-            print(user_correct)
-            answers_correct.append(user_correct)
-        except IndexError:
-            print("too many answers")
+    for answer, correct_numeral in zip(answers, prog):
+        user_correct = eval_single_chord(state, answer, correct_numeral, 
+                                         names[correct_numeral][0])
+        print(user_correct)
+        answers_correct.append(user_correct)
+    for _ in answers[len(prog):]:
+        print("too many answers")
     if len(answers) < len(prog):
         print("too few answers")
+        answers_correct.append(False)
 
     print("Progression:", " ".join(prog_strums))
     print("Your answer:   ", " ".join(answers))
     print("Correct Answer:", " ".join(
-            [str(st.NUMERALS.index(x) + 1) for x in prog]))
+            [str(state.NUMERALS.index(x) + 1) for x in prog]))
 
+    record_answer(state, ans, all(answers_correct))
     if all(answers_correct):
-        st.SCORE += 1
+        state.SCORE += 1
         print("Good Job!")
         print()
     else:
         print("It's ok, you'll get 'em next time.")
         print()
-    # time.sleep(st.DELAY)
-    play_wait()
+    # time.sleep(state.DELAY)
+    play_wait(bpm=state.BPM)
+
 
+def prepare_progression(state):
+    # Find random chord progression
+    prog_length = state.rng.choice(state.PROG_LENGTHS)
+    with timing.span("chords"):
+        prog, prog_strums = random_progression(
+            prog_length, state.NUMERALS, state.CHORD_LENGTHS, state.rng,
+            model=progressions.model(state.PROGRESSIONS))
+        play = progression_chords(prog_strums, state.KEY)
+    prerender(play, bpm=state.BPM)
 
-def new_question_progression():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                                                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-        # Find random chord progression
-        prog_length = random.choice(st.PROG_LENGTHS)
-        prog, prog_strums = random_progression(prog_length, st.NUMERALS, 
-                                                st.CHORD_LENGTHS)
+    return {'prog': prog,
+            'prog_strums': prog_strums,
+            'play': play}
+
+
+def question_progression(state):
+    if state.NEWQUESTION:
+        if state.COUNT:
+            print("score: {} / {} = {:.2%}".format(state.SCORE, state.COUNT, 
+                                                    state.SCORE/state.COUNT))
+        state.COUNT += 1
 
         # store question info
-        st.CURRENT_Q_INFO = {'prog': prog,
-                             'prog_strums': prog_strums}
-    else:
-        prog = st.CURRENT_Q_INFO['prog']
-        prog_strums = st.CURRENT_Q_INFO['prog_strums']
+        with timing.span("question"):
+            state.CURRENT_Q_INFO = next_question(state, prepare_progression)
+
+    prog = state.CURRENT_Q_INFO['prog']
+    prog_strums = state.CURRENT_Q_INFO['prog_strums']
 
     # Play chord/progression
-    play_progression(prog_strums, st.KEY)
+    with timing.span("audio submit"):
+        easy_play(state.CURRENT_Q_INFO['play'], bpm=state.BPM)
 
     # Request user's answer
-    ans = input("Enter your answer using root note names "
-                "or numbers 1-7 seperated by spaces: ").strip()
+    ans = (yield Prompt("Enter your answer using root note names "
+                        "or numbers 1-7 seperated by spaces: ", 
+                        commands=menu_commands)).strip()
+    if state.STOP_AUDIO_ON_ANSWER:
+        stop_audio()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        yield from run_command(state, ans)
     else:
-        eval_progression(ans, prog, prog_strums)
+        with timing.span("evaluate"):
+            eval_progression(state, ans, prog, prog_strums)
 
     # # Request user's answer
     # ans = input("Enter your answer using root note names "
     #             "or numbers 1-7 seperated by spaces: ").strip()
     # if ans in menu_commands:
-    #     menu_commands[ans].action()
+    #     menu_commands[ans].action(state)
     # else:
-    #     eval_progression(ans, prog, prog_strums)
+    #     eval_progression(state, ans, prog, prog_strums)
 
 
 # @new_question
-# def eval_chord_tone(ans, chord, tone):
+# def eval_chord_tone(state, ans, chord, tone):
 #     tone_idx = [n for n in chord].index(tone)
-#     correct_ans = st.TONES[tone_idx]
+#     correct_ans = state.TONES[tone_idx]
 #     return ans == correct_ans
 
 
@@ -553,126 +788,139 @@ def new_question_progression():
 ###############################################################################
 
 
-def resolve_chord_tone(chord, tone, Ioctave):
-    # play_progression([numeral], st.KEY, Ioctave=Ioctave)
+def resolve_chord_tone(state, chord, tone, Ioctave):
+    # play_progression([numeral], state.KEY, Ioctave=Ioctave)
 
-    if st.ALTERNATIVE_CHORD_TONE_RESOLUTION == 1:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
-        fluidsynth.play_Note(tone)
-        play_wait()
+    if state.ALTERNATIVE_CHORD_TONE_RESOLUTION == 1:
+        play_notes(chord, state.BPM)
+        play_wait(bpm=state.BPM)
+        play_notes(tone, state.BPM)
+        play_wait(bpm=state.BPM)
         root = chord[0]
         interval = NoteContainer([root, tone])
-        fluidsynth.play_NoteContainer(interval)
-    elif st.ALTERNATIVE_CHORD_TONE_RESOLUTION == 2:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
+        play_notes(interval, state.BPM)
+    elif state.ALTERNATIVE_CHORD_TONE_RESOLUTION == 2:
+        play_notes(chord, state.BPM)
+        play_wait(bpm=state.BPM)
         tone_idx = [x for x in chord].index(tone)
         if tone_idx == 0:
-            arpeggiate()
+            arpeggiate(state)
         elif tone_idx == 1:
-            arpeggiate(invert=[1, 0, 2])
+            arpeggiate(state, invert=[1, 0, 2])
         elif tone_idx == 2:
-            arpeggiate(descending=True)
+            arpeggiate(state, descending=True)
         else:
             raise Exception("This chord tone resolutions mode is only "
                             "implemented for triads.")
 
         # fluidsynth.play_Note(Iup_note)
-        # Iup_note = Note(st.KEY)
+        # Iup_note = Note(state.KEY)
         # Iup_note.octave += 1
         # fluidsynth.play_Note(Iup_note)
     else:
-        fluidsynth.play_NoteContainer(chord)
-        play_wait()
-        fluidsynth.play_Note(tone)
-        play_wait()
-        arpeggiate()  # sets NEWQUESTION = False
-
-
-def new_question_chord_tone():
-    if st.NEWQUESTION:
-        if st.COUNT:
-            print("score: {} / {} = {:.2%}".format(st.SCORE, st.COUNT, 
-                                                    st.SCORE/st.COUNT))
-        st.COUNT += 1
-
-        # Pick random chord/octave
-        numeral, chord, Ioctave = random_chord()
-
-        # Pick a random tone in the chord
-        tone = random.choice(chord)
+        play_notes(chord, state.BPM)
+        play_wait(bpm=state.BPM)
+        play_notes(tone, state.BPM)
+        play_wait(bpm=state.BPM)
+        arpeggiate(state)  # sets NEWQUESTION = False
+
+
+def prepare_chord_tone(state):
+    # Pick chord/octave and a tone in the chord
+    item = next_item(state)
+    with timing.span("chords"):
+        if item is not None:
+            numeral, chord, Ioctave = random_chord(state, *item[:2])
+            tone = chord[item[2]]
+        else:
+            numeral, chord, Ioctave = random_chord(state)
+            tone = state.rng.choice(chord)
+        play = progression_chords([numeral], state.KEY, Ioctave=Ioctave)
+    with timing.span("naming"):
+        name = chordname(chord, numeral)
+    prerender(play, bpm=state.BPM)
+
+    return {'numeral': numeral,
+            'chord': chord,
+            'Ioctave': Ioctave,
+            'tone': tone,
+            'name': name,
+            'play': play,
+            'item': item}
+
+
+def question_chord_tone(state):
+    if state.NEWQUESTION:
+        if state.COUNT:
+            print("score: {} / {} = {:.2%}".format(state.SCORE, state.COUNT, 
+                                                    state.SCORE/state.COUNT))
+        state.COUNT += 1
 
         # store question info
-        st.CURRENT_Q_INFO = {'numeral': numeral,
-                             'chord': chord,
-                             'Ioctave': Ioctave,
-                             'tone': tone}
-    else:
-        numeral = st.CURRENT_Q_INFO['numeral']
-        chord = st.CURRENT_Q_INFO['chord']
-        Ioctave = st.CURRENT_Q_INFO['Ioctave']
-        tone = st.CURRENT_Q_INFO['tone']
+        with timing.span("question"):
+            state.CURRENT_Q_INFO = next_question(state, prepare_chord_tone)
+
+    numeral = state.CURRENT_Q_INFO['numeral']
+    chord = state.CURRENT_Q_INFO['chord']
+    Ioctave = state.CURRENT_Q_INFO['Ioctave']
+    tone = state.CURRENT_Q_INFO['tone']
+    name = state.CURRENT_Q_INFO['name']
 
     # Play chord, then tone
-    def playfcn():
-        play_progression([numeral], st.KEY, Ioctave=Ioctave)
-        play_wait()
-        fluidsynth.play_Note(tone)
-    p = Process(target=playfcn())
-    p.start()
+    with timing.span("audio submit"):
+        easy_play(state.CURRENT_Q_INFO['play'], bpm=state.BPM)
+        play_wait(bpm=state.BPM)
+        play_notes(tone, state.BPM)
 
     # Request user's answer
     mes = ("Which tone did you hear?\n""Enter {}, or {}: ".format(
-            ", ".join([str(t) for t in st.TONES[:-1]]),
-            st.TONES[-1]))
-    ans = getch(mes).strip()
-    p.terminate()
+            ", ".join([str(t) for t in state.TONES[:-1]]),
+            state.TONES[-1]))
+    ans = (yield Prompt(mes, single_key=True)).strip()
+    if state.STOP_AUDIO_ON_ANSWER:
+        stop_audio()
 
     if ans in menu_commands:
-        menu_commands[ans].action()
+        yield from run_command(state, ans)
     else:
-        try:
-            ans = int(ans)
-        except:
-            print("User input not understood.  Please try again.")
-            st.NEWQUESTION = False
-
-        if ans in st.TONES:
-            tone_idx = [n for n in chord].index(tone)
-            correct_ans = st.TONES[tone_idx]
-            if ans == correct_ans:
-                st.SCORE += 1
-                print("Yes! The {} tone of".format(correct_ans), 
-                                                    chordname(chord, numeral))
-                if st.ARPEGGIATE_WHEN_CORRECT:
-                    resolve_chord_tone(chord, tone, Ioctave)
-                    play_wait()
-                    st.NEWQUESTION = True
-            else:
-                print("No! The {} tone of".format(correct_ans), 
-                                                    chordname(chord, numeral))
-                if st.ARPEGGIATE_WHEN_INCORRECT:
-                    resolve_chord_tone(chord, tone, Ioctave)
-                    play_wait()
-                    st.NEWQUESTION = True
-
-        # secret option
-        elif ans in [8, 9, 0]:
-            tone_idx = [8, 9, 0].index(ans)
-            for num in st.NUMERALS:
-                tmp = progressions.to_chords([num], st.KEY)[0]
-                num_chord = NoteContainer(tmp)
-                play_progression([num], st.KEY, Ioctave=Ioctave)
-                play_wait()
-                fluidsynth.play_Note(num_chord[tone_idx])
-                play_wait()
-            play_wait()
-            st.NEWQUESTION = False
+        with timing.span("evaluate"):
+            ans = tokens.parse(ans).number
+
+            if ans in state.TONES:
+                tone_idx = [n for n in chord].index(tone)
+                correct_ans = state.TONES[tone_idx]
+                record_answer(state, str(ans), ans == correct_ans)
+                if ans == correct_ans:
+                    state.SCORE += 1
+                    print("Yes! The {} tone of".format(correct_ans), name)
+                    if state.ARPEGGIATE_WHEN_CORRECT:
+                        resolve_chord_tone(state, chord, tone, Ioctave)
+                        play_wait(bpm=state.BPM)
+                        state.NEWQUESTION = True
+                else:
+                    print("No! The {} tone of".format(correct_ans), name)
+                    if state.ARPEGGIATE_WHEN_INCORRECT:
+                        resolve_chord_tone(state, chord, tone, Ioctave)
+                        play_wait(bpm=state.BPM)
+                        state.NEWQUESTION = True
+
+            # secret option
+            elif ans in [8, 9, 0]:
+                tone_idx = [8, 9, 0].index(ans)
+                table = chord_table(state.KEY)
+                for num in state.NUMERALS:
+                    num_chord = table.container(num)
+                    play_progression([num], state.KEY, Ioctave=Ioctave, 
+                                     bpm=state.BPM)
+                    play_wait(bpm=state.BPM)
+                    play_notes(num_chord[tone_idx], state.BPM)
+                    play_wait(bpm=state.BPM)
+                play_wait(bpm=state.BPM)
+                state.NEWQUESTION = False
 
-        else:
-            print("User input not understood.  Please try again.")
-            st.NEWQUESTION = False
+            else:
+                print("User input not understood.  Please try again.")
+                state.NEWQUESTION = False
     return
 
 
@@ -680,24 +928,34 @@ def new_question_chord_tone():
 ### game moodes ###############################################################
 ###############################################################################
 
+new_question_single_chord = answering(question_single_chord)
+new_question_progression = answering(question_progression)
+new_question_chord_tone = answering(question_chord_tone)
+new_question_interval = answering(question_interval)
+
+
 game_modes = {
     'single_chord': gs.GameMode('single_chord', 
                                 intro, 
-                                new_question_single_chord
+                                new_question_single_chord, 
+                                question_fcn=question_single_chord
                                 ),
 
     'progression': gs.GameMode('progression', 
                                intro, 
-                               new_question_progression
+                               new_question_progression, 
+                               question_fcn=question_progression
                               ),
 
     'chord_tone': gs.GameMode('chord_tone', 
-                              lambda: intro(play_cadence=False), 
-                              new_question_chord_tone
+                              lambda state: intro(state, play_cadence=False), 
+                              new_question_chord_tone, 
+                              question_fcn=question_chord_tone
                              ),
 
     'interval': gs.GameMode('interval', 
                             intro, 
-                            new_question_interval
+                            new_question_interval, 
+                            question_fcn=question_interval
                            ),
-    }
\ No newline at end of file
+    }
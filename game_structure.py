@@ -15,7 +15,7 @@ class MenuCommand:
             self.input_description = input_description
 
     def action(self, *args, **kwargs):
-        self.action_fcn(*args, **kwargs)
+        return self.action_fcn(*args, **kwargs)
 
 
 class SettingsContainer(object):
@@ -27,11 +27,46 @@ class SettingsContainer(object):
             setattr(self, key, kwargs[key])
 
 
+class GameState(SettingsContainer):
+    """One session's game: its own copy of the settings in `config` (an
+    immutable `settings.Config`), which the menu commands change, and its
+    progress.  Every game function takes the state of the game it's
+    playing, so sessions can be played side by side (in threads, say)
+    without getting in each other's way.
+
+    Settings keep their names from `settings` (e.g. `state.KEY`); so does
+    the progress (`CURRENT_MODE`, `CURRENT_Q_INFO`, `NEWQUESTION`, `SCORE`,
+    `COUNT`) and `ANSWER_SOURCE`, which, if set, is called with the state,
+    message and single_key flag to answer instead of the keyboard.  The
+    rest is the session's own helpers: its random number generator, its
+    `prefetch.Prefetcher` and (optionally) its `scheduler.Scheduler` and
+    `history.AnswerLog`."""
+
+    def __init__(self, config, seed=None, **kwargs):
+        import random
+        from prefetch import Prefetcher
+        SettingsContainer.__init__(self, config._asdict())
+        self.config = config
+        self.CURRENT_MODE = None
+        self.CURRENT_Q_INFO = None
+        self.NEWQUESTION = True
+        self.SCORE = 0
+        self.COUNT = 0
+        self.ANSWER_SOURCE = None
+        self.rng = random.Random(seed)
+        self.prefetcher = Prefetcher(config.PREFETCH_DEPTH)
+        self.scheduler = None
+        self.answer_log = None
+        self.response_time = None  # seconds taken by the last answer
+        SettingsContainer.__init__(self, kwargs)
+
+
 class GameMode:
-    def __init__(self, name, intro_fcn, new_question_fcn, menu_fcn=None, mode_specific_settings=None):
+    def __init__(self, name, intro_fcn, new_question_fcn, menu_fcn=None, mode_specific_settings=None, question_fcn=None):
         self.name = name
         self.intro_fcn = intro_fcn
         self.new_question_fcn = new_question_fcn
+        self.question_fcn = question_fcn
         self.menu_fcn = menu_fcn
         self.settings = mode_specific_settings
 
@@ -41,6 +76,9 @@ class GameMode:
     def new_question(self, *args, **kwargs):
         self.new_question_fcn(*args, **kwargs)
 
+    def question(self, *args, **kwargs):
+        return self.question_fcn(*args, **kwargs)
+
     def eval(self, *args, **kwargs):
         self.eval_fcn(*args, **kwargs)
 
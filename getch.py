@@ -1,7 +1,15 @@
 """"
-This module sets of the getch() function, which is like input(), but only
-takes a single character, and doesn't require the user to press enter.
-Credit:
+This module sets up the getch() function, which is like input(), but only
+takes a single character, and doesn't require the user to press enter, and
+readline(), which takes a line like input().
+
+Both read from a `KeyReader`, which sets the terminal up once for the whole
+session (unbuffered, without echo) and reads keys as they're typed, with
+`selectors`, into a queue.  So keys typed while a question is still
+playing aren't lost or echoed, and the game can check for them without
+waiting (`KeyReader.get(timeout=0)`) or iterate over them asynchronously
+(`async for key in reader()`).  The terminal is put back on exit.
+Credit (for the original getch):
 https://stackoverflow.com/questions/510357/python-read-a-single-character-from-the-user
 """
 
@@ -11,46 +19,219 @@ from __future__ import division, absolute_import, print_function
 try: input = raw_input
 except: pass
 
+# External Dependencies
+import atexit, codecs, os, sys, time
+from collections import deque
 
-class _Getch:
-    """Gets a single character from standard input.  Does not echo to the
-    screen."""
-    def __init__(self):
-        try:
-            self.impl = _GetchWindows()
-        except ImportError:
-            self.impl = _GetchUnix()
 
-    def __call__(self): return self.impl()
+ENTER = ("\r", "\n")
+BACKSPACE = ("\x7f", "\x08")
+END_OF_FILE = "\x04"  # Ctrl-D
 
 
-class _GetchUnix:
-    def __init__(self):
-        import tty, sys
+class KeyReader(object):
+    """Reads keys from the file descriptor `fd` (defaults to stdin's).  If
+    it's a terminal, it's switched to cbreak mode (keys are read as they're
+    typed and not echoed, but Ctrl-C still interrupts) until `close`.
 
-    def __call__(self):
-        import sys, tty, termios
-        fd = sys.stdin.fileno()
-        old_settings = termios.tcgetattr(fd)
-        try:
-            tty.setraw(sys.stdin.fileno())
-            ch = sys.stdin.read(1)
-        finally:
-            termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-        return ch
+    Each key is a str: a character, or a whole escape sequence (e.g.
+    "\\x1b[A" for the up arrow).  Keys wait in a queue until taken with
+    `get`, `readline` or by iterating (`async for`) over the reader."""
+
+    def __init__(self, fd=None):
+        import selectors
+        self.fd = sys.stdin.fileno() if fd is None else fd
+        self.keys = deque()
+        self.closed = False  # at the end of the input
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.fd, selectors.EVENT_READ)
+        self._saved = None
+        if os.isatty(self.fd):
+            import termios, tty
+            self._saved = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd, termios.TCSANOW)
+
+    def close(self):
+        """Puts the terminal back as it was."""
+        if self._saved is not None:
+            import termios
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self._saved)
+            self._saved = None
+        self._selector.close()
+
+    @property
+    def echo(self):
+        return self._saved is not None
+
+    def _wait(self, timeout):
+        """Waits up to `timeout` seconds (forever if None) for input,
+        returning whether there is some."""
+        return bool(self._selector.select(timeout))
+
+    def _read(self):
+        """Reads whatever has been typed into the queue."""
+        data = os.read(self.fd, 1024)
+        if not data:
+            self.closed = True
+            return
+        text = self._decoder.decode(data)
+        while text:
+            # an escape sequence arrives in one read, so keep it together
+            if text[0] == "\x1b" and len(text) > 1:
+                end = 2  # alt + key
+                if text[1] == "[":  # up to the final byte, e.g. \x1b[1;5A
+                    while end < len(text) and not "@" <= text[end] <= "~":
+                        end += 1
+                    end += 1
+                elif text[1] == "O":  # e.g. \x1bOP (F1)
+                    end = 3
+                self.keys.append(text[:end])
+                text = text[end:]
+            else:
+                self.keys.append(text[0])
+                text = text[1:]
+
+    def poll(self):
+        """Reads any keys typed so far into the queue, without waiting, and
+        returns how many are waiting."""
+        while not self.closed and self._wait(0):
+            self._read()
+        return len(self.keys)
+
+    def get(self, timeout=None):
+        """Returns the next key, waiting up to `timeout` seconds (forever if
+        None) for it, or None if there's none by then.  Raises EOFError at
+        the end of the input."""
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.keys:
+            if self.closed:
+                raise EOFError
+            wait = None if deadline is None else \
+                max(deadline - time.time(), 0)
+            if self._wait(wait):
+                self._read()
+            elif deadline is not None:
+                return None
+        return self.keys.popleft()
+
+    def readline(self, message="", commands=()):
+        """Returns a line typed after `message` (without the newline),
+        echoing and editing it as `input` would.  If the first key typed is
+        one of `commands`, it's returned right away, without waiting for
+        enter."""
+        sys.stdout.write(message)
+        sys.stdout.flush()
+        line = []
+        while True:
+            try:
+                key = self.get()
+            except EOFError:
+                if line:
+                    break
+                raise
+            if key in ENTER:
+                break
+            elif key in BACKSPACE:
+                if line:
+                    line.pop()
+                    self._echo("\b \b")
+            elif key == END_OF_FILE and not line:
+                raise EOFError
+            elif key.isprintable():
+                line.append(key)
+                self._echo(key)
+                if len(line) == 1 and key in commands:
+                    break
+        self._echo("\n")
+        return "".join(line)
+
+    def _echo(self, s):
+        if self.echo:
+            sys.stdout.write(s)
+            sys.stdout.flush()
+
+    def __aiter__(self):
+        return self
 
+    async def __anext__(self):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        while not self.keys:
+            if self.closed:
+                raise StopAsyncIteration
+            ready = loop.create_future()
+            loop.add_reader(self.fd, lambda: ready.done() or
+                            ready.set_result(None))
+            try:
+                await ready
+            finally:
+                loop.remove_reader(self.fd)
+            self._read()
+        return self.keys.popleft()
+
+
+class WindowsKeyReader(KeyReader):
+    """A `KeyReader` for the Windows console, which needs no setting up
+    but can't be waited on with `selectors`, so is polled instead."""
 
-class _GetchWindows:
     def __init__(self):
         import msvcrt
+        self._msvcrt = msvcrt
+        self.fd = None
+        self.keys = deque()
+        self.closed = False
+
+    def close(self):
+        pass
+
+    echo = True
+
+    def _wait(self, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._msvcrt.kbhit():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _read(self):
+        while self._msvcrt.kbhit():
+            key = self._msvcrt.getwch()
+            if key in "\x00\xe0":  # arrows, function keys, etc.
+                key += self._msvcrt.getwch()
+            self.keys.append(key)
+
+    async def __anext__(self):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        if not self.keys:
+            await loop.run_in_executor(None, self._wait, None)
+            self._read()
+        return self.keys.popleft()
 
-    def __call__(self):
-        import msvcrt
-        return msvcrt.getch()
+
+_reader = None
+
+
+def reader():
+    """Returns the session's `KeyReader`, setting the terminal up the
+    first time it's called."""
+    global _reader
+    if _reader is None:
+        try:
+            _reader = WindowsKeyReader()
+        except ImportError:
+            _reader = KeyReader()
+        atexit.register(_reader.close)
+    return _reader
 
 
 def getch(message=None):
     if message:
         print(message)
-    getchfunc = _Getch()
-    return getchfunc()
\ No newline at end of file
+    return reader().get()
+
+
+def readline(message="", commands=()):
+    return reader().readline(message, commands)
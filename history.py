@@ -0,0 +1,153 @@
+"""
+A permanent log of every question answered.
+
+Answers are appended to a SQLite database (in WAL mode, so a crash loses
+at most the last unflushed batch and never corrupts the file).  `record`
+only queues the row; a background thread writes queued rows in batches,
+one transaction each, so logging never waits on the disk.
+
+To see how you've been doing:
+
+$ python history.py [history.sqlite]
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import atexit, sqlite3, sys, threading, time, traceback
+
+from settings import DEFAULT_HISTORY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL,   -- when the game started (unix time)
+    time REAL NOT NULL,         -- when the answer was given (unix time)
+    mode TEXT NOT NULL,
+    key TEXT NOT NULL,
+    question TEXT NOT NULL,     -- numeral(s), tone or scale degrees asked
+    octave INTEGER,
+    answer TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    response_ms REAL
+);
+CREATE INDEX IF NOT EXISTS answers_by_question
+    ON answers (mode, key, question);
+"""
+
+
+def connect(filename=DEFAULT_HISTORY):
+    """Opens (creating if need be) the history database `filename`."""
+    db = sqlite3.connect(filename)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class AnswerLog(object):
+    """Writes answers to the history database `filename` in the background.
+
+    Queued answers are written once `batch_size` of them are waiting, or
+    `flush_interval` seconds after the last write, and when the log is
+    closed (which happens at exit if `close` isn't called)."""
+
+    def __init__(self, filename=DEFAULT_HISTORY, batch_size=32,
+                 flush_interval=5.0):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = int(time.time())
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._written = 0  # rows written (or dropped by an error)
+        self._queued = 0
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="history")
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, mode, key, question, octave, answer, correct,
+               response_time=None):
+        """Queues an answer to be written.  `response_time` is in seconds."""
+        row = (self.session, time.time(), mode, key, question, octave,
+               answer, int(bool(correct)),
+               None if response_time is None else 1000 * response_time)
+        with self._lock:
+            self._pending.append(row)
+            self._queued += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Blocks until everything recorded so far has been written."""
+        with self._lock:
+            target = self._queued
+        self._wake.set()
+        with self._flushed:
+            while self._written < target and self._thread.is_alive():
+                self._flushed.wait(0.1)
+
+    def close(self):
+        if not self._closing:
+            self._closing = True
+            self.flush()
+            self._wake.set()
+            self._thread.join()
+
+    def _run(self):
+        db = connect(self.filename)
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                closing = self._closing
+                with self._lock:
+                    batch, self._pending = self._pending, []
+                if batch:
+                    try:
+                        with db:
+                            db.executemany(
+                                "INSERT INTO answers (session, time, mode, "
+                                "key, question, octave, answer, correct, "
+                                "response_ms) VALUES (?,?,?,?,?,?,?,?,?)",
+                                batch)
+                    except sqlite3.Error:
+                        traceback.print_exc()
+                with self._flushed:
+                    self._written += len(batch)
+                    self._flushed.notify_all()
+                if closing and self._written >= self._queued:
+                    return
+        finally:
+            db.close()
+
+
+def summary(filename=DEFAULT_HISTORY, since=None):
+    """Returns (mode, key, question, answers, correct, mean response_ms)
+    rows for the answers logged after unix time `since`."""
+    db = connect(filename)
+    try:
+        return db.execute(
+            "SELECT mode, key, question, COUNT(*), SUM(correct), "
+            "AVG(response_ms) FROM answers WHERE time >= ? "
+            "GROUP BY mode, key, question ORDER BY mode, key, question",
+            (since or 0,)).fetchall()
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_HISTORY
+    print("{:<14} {:<4} {:<16} {:>8} {:>8} {:>10}".format(
+        "mode", "key", "question", "answers", "correct", "mean ms"))
+    for mode, key, question, count, correct, ms in summary(filename):
+        print("{:<14} {:<4} {:<16} {:>8} {:>7.0%} {:>10.0f}".format(
+            mode, key, question, count, correct/count, ms or 0))
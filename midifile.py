@@ -0,0 +1,127 @@
+"""
+Standard MIDI File writing, a passage at a time.
+
+`MidiWriter` writes a format 0 file (a single track) straight to disk as
+events come in; only the track's length is written at the end, by seeking
+back to its header.  So a file of any length is written in constant memory,
+as long as it's fed from a generator (see `write_passages`).
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import struct
+
+
+TICKS_PER_BEAT = 480
+VELOCITY = 100
+
+
+def varlen(n):
+    """Returns `n` as a MIDI variable-length quantity."""
+    out = bytearray([n & 0x7f])
+    n >>= 7
+    while n:
+        out.insert(0, 0x80 | (n & 0x7f))
+        n >>= 7
+    return bytes(out)
+
+
+class MidiWriter(object):
+    """Writes a single-track Standard MIDI File to the seekable binary file
+    `f`.  Events are written in order of their tick (which must never go
+    back); `close` finishes the track."""
+
+    def __init__(self, f, ticks_per_beat=TICKS_PER_BEAT, channel=0):
+        self.f = f
+        self.ticks_per_beat = ticks_per_beat
+        self.channel = channel
+        self.tick = 0
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, ticks_per_beat))
+        f.write(b"MTrk")
+        self._length_at = f.tell()
+        f.write(struct.pack(">I", 0))  # filled in by `close`
+        self._length = 0
+
+    def _event(self, tick, data):
+        if tick < self.tick:
+            raise ValueError("MIDI events must be written in order")
+        data = varlen(tick - self.tick) + data
+        self.tick = tick
+        self.f.write(data)
+        self._length += len(data)
+
+    def _meta(self, tick, kind, data):
+        self._event(tick, bytes(bytearray([0xff, kind])) + varlen(len(data))
+                    + data)
+
+    def tempo(self, tick, bpm):
+        self._meta(tick, 0x51, struct.pack(">I", int(round(6e7 / bpm)))[1:])
+
+    def marker(self, tick, text):
+        self._meta(tick, 0x06, text.encode("utf-8"))
+
+    def _note(self, tick, status, key, velocity):
+        if not 0 <= key <= 127:
+            raise ValueError("MIDI key {} out of range 0-127".format(key))
+        self._event(tick, bytes(bytearray([status | self.channel, key,
+                                           velocity])))
+
+    def note_on(self, tick, key, velocity=VELOCITY):
+        self._note(tick, 0x90, key, velocity)
+
+    def note_off(self, tick, key):
+        self._note(tick, 0x80, key, 0)
+
+    def close(self):
+        self._meta(self.tick, 0x2f, b"")
+        end = self.f.tell()
+        self.f.seek(self._length_at)
+        self.f.write(struct.pack(">I", self._length))
+        self.f.seek(end)
+
+
+def in_range(key):
+    """Returns `key` moved by octaves into MIDI's range, 0-127 (high
+    interval questions can go past it)."""
+    while key > 127:
+        key -= 12
+    while key < 0:
+        key += 12
+    return key
+
+
+def write_passages(filename, passages, bpm, gap=4):
+    """Writes `passages`, an iterable of (text, events) pairs, to the MIDI
+    file `filename` at `bpm`, one after another with `gap` beats of silence
+    between them.  Events are (start, length, midi_keys) tuples, in seconds
+    from the start of the passage (as returned by `render.bar_events`), and
+    each passage is marked with its text.  Keys outside MIDI's range are
+    moved by octaves into it.  Returns the number of passages written."""
+    with open(filename, "wb") as f:
+        midi = MidiWriter(f)
+        ticks = lambda seconds: int(round(seconds * bpm / 60 *
+                                          midi.ticks_per_beat))
+        midi.tempo(0, bpm)
+        start = count = 0
+        for text, events in passages:
+            midi.marker(start, text)
+            notes = []  # (tick, on, key), so offs sort before ons
+            for t, length, keys in events:
+                for key in map(in_range, keys):
+                    notes.append((start + ticks(t), 1, key))
+                    notes.append((start + ticks(t + length), 0, key))
+            notes.sort()
+            for tick, on, key in notes:
+                if on:
+                    midi.note_on(tick, key)
+                else:
+                    midi.note_off(tick, key)
+            end = max([t + length for t, length, _ in events] or [0])
+            start += ticks(end) + gap * midi.ticks_per_beat
+            count += 1
+        midi.close()
+    return count
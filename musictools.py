@@ -4,130 +4,331 @@ try: input = raw_input
 except: pass
 
 import settings as st
+import audio
+import progressions
 
 
 # External Dependencies
 import time, random
-from mingus.midi import fluidsynth  # requires FluidSynth is installed
-from mingus.core import progressions, intervals, chords as ch
+from collections import namedtuple
 import mingus.core.notes as notes
 from mingus.containers import NoteContainer, Note, Bar
 
 
-def random_chord():
+# MIDI key numbers are one octave above mingus' `int(Note)` values
+_MIDI_OFFSET = 12
+_name_offsets = {}
+
+
+def note2midi(note):
+    return int(note) + _MIDI_OFFSET
+
+
+def midi2note(midi, name=None):
+    """Returns the mingus Note for MIDI key `midi`, spelled as `name` if
+    given (so e.g. Bb is not turned into A#)."""
+    if name is None:
+        return Note().from_int(midi - _MIDI_OFFSET)
+    try:
+        offset = _name_offsets[name]
+    except KeyError:
+        offset = _name_offsets[name] = int(Note(name, 0))
+    return Note(name, (midi - _MIDI_OFFSET - offset) // 12)
+
+
+class ChordTable(object):
+    """Every triad and seventh numeral of `key` as tuples of MIDI ints.
+
+    Chords are stacked up from the root as in `progressions.to_chords`.
+    Lookups are by (numeral, octave), where octave is the (mingus) octave
+    of the chord's root, or by (numeral, Ioctave) for the voicings used by
+    `play_progression`, which keep every root within the octave above the
+    tonic.
+
+    Building a table also names its chords (see `chord_name_index`), so
+    naming them later is a lookup."""
+    numerals = ("I", "II", "III", "IV", "V", "VI", "VII",
+                "I7", "II7", "III7", "IV7", "V7", "VI7", "VII7")
+    octaves = range(0, 9)
+
+    def __init__(self, key):
+        from mingus.core import progressions as mprogressions
+        self.key = key
+        tonic_pc = notes.note_to_int(key[0].upper() + key[1:])
+
+        self.names = {}
+        self.base = {}
+        self.by_octave = {}
+        self.by_Ioctave = {}
+        self.Ioctaves = {}
+        for numeral in self.numerals:
+            chord = NoteContainer(mprogressions.to_chords([numeral], key)[0])
+            self.names[numeral] = tuple(x.name for x in chord)
+            if self.names[numeral] not in _chord_name_index:
+                _chord_name_index[self.names[numeral]] = \
+                    _chord_label(self.names[numeral])
+            base = tuple(note2midi(x) for x in chord)
+            self.base[numeral] = base
+            root_octave = chord[0].octave
+            dist_to_tonic = (base[0] - tonic_pc) % 12
+            for octave in self.octaves:
+                d = 12*(octave - root_octave)
+                self.by_octave[numeral, octave] = tuple(m + d for m in base)
+                self.Ioctaves[numeral, octave] = \
+                    (base[0] + d - _MIDI_OFFSET - dist_to_tonic) // 12
+
+        # `play_progression` voicings, relative to the root of I in Ioctave
+        I_root = self.base["I"][0]
+        for numeral in self.numerals:
+            base = self.base[numeral]
+            for Ioctave in self.octaves:
+                I_val = I_root + 12*(Ioctave - 4)
+                d = I_val + (base[0] - I_val) % 12 - base[0]
+                self.by_Ioctave[numeral, Ioctave] = tuple(m + d for m in base)
+
+    def midi(self, numeral, octave=None):
+        if octave is None:
+            return self.base[numeral]
+        return self.by_octave[numeral, octave]
+
+    def voiced(self, numeral, Ioctave):
+        return self.by_Ioctave[numeral, Ioctave]
+
+    def Ioctave(self, numeral, octave):
+        return self.Ioctaves[numeral, octave]
+
+    def container(self, numeral, midi=None):
+        """Returns `midi` (defaults to the numeral's base chord) as a
+        NoteContainer spelled as in the key."""
+        if midi is None:
+            midi = self.base[numeral]
+        return NoteContainer([midi2note(m, name) for m, name in
+                              zip(midi, self.names[numeral])])
+
+
+_chord_tables = {}
+
+
+def chord_table(key):
+    """Returns the ChordTable for `key`, building it the first time the key
+    is used in this session."""
+    try:
+        return _chord_tables[key]
+    except KeyError:
+        table = _chord_tables[key] = ChordTable(key)
+        return table
+
+
+def random_chord(state, numeral=None, octave=None):
+    """Returns (numeral, chord, Ioctave) for a random numeral of 
+    `state.NUMERALS` (or `numeral`) in `state.KEY`, in a random octave of 
+    `state.OCTAVES` (or `octave`) if `state.MANY_OCTAVES`.  `state` is a 
+    `game_structure.GameState`."""
+    table = chord_table(state.KEY)
+
     # Pick random chord
-    numeral = random.choice(st.NUMERALS)
-    chord = NoteContainer(progressions.to_chords([numeral], st.KEY)[0])
-
-    # Pick random octave, set chord to octave   
-    if st.MANY_OCTAVES:
-        octave = random.choice(st.OCTAVES)
-        d = octave - chord[0].octave
-        for x in chord:
-            x.octave = x.octave + d
-
-        # Find Ioctave
-        dist_to_tonic = (int(chord[0]) - int(Note(st.KEY))) % 12
-        I_root = Note().from_int(int(chord[0]) - dist_to_tonic)
-        Ioctave = I_root.octave
+    if numeral is None:
+        numeral = state.rng.choice(state.NUMERALS)
+
+    # Pick random octave, set chord to octave
+    if state.MANY_OCTAVES:
+        if octave is None:
+            octave = state.rng.choice(state.OCTAVES)
+        midi = table.midi(numeral, octave)
+        Ioctave = table.Ioctave(numeral, octave)
     else:
-        Ioctave = st.DEFAULT_IOCTAVE
-    return numeral, chord, Ioctave
+        midi = table.midi(numeral)
+        Ioctave = state.DEFAULT_IOCTAVE
+    return numeral, table.container(numeral, midi), Ioctave
 
 
 class Diatonic(object):
+    """The diatonic scale of `key` starting from its tonic in `Ioctave`.
+
+    Everything is worked out on MIDI ints using scale-degree tables built
+    in `__init__`; mingus Notes are only made for `notes` and for the
+    return values of `num2note` and `interval`.  Use `Diatonic.for_key` to
+    share one instance per (key, Ioctave)."""
+    __slots__ = ("key", "Ioctave", "keyname", "rel_semitones", "tonic",
+                 "tonic_midi", "scale", "notes", "numdict", "_degrees",
+                 "_up", "_down")
+    _cache = {}
+
     def __init__(self, key, Ioctave=None):
         self.key = key
         if not Ioctave:
-            Ioctave = Note(key).octave
+            Ioctave = 4
         self.Ioctave = Ioctave
 
+        tonic_name = key[0].upper() + key[1:]
         if key[0] == key[0].lower():  # natural minor
-            self.rel_semitones = [0, 2, 3, 5, 7, 8, 10]
-            self.keyname = key[0].upper + key[1:] + " Major"
-        elif key[0] == key[0].upper():  # major
-            self.rel_semitones = [0, 2, 4, 5, 7, 9, 11]
-            self.keyname = key + " Minor"
-        self.tonic = Note(name=key.upper(), octave=Ioctave)
-
-        self.abs_semitones = [int(self.tonic) + x for x in self.rel_semitones]
-        self.notes = [Note().from_int(x) for x in self.abs_semitones]
+            self.rel_semitones = (0, 2, 3, 5, 7, 8, 10)
+            self.keyname = tonic_name + " Minor"
+        else:  # major
+            self.rel_semitones = (0, 2, 4, 5, 7, 9, 11)
+            self.keyname = tonic_name + " Major"
+        self.tonic = Note(name=tonic_name, octave=Ioctave)
+        self.tonic_midi = note2midi(self.tonic)
+
+        self.scale = tuple(self.tonic_midi + x for x in self.rel_semitones)
+        self.notes = [midi2note(x) for x in self.scale]
         self.numdict = dict([(k + 1, n) for k, n in enumerate(self.notes)])
 
+        # scale degree (1-7) of each pitch class, 0 if not in the key
+        degrees = [0]*12
+        for k, x in enumerate(self.scale):
+            degrees[x % 12] = k + 1
+        self._degrees = tuple(degrees)
+
+        # semitones from degree r up/down to the degree k steps away
+        rel = self.rel_semitones
+        self._up = tuple(tuple((rel[(r + k) % 7] - rel[r]) % 12
+                               for k in range(7)) for r in range(7))
+        self._down = tuple(tuple((rel[r] - rel[(r - k) % 7]) % 12
+                                 for k in range(7)) for r in range(7))
+
+    @classmethod
+    def for_key(cls, key, Ioctave=None):
+        try:
+            return cls._cache[key, Ioctave]
+        except KeyError:
+            diatonic = cls._cache[key, Ioctave] = cls(key, Ioctave)
+            return diatonic
+
+    @property
+    def abs_semitones(self):
+        return [x - _MIDI_OFFSET for x in self.scale]
+
     def relsemi2note(self, rel_semi):
-        return Note().from_int(int(self.tonic) + rel_semi)
+        return midi2note(self.tonic_midi + rel_semi)
 
-    def num2note(self, number, ascending=True):
+    def num2midi(self, number):
         assert number > 0
-        self.rel_semitones[(number - 1) % 8]
-        rel_semi = \
-            self.rel_semitones[(number - 1) % 8] + 12*((number - 1)//8)
-        return self.relsemi2note(rel_semi)
+        return self.scale[(number - 1) % 7] + 12*((number - 1)//7)
 
-    def relsemi2note(self, rel_semi):
-        return Note().from_int(int(self.tonic) + rel_semi)
+    def num2note(self, number, ascending=True):
+        return midi2note(self.num2midi(number))
+
+    def midi2num(self, midi):
+        num = self._degrees[midi % 12]
+        if not num:
+            raise ValueError("{} is not a note in {}.".format(
+                midi2note(midi).name, self.keyname))
+        return num
 
     def note2num(self, note):
-        base_semitones = [x % 12 for x in self.abs_semitones]
-        note_base_semi = int(note) % 12
-        try:
-            return base_semitones.index(note_base_semi) + 1
-        except:
-            raise ValueError("{} is not a note in {}.".format(note.name, 
+        num = self._degrees[int(note) % 12]
+        if not num:
+            raise ValueError("{} is not a note in {}.".format(note.name,
                                 self.keyname))
+        return num
+
+    def pc2num(self, pitch_class):
+        """Returns the scale degree of `pitch_class` (0 for C to 11 for B),
+        or 0 if it's not in the key."""
+        return self._degrees[pitch_class]
 
     def nums2semidist(self, num1, num2):
         assert 1 <= num1 <= 7
         assert 1 <= num2 <= 7
-        return abs(int(self.num2note(num2)) - int(self.num2note(num1)))
+        return abs(self.rel_semitones[num2 - 1] - self.rel_semitones[num1 - 1])
 
+    def interval_midi(self, number, root_midi, ascending=True):
+        """Returns the MIDI ints of the interval, lowest first."""
+        assert number > 0
+        steps, octaves = (number - 1) % 7, (number - 1)//7
+        root_idx = self.midi2num(root_midi) - 1
+        if ascending:
+            second = root_midi + self._up[root_idx][steps] + 12*octaves
+            return root_midi, second
+        second = root_midi - self._down[root_idx][steps] - 12*octaves
+        return second, root_midi
 
     def interval(self, number, root=None, ascending=True):
-        assert number > 0
         if not root:
             root = self.notes[0]
-
-        root_num = self.note2num(root)
-        if ascending:
-            second_note_num = (self.note2num(root) + (number - 1)) % 7
-            if second_note_num == 0:
-                second_note_num = 7
-            semi_dist = self.nums2semidist(root_num, second_note_num)
-            if second_note_num < root_num:
-                semi_dist = 12 - semi_dist
-            second_note_int  = int(root) + semi_dist + 12*((number-1)//7)
-        else:
-            second_note_num = (self.note2num(root) - (number - 1)) % 7
-            if second_note_num == 0:
-                second_note_num = 7
-            semi_dist = self.nums2semidist(root_num, second_note_num)
-            if second_note_num > root_num:
-                semi_dist = 12 - semi_dist
-            second_note_int  = int(root) - semi_dist - 12*((number-1)//7)
-
-        return NoteContainer(sorted([root, Note().from_int(second_note_int)]))
+        low, high = self.interval_midi(number, note2midi(root), ascending)
+        second = midi2note(high if ascending else low)
+        return NoteContainer(sorted([root, second]))
 
     def random_note(self):
         return random.choice(self.notes)
 
-    
+
+# An interval question, as `IntervalTable` looks it up: its Notes, the
+# scale degrees of its notes, lowest first, the degrees as they're answered
+# (e.g. "2 6") and its name (from INTERVAL_NAMES, as answered with -n)
+IntervalQuestion = namedtuple("IntervalQuestion", [
+    "number", "root", "ascending", "Ioctave", "diatonic", "notes", 
+    "degrees", "answer", "name"])
+
+
+class IntervalTable(object):
+    """Every interval of `key` (from its tonic in `Ioctave`) as an
+    `IntervalQuestion`, by (number, root degree, ascending).
+
+    Everything `random_interval` and the interval graders need is worked
+    out here once, so asking and grading a question are lookups.  Use
+    `IntervalTable.for_key` to build one table per (key, Ioctave)."""
+    numbers = range(1, 16)  # from a unison to two octaves
+    _cache = {}
+
+    def __init__(self, key, Ioctave=None):
+        self.diatonic = Diatonic.for_key(key, Ioctave)
+        self._questions = {}
+        for number in self.numbers:
+            for root in range(1, 8):
+                for ascending in (True, False):
+                    self._questions[number, root, ascending] = \
+                        self._build(number, root, ascending)
+
+    @classmethod
+    def for_key(cls, key, Ioctave=None):
+        try:
+            return cls._cache[key, Ioctave]
+        except KeyError:
+            table = cls._cache[key, Ioctave] = cls(key, Ioctave)
+            return table
+
+    def _build(self, number, root, ascending):
+        diatonic = self.diatonic
+        notes = diatonic.interval(number, root=diatonic.notes[root - 1], 
+                                  ascending=ascending)
+        if len(notes) == 1:  # unisons are played as octaves
+            notes = NoteContainer([notes[0], 
+                                   Note(notes[0].name, notes[0].octave + 1)])
+        low, high = note2midi(notes[0]), note2midi(notes[1])
+        degrees = (diatonic.midi2num(low), diatonic.midi2num(high))
+        return IntervalQuestion(
+            number, root, ascending, diatonic.Ioctave, diatonic, notes, 
+            degrees, " ".join(str(x) for x in degrees), 
+            INTERVAL_NAMES[(high - low) % 12])
+
+    def question(self, number, root, ascending=True):
+        """Returns the `IntervalQuestion` for the interval `number` (e.g. 3
+        for a third) up (or down) from scale degree `root`."""
+        try:
+            return self._questions[number, root, ascending]
+        except KeyError:  # beyond two octaves
+            q = self._questions[number, root, ascending] = \
+                self._build(number, root, ascending)
+            return q
+
+
 def isvalidnote(answer):
-    try:  # return True if response is numerical 1-7
-        return int(answer) in range(1, 8)
-    except:
-        pass
-    try:  # return True if response is a valid note name
-        return notes.is_valid_note(answer[0].upper() + answer[1:])
-    except:
-        pass
-    return False
+    """Returns whether `answer` is a scale degree (1-7) or a note name (see
+    `tokens`)."""
+    import tokens
+    return tokens.is_note(answer)
+
+
+KEYS = ['A', 'Bb', 'B', 'C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab']
 
 
 def random_key(output_on=True):
     """Returns a random major or minor key.
     Minor in lower case, major in upper case."""
-    keys = ['A', 'Bb', 'B', 'C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab']
-    key = random.choice(keys)
+    key = random.choice(KEYS)
     if random.choice([0, 1]):  # minor or major
         key = key.lower()
 
@@ -160,61 +361,101 @@ def easy_bar(notes, durations=None):
             bar.place_notes(x, d)
     return bar
 
-def easy_play(notes, durations=None, bpm=None):
+def make_backend(name=None):
+    """Returns a new audio backend (see `audio`) of type `name`, defaulting
+    to `st.AUDIO_BACKEND`, set up from the settings."""
+    name = name or st.AUDIO_BACKEND
+    cache_bytes = st.AUDIO_CACHE_MB * 2**20
+    if name == "fluidsynth":
+        return audio.FluidSynthBackend(st.SOUNDFONT)
+    elif name == "render":
+        return audio.RenderBackend(st.SOUNDFONT, st.SAMPLE_BANK, cache_bytes)
+    elif name == "synth":
+        return audio.RenderBackend(cache_bytes=cache_bytes)
+    elif name == "wav":
+        return audio.WavBackend(st.WAV_FILE, st.SOUNDFONT, st.SAMPLE_BANK, 
+                                cache_bytes)
+    elif name == "null":
+        return audio.NullBackend()
+    raise ValueError("Unknown audio backend {}".format(name))
+
+def init_audio():
+    """Initializes the audio backend, e.g. loads the sound font.  This can 
+    take a while, so `start_audio` runs it on the audio worker instead."""
+    audio.backend.init()
+
+def start_audio(init_fcn=init_audio, backend=None):
+    """Switches to `backend` (defaults to `make_backend()`) and initializes 
+    it in the background; anything played before it's ready is queued 
+    behind it."""
+    audio.use(backend or make_backend())
+    audio.worker.submit_setup(init_fcn)
+
+def easy_play(notes, durations=None, *, bpm):
     """`notes` should be a list of notes and/or note_containers.
     durations will all default to 4 (quarter notes).
-    bpm will default current BPM setting, `st.BPM`."""
-    if not bpm:
-        bpm = st.BPM
-    fluidsynth.play_Bar(easy_bar(notes, durations), bpm=bpm)
-
-def play_wait(duration=4):
-    easy_play([None], [duration])
-
-def play_progression(prog, key, octaves=None, Ioctave=4, Iup = "I", bpm=None):
+    bpm is the game's, e.g. `state.BPM`.
+    Playback is queued on the audio worker, so this returns immediately."""
+    audio.play_bar(easy_bar(notes, durations), bpm)
+
+def play_notes(notes, bpm):
+    """Starts a Note or NoteContainer sounding, without stopping it, after
+    whatever is already queued (like `fluidsynth.play_NoteContainer`)."""
+    audio.start_notes(notes, bpm)
+
+def prerender(notes, durations=None, *, bpm):
+    """Prepares `notes` to be played, e.g. renders them into the audio cache
+    ahead of time (with backends that have nothing to prepare, this does 
+    nothing)."""
+    if not audio.current().silent:
+        audio.prepare(easy_bar(notes, durations), bpm)
+
+def stop_audio():
+    """Drops any queued audio and silences whatever is playing."""
+    audio.stop()
+
+def play_wait(duration=4, *, bpm):
+    easy_play([None], [duration], bpm=bpm)
+
+def play_progression(prog, key, octaves=None, Ioctave=4, Iup = "I", *, bpm):
     """ Converts a progression to chords and plays them using fluidsynth.
     Iup will be played an octave higher than other numerals by default.
     Set Ioctave to fall for no octave correction from mingus default behavior.
     """
+    easy_play(progression_chords(prog, key, octaves, Ioctave, Iup), bpm=bpm)
+
+
+def progression_chords(prog, key, octaves=None, Ioctave=4, Iup="I"):
+    """Returns the NoteContainers `play_progression` would play."""
     if octaves:
         assert len(prog) == len(octaves)
-
-    if not octaves:
-        I_chd = NoteContainer(progressions.to_chords([st.I], key)[0])
-        I_chd[0].octave = Ioctave
-        I_val = int(I_chd[0])
+    table = chord_table(key)
 
     chords = []
     for i, numeral in enumerate(prog):
 
         # find chords from numerals and key
         if numeral == "Iup":
-            chord = NoteContainer(progressions.to_chords([Iup], key)[0])
+            numeral = Iup
+            up = 12
         else:
-            chord = NoteContainer(progressions.to_chords([numeral], key)[0])
+            up = 0
 
         # Set octaves
         if octaves:
-            d = octaves[i] - chord[0].octave
-            for x in chord:
-                x.octave += d
+            midi = table.midi(numeral, octaves[i])
         elif Ioctave:  # make sure notes are all at least pitch of that 'I' root
-            while int(chord[0]) > I_val:
-                for x in chord:
-                    x.octave_down()
-            while int(chord[0]) < I_val:
-                for x in chord:
-                    x.octave_up()
-        if numeral == "Iup":
-            for x in chord:
-                x.octave_up()
-
-        chords.append(chord)
+            midi = table.voiced(numeral, Ioctave)
+        else:
+            midi = table.midi(numeral)
+        if up:
+            midi = tuple(m + up for m in midi)
 
-    easy_play(chords, bpm=bpm)
+        chords.append(table.container(numeral, midi))
+    return chords
 
 
-def resolve_with_chords(num2res, key, Ioctave, numerals, bpm=None):
+def resolve_with_chords(num2res, key, Ioctave, numerals, *, bpm):
     """"Note: only relevant for major scale triads."""
     [I, II, III, IV, V, VI, VII] = numerals
 
@@ -233,32 +474,62 @@ def resolve_with_chords(num2res, key, Ioctave, numerals, bpm=None):
     return res
 
 
-def chordname(chord, numeral=None):
-    s = ""
-    if numeral:
-        s = numeral + " - "
-    s += "  ::  ".join(ch.determine([x.name for x in chord], True))
-    s += " -- " + " ".join([x.name for x in chord])
-    return s
+# interval names by semitone distance (mod 12)
+INTERVAL_NAMES = ['8', '2b', '2', '3b', '3', '4', '5b', '5', '6b', '6', '7b', 
+                  '7']
+
 
+_chord_name_index = {}  # see chord_name_index
 
-def random_progression(number_strums, numerals, strums_per_chord=[1]):
 
-    prog_strums = []
-    prog = []
-    numeral = ""
-    while len(prog_strums) < number_strums:
-        prev_numeral = numeral
-        numeral = random.choice(numerals)
-        if prev_numeral == numeral:  # check not same as previous chord
-            continue
+def _chord_label(names):
+    """Returns (mingus' shorthand names for the chord spelled `names`, bass
+    first, as from `mingus.core.chords.determine`, and its label as shown
+    by `chordname`)."""
+    from mingus.core import chords as ch
+    shorthands = tuple(ch.determine(list(names), True))
+    return shorthands, "  ::  ".join(shorthands) + " -- " + " ".join(names)
 
-        strums = random.choice(strums_per_chord)
 
-        # not very elegant/musical (i.e. a "jazzy" solution)
-        if len(prog) + strums > number_strums:
-            strums = number_strums - len(prog)
+def chord_name_index():
+    """Returns a dict mapping the note names of a chord (bass first) to its
+    `_chord_label`, for every chord in `ChordTable.numerals` in every key of
+    `KEYS`, major and minor (building their ChordTables if need be).  Each
+    ChordTable adds its own chords as it's built, and other chords are
+    added as they're named."""
+    for key in KEYS + [k.lower() for k in KEYS]:
+        chord_table(key)
+    return _chord_name_index
 
-        prog_strums += [numeral] * strums
-        prog += [numeral]
-    return prog, prog_strums
\ No newline at end of file
+
+def _chord_entry(chord):
+    names = tuple([x.name for x in chord])
+    try:
+        return _chord_name_index[names]
+    except KeyError:
+        entry = _chord_name_index[names] = _chord_label(names)
+        return entry
+
+
+def chord_names(chord):
+    """Returns mingus' shorthand names for `chord` (see
+    `mingus.core.chords.determine`), looked up in `chord_name_index`."""
+    return list(_chord_entry(chord)[0])
+
+
+def chordname(chord, numeral=None):
+    label = _chord_entry(chord)[1]
+    if numeral:
+        return numeral + " - " + label
+    return label
+
+
+def random_progression(number_strums, numerals, strums_per_chord=[1], 
+                       rng=random, model=None):
+    """Returns (prog, prog_strums): a random progression of `numerals`, no
+    chord following itself, and its chords repeated for each strum,
+    `number_strums` strums in all.  Chords are picked by `model` (a
+    `progressions.ProgressionModel`, by default uniformly at random)."""
+    if model is None:
+        model = progressions.model()
+    return model.progression(number_strums, numerals, strums_per_chord, rng)
@@ -0,0 +1,95 @@
+"""
+Look-ahead question preparation.
+
+A Prefetcher keeps a few questions prepared (notes picked, chords named,
+audio rendered) by a background thread while the user is answering the
+current one, so the next question is ready as soon as it's needed.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import threading, traceback
+from collections import deque
+
+
+class Prefetcher(object):
+    """Prepares up to `depth` questions ahead of time.
+
+    Questions are made by calling a `prepare` function (with the arguments
+    given to `get`, e.g. the game's state).  Prepared questions are only
+    handed out for the question space (any hashable description of the
+    settings they depend on) they were made for; changing `prepare`, its
+    arguments or the space, or calling `invalidate`, throws away everything
+    prepared so far."""
+
+    def __init__(self, depth=3):
+        self.depth = depth
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._prepare = None
+        self._args = ()
+        self._space = None
+        self._generation = 0
+        self._thread = None
+
+    def get(self, prepare, space, *args):
+        """Returns the next question made by `prepare(*args)` for `space`,
+        preparing it right away if none is ready yet."""
+        if self.depth < 1:
+            return prepare(*args)
+        with self._cond:
+            if (prepare is not self._prepare or space != self._space or
+                    args != self._args):
+                self._reset(prepare, space, args)
+            question = self._ready.popleft() if self._ready else None
+            self._cond.notify()
+        self._start()
+        if question is None:
+            question = prepare(*args)
+        return question
+
+    def invalidate(self):
+        with self._cond:
+            self._reset(None, None, ())
+
+    def __len__(self):
+        return len(self._ready)
+
+    def _reset(self, prepare, space, args):
+        self._ready.clear()
+        self._prepare = prepare
+        self._args = args
+        self._space = space
+        self._generation += 1
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name="prefetch")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (self._prepare is None or
+                       len(self._ready) >= self.depth):
+                    self._cond.wait()
+                prepare, args = self._prepare, self._args
+                generation = self._generation
+            try:
+                question = prepare(*args)
+            except Exception:
+                # leave it to `get` to raise the error when it's needed
+                traceback.print_exc()
+                with self._cond:
+                    if generation == self._generation:
+                        self._prepare = None
+                continue
+            with self._cond:
+                if generation == self._generation:
+                    self._ready.append(question)
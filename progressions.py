@@ -0,0 +1,173 @@
+"""
+Random chord progressions from Markov chains.
+
+A `ProgressionModel` holds how likely each chord of the scale is to start a
+progression and to follow each other chord: a transition matrix over the
+seven scale degrees with nothing on its diagonal, so a chord never follows
+itself and nothing has to be drawn again.  The matrix is turned into
+cumulative weights once, so `progression` picks a progression of any
+length in one pass, a bisection per chord.
+
+Models are named by `--progressions` (the PROGRESSIONS setting):
+
+  uniform     any chord but the last is as likely as any other (the
+              default, as the game has always done)
+  functional  weighted towards the usual moves of functional harmony:
+              predominant (II, IV) to dominant (V, VII) to tonic, etc.
+  <file>      learned from a corpus file of progressions, one per line, as
+              numerals or scale degrees (e.g. "I vi IV V" or "1 6 4 5"),
+              with # starting a comment
+
+`batch` draws from the same tables in bulk.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import bisect, random, re
+
+
+DEGREES = 7
+UNIFORM = "uniform"
+
+# Weights of each degree (row) moving to each other (column), roughly as in
+# Piston's table of usual root progressions: 4 usual, 2 sometimes, 1 less
+# often
+FUNCTIONAL = [
+    # I  II III IV  V  VI VII
+    [0, 2, 1, 4, 4, 2, 1],  # I
+    [1, 0, 1, 2, 4, 1, 2],  # II
+    [1, 1, 0, 2, 1, 4, 1],  # III
+    [2, 2, 1, 0, 4, 1, 2],  # IV
+    [4, 1, 1, 2, 0, 2, 1],  # V
+    [1, 4, 2, 2, 2, 0, 1],  # VI
+    [4, 1, 2, 1, 1, 1, 0],  # VII
+]
+FUNCTIONAL_START = [4, 1, 1, 2, 2, 2, 1]
+
+_ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII"]
+_chord_symbol = re.compile(r"^(?:([1-7])|([ivIV]+))(?:7|o7?|dim7?|\+)?$")
+
+
+def _cumulative(weights):
+    total = 0.0
+    cumulative = []
+    for w in weights:
+        if w < 0:
+            raise ValueError("Negative weight {}".format(w))
+        total += w
+        cumulative.append(total)
+    if not total:
+        raise ValueError("Every weight is 0")
+    return cumulative
+
+
+class ProgressionModel(object):
+    """A Markov chain over the scale degrees (0 for I to 6 for VII):
+    `start` weights the first chord and `transitions[a][b]` the chord `b`
+    following `a` (the diagonal is ignored).  Weights needn't sum to 1."""
+
+    def __init__(self, transitions, start=None, name=None):
+        self.name = name
+        self.transitions = [[0 if a == b else w for b, w in enumerate(row)]
+                            for a, row in enumerate(transitions)]
+        if len(self.transitions) != DEGREES or \
+                any(len(row) != DEGREES for row in self.transitions):
+            raise ValueError("Need {0}x{0} transition weights"
+                             "".format(DEGREES))
+        self.start = list(start or [1] * DEGREES)
+        self._start = _cumulative(self.start)
+        self._next = [_cumulative(row) for row in self.transitions]
+
+    @classmethod
+    def uniform(cls):
+        return cls([[1] * DEGREES] * DEGREES, name=UNIFORM)
+
+    @classmethod
+    def from_corpus(cls, lines, smoothing=0.5, name=None):
+        """Learns a model from progressions, one per line of `lines` (e.g.
+        an open file).  Repeated chords count once.  `smoothing` is added
+        to every count, so no progression is ruled out."""
+        counts = [[smoothing] * DEGREES for _ in range(DEGREES)]
+        start = [smoothing] * DEGREES
+        for number, line in enumerate(lines, 1):
+            prev = None
+            for symbol in line.split("#")[0].split():
+                degree = parse_degree(symbol)
+                if degree is None:
+                    raise ValueError("Line {}: can't understand chord {!r}"
+                                     "".format(number, symbol))
+                if prev is None:
+                    start[degree] += 1
+                elif degree != prev:
+                    counts[prev][degree] += 1
+                prev = degree
+        # nothing is known about chords the corpus never leaves
+        counts = [row if sum(row) else [1] * DEGREES for row in counts]
+        return cls(counts, start if sum(start) else None, name)
+
+    def cumulative(self):
+        """Returns (start, next): the cumulative weights of the first chord,
+        and of the chord after each degree (a list of them, by degree), as
+        `progression` draws from them."""
+        return self._start, self._next
+
+    def progression(self, number_strums, numerals, strums_per_chord=(1,),
+                    rng=random):
+        """Returns (prog, prog_strums): a random progression of chords from
+        `numerals` (by degree), each strummed a number of times from
+        `strums_per_chord` (the last cut short), and every strum of it,
+        `number_strums` in all."""
+        prog = []
+        prog_strums = []
+        cumulative = self._start
+        while len(prog_strums) < number_strums:
+            degree = bisect.bisect(cumulative, rng.random() * cumulative[-1])
+            numeral = numerals[degree]
+            strums = min(rng.choice(strums_per_chord),
+                         number_strums - len(prog_strums))
+            prog.append(numeral)
+            prog_strums += [numeral] * strums
+            cumulative = self._next[degree]
+        return prog, prog_strums
+
+
+def parse_degree(symbol):
+    """Returns the scale degree (0-6) of a numeral like "IV", "vii7" or
+    "V7", or of a degree like "4", or None."""
+    match = _chord_symbol.match(symbol)
+    if not match:
+        return None
+    digit, roman = match.groups()
+    if digit:
+        return int(digit) - 1
+    try:
+        return _ROMAN.index(roman.upper())
+    except ValueError:
+        return None
+
+
+PRESETS = {
+    UNIFORM: ProgressionModel.uniform,
+    "functional": lambda: ProgressionModel(FUNCTIONAL, FUNCTIONAL_START,
+                                           "functional"),
+}
+_models = {}
+
+
+def model(name=UNIFORM):
+    """Returns the model `name`: a preset, or one learned from the corpus
+    file of that name.  Each is only built once."""
+    try:
+        return _models[name]
+    except KeyError:
+        if name in PRESETS:
+            found = PRESETS[name]()
+        else:
+            with open(name) as f:
+                found = ProgressionModel.from_corpus(f, name=name)
+        _models[name] = found
+        return found
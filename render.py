@@ -0,0 +1,328 @@
+"""
+Offline rendering of mingus Bars to PCM buffers.
+
+`fluidsynth.play_Bar` drives the synth in real time, sleeping for the length
+of every note.  The renderers here lay the same Bar out on a timeline and
+synthesize it into a NumPy array of 16-bit stereo samples ahead of time, so
+the audio can be cached, written to disk or checked in tests without a sound
+device.  Only finished buffers are handed to the sound card, each mixed in
+on the sample it's due (see `Mixer`).
+
+This module mirrors the functions of `mingus.midi.fluidsynth` that
+EarThoseChords uses (`init` and `play_Bar`), so it can stand in for it.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import io, threading, time, wave
+from collections import OrderedDict
+from ctypes import c_void_p
+import numpy as np
+
+from timeline import bar_events
+
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+RELEASE = 1.0  # seconds of audio kept after the last note is released
+VELOCITY = 100
+CACHE_BYTES = 64 * 2**20
+
+
+def clip_key(bar, bpm, instrument):
+    """Returns a hashable key identifying the audio of `bar`: its MIDI keys
+    and durations, the bpm and the instrument it's rendered with."""
+    keys = tuple(() if nc is None else tuple(int(x) + 12 for x in nc)
+                 for _, _, nc in bar)
+    durations = tuple(duration for _, duration, _ in bar)
+    return keys, durations, bpm, instrument
+
+
+class ClipCache(object):
+    """An LRU cache of rendered buffers limited to `max_bytes` of audio.
+
+    Buffers are made read-only when they're stored, since they're shared
+    by every caller asking for the same clip."""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clips = OrderedDict()
+
+    def __len__(self):
+        return len(self._clips)
+
+    def __contains__(self, key):
+        return key in self._clips
+
+    def get(self, key):
+        try:
+            buf = self._clips.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._clips[key] = buf  # move to most recently used
+        self.hits += 1
+        return buf
+
+    def put(self, key, buf):
+        if buf.nbytes > self.max_bytes:
+            return
+        if key in self._clips:
+            self.nbytes -= self._clips.pop(key).nbytes
+        while self.nbytes + buf.nbytes > self.max_bytes:
+            _, old = self._clips.popitem(last=False)
+            self.nbytes -= old.nbytes
+            self.evictions += 1
+        buf.setflags(write=False)
+        self._clips[key] = buf
+        self.nbytes += buf.nbytes
+
+    def clear(self):
+        self._clips.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {"clips": len(self._clips), "bytes": self.nbytes,
+                "max_bytes": self.max_bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+    def report(self):
+        lookups = self.hits + self.misses
+        return ("audio cache: {clips} clips, {mb:.1f} / {max_mb:.1f} MB, "
+                "{hits} hits, {misses} misses ({rate:.0%} hit rate), "
+                "{evictions} evictions".format(
+                    mb=self.nbytes / 2**20, max_mb=self.max_bytes / 2**20,
+                    rate=self.hits / lookups if lookups else 0.0,
+                    **self.stats()))
+
+
+class Renderer(object):
+    """Base class for renderers.  Subclasses implement `render_events`,
+    which takes the output of `bar_events` and returns an int16 array of
+    shape (samples, 2).  `instrument` identifies the sound for caching."""
+    sample_rate = SAMPLE_RATE
+    instrument = None
+
+    def render_bar(self, bar, bpm):
+        return self.render_events(bar_events(bar, bpm))
+
+    def render_events(self, events):
+        raise NotImplementedError
+
+    def _num_samples(self, seconds):
+        return int(round(seconds * self.sample_rate))
+
+
+class FluidSynthRenderer(Renderer):
+    """Renders with FluidSynth and a SoundFont, without an audio driver.
+    Sounds the same as live playback through `mingus.midi.fluidsynth`."""
+
+    def __init__(self, sf2, gain=0.2, channel=1, sample_rate=SAMPLE_RATE):
+        from mingus.midi import pyfluidsynth  # requires FluidSynth
+        self._fs = pyfluidsynth
+        self.sample_rate = sample_rate
+        self.synth = pyfluidsynth.Synth(gain=gain, samplerate=sample_rate)
+        self.sfid = self.synth.sfload(sf2)
+        if self.sfid == -1:
+            raise IOError("Could not load sound font {}".format(sf2))
+        self.synth.program_reset()
+        self.channel = channel
+        self.instrument = ("fluidsynth", sf2, gain)
+
+    def _write(self, buf, start, stop):
+        if stop > start:
+            ptr = c_void_p(buf[start:stop].ctypes.data)
+            self._fs.fluid_synth_write_s16(self.synth.synth, stop - start,
+                                           ptr, 0, 2, ptr, 1, 2)
+
+    def render_events(self, events):
+        end = events[-1][0] + events[-1][1] if events else 0.0
+        buf = np.zeros((self._num_samples(end + RELEASE), CHANNELS),
+                       dtype=np.int16)
+        pos = 0
+        for start, length, keys in events:
+            for key in keys:
+                self.synth.noteon(self.channel, key, VELOCITY)
+            stop = self._num_samples(start + length)
+            self._write(buf, pos, stop)
+            pos = stop
+            for key in keys:
+                self.synth.noteoff(self.channel, key)
+        self._write(buf, pos, len(buf))
+        return buf
+
+
+class SineRenderer(Renderer):
+    """A small additive synth in NumPy.  Needs no SoundFont or FluidSynth,
+    which makes it handy for tests and for machines without a synth."""
+    instrument = ("sine",)
+    harmonics = (1.0, 0.5, 0.25, 0.125)
+    decay = 3.0  # amplitude decay rate (1/s) while a note is held
+    release = 12.0  # amplitude decay rate (1/s) after a note is released
+    amplitude = 0.15
+
+    def render_events(self, events):
+        end = events[-1][0] + events[-1][1] if events else 0.0
+        out = np.zeros(self._num_samples(end + RELEASE))
+        for start, length, keys in events:
+            first = self._num_samples(start)
+            held = self._num_samples(length)
+            tail = self._num_samples(RELEASE)
+            n = min(held + tail, len(out) - first)
+            t = np.arange(n) / self.sample_rate
+            envelope = np.exp(-self.decay * t)
+            envelope[held:] *= np.exp(-self.release * (t[held:] - t[held]))
+            for key in keys:
+                freq = 440.0 * 2 ** ((key - 69) / 12)
+                tone = sum(a * np.sin(2 * np.pi * k * freq * t)
+                       for k, a in enumerate(self.harmonics, 1))
+                out[first:first + n] += self.amplitude * envelope * tone
+        pcm = (np.clip(out, -1.0, 1.0) * 32767).astype(np.int16)
+        return np.repeat(pcm[:, None], CHANNELS, axis=1)
+
+
+class Mixer(object):
+    """Mixes PCM buffers into blocks of output, each buffer starting on the
+    sample it's due, so clips queued ahead follow one another exactly.
+
+    Buffers overlap freely, so a clip's release can ring on under the next
+    one, as it does with live FluidSynth.  `position` counts the samples
+    mixed so far: it's the mixer's clock."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.position = 0
+        self._lock = threading.Lock()
+        self._clips = []  # [buffer, first sample] pairs
+
+    def time(self):
+        """Returns the mixer's clock in seconds."""
+        return self.position / self.sample_rate
+
+    def play(self, buf, at=None):
+        """Mixes `buf` in from `at` seconds on the mixer's clock (or as
+        soon as possible, if that's passed or None), returning at once."""
+        with self._lock:
+            start = self.position
+            if at is not None:
+                start = max(int(round(at * self.sample_rate)), start)
+            self._clips.append([buf, start])
+
+    def stop(self):
+        with self._lock:
+            self._clips = []
+
+    def mix(self, frames):
+        """Returns the next `frames` samples of output."""
+        out = np.zeros((frames, CHANNELS), dtype=np.int32)
+        with self._lock:
+            position = self.position
+            clips = []
+            for clip in self._clips:
+                buf, start = clip
+                if start >= position + frames:
+                    clips.append(clip)  # not due yet
+                    continue
+                skip = max(position - start, 0)
+                offset = max(start - position, 0)
+                chunk = buf[skip:skip + frames - offset]
+                out[offset:offset + len(chunk)] += chunk
+                if skip + len(chunk) < len(buf):
+                    clips.append(clip)
+            self._clips = clips
+            self.position = position + frames
+        return np.clip(out, -32768, 32767)
+
+
+class BufferPlayer(Mixer):
+    """Streams finished PCM buffers to the sound card, the `Mixer`'s clock
+    running with the card's."""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        import sounddevice  # requires sounddevice (pip install sounddevice)
+        Mixer.__init__(self, sample_rate)
+        self._stream = sounddevice.OutputStream(
+            samplerate=sample_rate, channels=CHANNELS, dtype="int16",
+            callback=self._callback)
+        self._stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        outdata[:] = self.mix(frames)
+
+
+def wav_bytes(buf, sample_rate=SAMPLE_RATE):
+    """Returns `buf` encoded as a WAV file."""
+    f = io.BytesIO()
+    write_wav(f, buf, sample_rate)
+    return f.getvalue()
+
+
+def write_wav(filename, buf, sample_rate=SAMPLE_RATE):
+    w = wave.open(filename, "wb")
+    try:
+        w.setnchannels(buf.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(np.ascontiguousarray(buf, dtype=np.int16).tobytes())
+    finally:
+        w.close()
+
+
+# Module-level interface mirroring `mingus.midi.fluidsynth`
+renderer = None
+player = None
+cache = ClipCache()
+initialized = False
+_lock = threading.Lock()
+
+
+def init(sf2=None, cache_bytes=None, bank=None, play=True):
+    """Sets up the renderer and (if `play`) the player.  Returns True on
+    success.
+
+    The renderer plays notes from the sample bank file `bank` if it has
+    been extracted (see `samplebank`), otherwise it's FluidSynth with
+    `sf2`, or the SineRenderer if no sound font is given either."""
+    global renderer, player, initialized
+    if not initialized:
+        if bank:
+            import samplebank
+        if bank and samplebank.exists(bank):
+            renderer = samplebank.SampleBankRenderer(bank)
+        elif sf2:
+            renderer = FluidSynthRenderer(sf2)
+        else:
+            renderer = SineRenderer()
+        if play:
+            player = BufferPlayer(renderer.sample_rate)
+        if cache_bytes is not None:
+            cache.max_bytes = cache_bytes
+        initialized = True
+    return True
+
+
+def render_bar(bar, bpm):
+    """Returns the rendered audio for `bar`, from the cache if possible.
+    Safe to call from several threads."""
+    key = clip_key(bar, bpm, renderer.instrument)
+    with _lock:
+        buf = cache.get(key)
+        if buf is None:
+            buf = renderer.render_bar(bar, bpm)
+            cache.put(key, buf)
+    return buf
+
+
+def play_Bar(bar, channel=1, bpm=120):
+    """Plays `bar` and, like `fluidsynth.play_Bar`, returns when it's over."""
+    player.play(render_bar(bar, bpm))
+    time.sleep(sum(length for _, length, _ in bar_events(bar, bpm)))
+    return {"bpm": bpm}
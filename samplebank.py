@@ -0,0 +1,151 @@
+"""
+A memory-mapped bank of piano notes extracted from the SoundFont.
+
+Loading the whole FluidR3 SoundFont takes a while and a lot of memory, but
+EarThoseChords only ever plays one piano preset over about eight octaves.
+`extract` renders those notes once (with FluidSynth) into a raw .npy file;
+`SampleBankRenderer` then memory-maps that file and builds clips by mixing
+the recorded notes, so later sessions never load the SoundFont at all.
+
+Each note is recorded held for `max_hold` seconds, plus the release tails
+heard after shorter holds.  A note held for `h` seconds is the start of the
+long recording followed by the tail recorded for the closest hold to `h`.
+Keys outside the bank (high interval questions can go past MIDI's 127) are
+the closest recorded key, resampled to the right pitch.
+
+To extract the bank (takes a minute or so):
+
+$ python samplebank.py [sound_font.sf2] [bank.npy]
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import json, os, sys
+import numpy as np
+
+from render import Renderer, CHANNELS, RELEASE
+
+
+DEFAULT_BANK = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "fluid-soundfont", "piano_bank.npy")
+KEYS = range(24, 128)  # MIDI keys from mingus octave 1 up
+HOLDS = (0.25, 0.5, 1.0, 2.0)  # seconds held for the extra release tails
+MAX_HOLD = 4.0
+SAMPLE_RATE = 22050
+CROSSFADE = 0.01  # seconds
+
+
+def _meta_filename(filename):
+    return os.path.splitext(filename)[0] + ".json"
+
+
+def extract(sf2, filename=DEFAULT_BANK, keys=KEYS, holds=HOLDS,
+            max_hold=MAX_HOLD, sample_rate=SAMPLE_RATE):
+    """Renders every key in `keys` with FluidSynth and saves the (mono)
+    recordings to `filename`, with their layout in a .json beside it."""
+    from render import FluidSynthRenderer
+    renderer = FluidSynthRenderer(sf2, sample_rate=sample_rate)
+    hold_frames = int(round(max_hold * sample_rate))
+    tail_frames = int(round(RELEASE * sample_rate))
+
+    def record(key, hold):
+        buf = renderer.render_events([(0.0, hold, (key,))])
+        renderer.render_events([(0.0, RELEASE, ())])  # let reverb die out
+        return buf.mean(axis=1).astype(np.int16)
+
+    keys = list(keys)
+    row_frames = hold_frames + tail_frames * (1 + len(holds))
+    bank = np.lib.format.open_memmap(filename, mode="w+", dtype=np.int16,
+                                     shape=(len(keys), row_frames))
+    for i, key in enumerate(keys):
+        row = [record(key, max_hold)[:hold_frames + tail_frames]]
+        for hold in holds:
+            start = int(round(hold * sample_rate))
+            row.append(record(key, hold)[start:start + tail_frames])
+        row = np.concatenate(row)
+        bank[i, :len(row)] = row
+    bank.flush()
+    del bank
+
+    meta = {"keys": keys, "holds": list(holds) + [max_hold],
+            "max_hold": max_hold, "release": RELEASE,
+            "sample_rate": sample_rate, "sound_font": os.path.abspath(sf2)}
+    with open(_meta_filename(filename), "w") as f:
+        json.dump(meta, f)
+
+
+def exists(filename=DEFAULT_BANK):
+    return (os.path.exists(filename) and
+            os.path.exists(_meta_filename(filename)))
+
+
+class SampleBankRenderer(Renderer):
+    """Renders clips from a memory-mapped bank made by `extract`."""
+
+    def __init__(self, filename=DEFAULT_BANK):
+        with open(_meta_filename(filename)) as f:
+            meta = json.load(f)
+        self.bank = np.load(filename, mmap_mode="r")
+        self.sample_rate = meta["sample_rate"]
+        self.instrument = ("samplebank", meta["sound_font"])
+        self._rows = dict((k, i) for i, k in enumerate(meta["keys"]))
+        self._lowest, self._highest = min(self._rows), max(self._rows)
+        self._hold_frames = self._num_samples(meta["max_hold"])
+        self._tail_frames = self._num_samples(meta["release"])
+
+        # start of the release tail recorded after each hold, by hold length
+        holds = meta["holds"]
+        self._holds = np.array(holds)
+        first_tail = self._hold_frames + self._tail_frames
+        self._tail_starts = [first_tail + k * self._tail_frames
+                             for k in range(len(holds) - 1)]
+        self._tail_starts.append(self._hold_frames)
+        self._fade = np.linspace(0.0, 1.0, self._num_samples(CROSSFADE))
+
+    def note(self, key, hold):
+        """Returns the recording of `key` held for `hold` seconds."""
+        if key not in self._rows:
+            return self._shifted(key, hold)
+        row = self.bank[self._rows[key]]
+        held = min(self._num_samples(hold), self._hold_frames)
+        k = int(np.abs(self._holds - hold).argmin())
+        tail = row[self._tail_starts[k]:
+                   self._tail_starts[k] + self._tail_frames]
+        n = min(len(self._fade), self._hold_frames - held)
+        out = np.empty(held + len(tail), dtype=np.float32)
+        out[:held] = row[:held]
+        out[held:] = tail
+        out[held:held + n] = (row[held:held + n] * (1 - self._fade[:n]) +
+                              tail[:n] * self._fade[:n])
+        return out
+
+    def _shifted(self, key, hold):
+        nearest = min(max(key, self._lowest), self._highest)
+        ratio = 2 ** ((key - nearest) / 12)
+        note = self.note(nearest, hold * ratio)
+        return np.interp(np.arange(0, len(note) - 1, ratio),
+                         np.arange(len(note)), note).astype(np.float32)
+
+    def render_events(self, events):
+        end = events[-1][0] + events[-1][1] if events else 0.0
+        out = np.zeros(self._num_samples(end + RELEASE), dtype=np.float32)
+        for start, length, keys in events:
+            first = self._num_samples(start)
+            for key in keys:
+                note = self.note(key, length)[:len(out) - first]
+                out[first:first + len(note)] += note
+        pcm = np.clip(out, -32768, 32767).astype(np.int16)
+        return np.repeat(pcm[:, None], CHANNELS, axis=1)
+
+
+if __name__ == '__main__':
+    sf2 = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "fluid-soundfont",
+        "FluidR3 GM2-2.SF2")
+    filename = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_BANK
+    print("Extracting piano samples from {} to {}".format(sf2, filename))
+    extract(sf2, filename)
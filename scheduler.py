@@ -0,0 +1,163 @@
+"""
+Spaced repetition: ask what the learner knows least well, most often.
+
+Each question a mode can ask is an "item", e.g. (numeral, octave) in single
+chord mode.  Every item has a due time, counted in questions answered in
+that mode: a wrong answer makes the item due again in a couple of
+questions, while each right answer pushes it further out (by a factor, its
+"ease", that grows with right answers and shrinks with wrong ones, as in
+SM-2), up to a few passes through the question space.  Unseen items are
+spread over the first pass through the question space.  `Scheduler.next`
+returns the most overdue item from the top of a heap, so picking a
+question is O(log n) in the size of the question space.  Due times only
+change when an item is answered, so items are picked as they're asked,
+never ahead of time.
+
+Items stay due (and the model is saved) across sessions and across changes
+of settings; only the items the current settings can ask are in the heap.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import atexit, heapq, json, os, random, threading
+
+
+RELEARN_INTERVAL = 2  # questions until a missed item is asked again
+FIRST_INTERVAL = 4  # questions until an item first answered right is asked
+EASE = 2.0  # starting factor intervals grow by
+MIN_EASE, MAX_EASE = 1.3, 3.0
+MAX_INTERVAL = 3  # times the size of the question space, so that even the
+                  # best-known items come up now and then
+
+
+class ItemStats(object):
+    __slots__ = ("due", "interval", "ease", "lapses", "reviews")
+
+    def __init__(self, due, interval=0, ease=EASE, lapses=0, reviews=0):
+        self.due = due
+        self.interval = interval
+        self.ease = ease
+        self.lapses = lapses
+        self.reviews = reviews
+
+
+class Scheduler(object):
+    """Picks items to ask, per mode, from a heap ordered by due time.  If
+    `filename` is given, the model is loaded from it and saved to it at exit.
+
+    Thread-safe."""
+
+    def __init__(self, filename=None, rng=random):
+        self.filename = filename
+        self.rng = rng
+        self.clocks = {}  # questions answered, by mode
+        self.stats = {}  # (mode, item) -> ItemStats
+        self._heaps = {}  # mode -> (space, set of items, heap)
+        self._lock = threading.Lock()
+        if filename:
+            if os.path.exists(filename):
+                self.load(filename)
+            atexit.register(self.save)
+
+    def _push(self, heap, mode, item):
+        heapq.heappush(heap, (self.stats[mode, item].due, self.rng.random(),
+                              item))
+
+    def _build(self, mode, space, items):
+        items = list(items)
+        clock = self.clocks.get(mode, 0)
+        heap = []
+        for item in items:
+            if (mode, item) not in self.stats:
+                due = clock + self.rng.uniform(0, len(items))
+                self.stats[mode, item] = ItemStats(due)
+            heap.append((self.stats[mode, item].due, self.rng.random(),
+                         item))
+        heapq.heapify(heap)
+        self._heaps[mode] = (space, set(items), heap)
+        return self._heaps[mode]
+
+    def next(self, mode, space, items):
+        """Returns the most overdue item of `mode`, which stays the most
+        overdue until it's answered (see `update`).  `space` identifies the
+        current question space (e.g. the settings it depends on) and
+        `items` is a function returning all of its items, only called when
+        `space` changes."""
+        with self._lock:
+            current = self._heaps.get(mode)
+            if current is None or current[0] != space:
+                current = self._build(mode, space, items())
+            _, members, heap = current
+            if len(heap) > 4 * len(members) + 64:  # mostly stale entries
+                current = self._build(mode, space, members)
+                _, members, heap = current
+
+            while True:
+                due, _, item = heap[0]
+                if due == self.stats[mode, item].due:
+                    return item
+                heapq.heappop(heap)  # stale, rescheduled since
+
+    def update(self, mode, item, correct):
+        """Reschedules `item` after a right or wrong answer."""
+        with self._lock:
+            clock = self.clocks[mode] = self.clocks.get(mode, 0) + 1
+            stats = self.stats.get((mode, item))
+            if stats is None:
+                stats = self.stats[mode, item] = ItemStats(clock)
+            current = self._heaps.get(mode)
+            stats.reviews += 1
+            if correct:
+                if stats.interval < FIRST_INTERVAL:
+                    stats.interval = FIRST_INTERVAL
+                else:
+                    stats.interval *= stats.ease
+                stats.ease = min(stats.ease + 0.1, MAX_EASE)
+            else:
+                stats.lapses += 1
+                stats.interval = RELEARN_INTERVAL
+                stats.ease = max(stats.ease - 0.2, MIN_EASE)
+            if current is not None:
+                stats.interval = min(stats.interval, 
+                                     MAX_INTERVAL * len(current[1]))
+            stats.due = clock + stats.interval + self.rng.random()
+
+            if current is not None and item in current[1]:
+                self._push(current[2], mode, item)
+
+    def weakest(self, mode, n=10):
+        """Returns the `n` items of `mode` missed most often (relative to
+        how often they've been asked), with their stats."""
+        with self._lock:
+            seen = [(item, s) for (m, item), s in self.stats.items()
+                    if m == mode and s.reviews]
+        seen.sort(key=lambda x: (-x[1].lapses / x[1].reviews, x[1].ease))
+        return seen[:n]
+
+    def save(self, filename=None):
+        filename = filename or self.filename
+        with self._lock:
+            data = {"clocks": self.clocks,
+                    "items": [[mode, list(item), s.due, s.interval, s.ease,
+                               s.lapses, s.reviews]
+                              for (mode, item), s in self.stats.items()
+                              if s.reviews]}
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.rename(tmp, filename)  # so a crash never leaves half a file
+
+    def load(self, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        with self._lock:
+            self.clocks.update(data["clocks"])
+            for mode, item, due, interval, ease, lapses, reviews in \
+                    data["items"]:
+                self.stats[mode, tuple(item)] = ItemStats(
+                    due, interval, ease, lapses, reviews)
+            self._heaps.clear()
@@ -0,0 +1,470 @@
+#! /usr/bin/env python
+
+"""
+EarThoseChords for many learners at once, over HTTP and WebSockets.
+
+Every learner gets a session playing the usual game modes.  Sessions share
+the chord tables, the chord name index and the cache of rendered audio;
+instead of being played, each session's audio is sent to the browser as a
+list of clips (with start times), which are rendered once and served to
+everyone from /clips/.
+
+Open http://localhost:8000 in a browser to play, or use the JSON API:
+
+  POST   /sessions        {"args": [...], "mode": "interval"}, both
+                          optional; args are command-line arguments as
+                          for earthosechords.py (e.g. ["-k", "Eb", "-s"])
+  POST   /sessions/<id>   {"answer": "5"}
+  DELETE /sessions/<id>
+  GET    /clips/<id>.wav
+  GET    /stats
+  GET    /ws              a WebSocket taking the same JSON messages as the
+                          POSTs ({"args": ...} first, then {"answer": ...})
+
+Each response holds what the game printed, the clips it played, whether
+the audio playing should be stopped first, and the prompt it's waiting on.
+
+Each session has its own game state (see `game_modes.new_state`) and is
+played as a generator of prompts (see `game_modes.game`): an answer steps
+it on to its next prompt, on a small pool of worker threads shared by all
+sessions, each step with the session's own audio backend for that thread.
+No thread waits on a learner's answer, so a few workers serve hundreds of
+sessions.
+
+$ python server.py --port 8000 --synth
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import argparse, asyncio, base64, hashlib, io, json, os, struct, sys, \
+    threading, time, traceback, uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import settings as st
+import audio
+import render
+from musictools import chord_name_index
+
+
+class _ThreadOutput(object):
+    """Sends what each thread prints to that thread's buffer, if it has
+    one (so sessions' output doesn't mix), otherwise to `default`."""
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def write(self, s):
+        (getattr(self.local, "buffer", None) or self.default).write(s)
+
+    def flush(self):
+        (getattr(self.local, "buffer", None) or self.default).flush()
+
+
+class Session(object):
+    """One learner's game, stepped from one answer to the next.
+
+    `step` sends an answer (or starts the game) and returns the response,
+    once the game asks its next question."""
+
+    def __init__(self, server, args=(), mode=None):
+        from game_modes import new_state, game
+        self.server = server
+        self.id = uuid.uuid4().hex
+        self.audio = audio.ClipBackend()
+        self.last_active = time.time()
+        self.done = False
+        self._output = io.StringIO()
+        self._busy = False
+        self._closed = False
+        self._started = False
+        self._asked = None  # when the last prompt was sent
+
+        sys.stdout.local.buffer = self._output  # e.g. a bad key's warning
+        try:
+            config = st.parse(list(args))
+        except SystemExit:  # argparse has printed why
+            raise ValueError("invalid arguments: {}".format(args))
+        finally:
+            sys.stdout.local.buffer = None
+        # questions are prepared as they're asked, rather than by another
+        # thread per session
+        self.state = new_state(config._replace(PREFETCH_DEPTH=0), mode)
+        self._steps = game(self.state)
+
+    async def step(self, answer=None):
+        self.last_active = time.time()
+        if self._busy:
+            raise RuntimeError("still answering the last question")
+        if self.done:
+            return self._response(None)
+        self._busy = True
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.server.executor,
+                                              self._advance, answer)
+        finally:
+            self._busy = False
+            if self._closed:
+                self._steps.close()
+
+    def close(self):
+        self._closed = True
+        if not self._busy:
+            self._steps.close()
+
+    def _advance(self, answer):
+        """Plays the game on to its next prompt, on a worker thread."""
+        audio.use(self.audio, thread=True)
+        sys.stdout.local.buffer = self._output
+        prompt = None
+        try:
+            if self._started:
+                self.state.response_time = time.time() - self._asked
+                prompt = self._steps.send(answer)
+            else:
+                self._started = True
+                prompt = next(self._steps)
+        except (StopIteration, SystemExit):
+            self.done = True
+        except Exception:
+            traceback.print_exc(file=self._output)
+            self.done = True
+        finally:
+            sys.stdout.local.buffer = None
+            audio.use(None, thread=True)
+        self._asked = time.time()
+        return self._response(prompt and prompt.message)
+
+    def _response(self, prompt):
+        stopped, clips = self.audio.take()
+        output, self._output = self._output.getvalue(), io.StringIO()
+        return {"session": self.id, "output": output, "prompt": prompt,
+                "stop": stopped, "done": self.done,
+                "score": self.state.SCORE, "count": self.state.COUNT,
+                "audio": [{"clip": self.server.add_clip(bar, bpm),
+                           "start": start} for bar, bpm, start in clips]}
+
+
+class Server(object):
+    """Routes HTTP and WebSocket requests to sessions, stepping them on
+    `workers` threads (defaults to one per core)."""
+
+    def __init__(self, max_sessions=1000, idle_timeout=3600, max_clips=10000,
+                 workers=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_clips = max_clips
+        self.sessions = {}
+        self._clips = OrderedDict()  # clip id -> (bar, bpm)
+        self._clips_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count() or 1)
+
+    def add_clip(self, bar, bpm):
+        """Returns the id /clips/ serves the audio of `bar` under."""
+        key = render.clip_key(bar, bpm, render.renderer.instrument)
+        clip_id = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        with self._clips_lock:
+            self._clips.pop(clip_id, None)
+            self._clips[clip_id] = (bar, bpm)
+            if len(self._clips) > self.max_clips:
+                self._clips.popitem(last=False)
+        return clip_id
+
+    def clip_wav(self, clip_id):
+        with self._clips_lock:
+            bar, bpm = self._clips[clip_id]
+        return render.wav_bytes(render.render_bar(bar, bpm),
+                                render.renderer.sample_rate)
+
+    def new_session(self, args=(), mode=None):
+        if len(self.sessions) >= self.max_sessions:
+            self.reap(0)
+        session = Session(self, args, mode)
+        self.sessions[session.id] = session
+        return session
+
+    def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def reap(self, idle_timeout=None):
+        """Closes the sessions idle for longer than `idle_timeout`, or if
+        that's 0, the one idle longest."""
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        now = time.time()
+        idle = sorted((s.last_active, s.id) for s in self.sessions.values()
+                      if s.done or now - s.last_active > idle_timeout)
+        if not idle and idle_timeout == 0 and self.sessions:
+            idle = [min((s.last_active, s.id)
+                        for s in self.sessions.values())]
+        for _, session_id in idle:
+            self.close_session(session_id)
+
+    def stats(self):
+        return {"sessions": len(self.sessions), "clips": len(self._clips),
+                "cache": render.cache.stats()}
+
+    async def reaper(self):
+        while True:
+            await asyncio.sleep(60)
+            self.reap()
+
+    # HTTP
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self.websocket(reader, writer, headers)
+                    break
+                status, content_type, content = await self.route(
+                    method, path, body)
+                writer.write(
+                    "HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}"
+                    "\r\n\r\n".format(status, content_type, len(content)
+                                      ).encode("latin-1") + content)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        parts = path.split("?")[0].strip("/").split("/")
+        try:
+            if method == "GET" and parts == [""]:
+                return "200 OK", "text/html", CLIENT_HTML.encode()
+            elif method == "GET" and parts == ["stats"]:
+                return _json(self.stats())
+            elif method == "GET" and parts[0] == "clips" and len(parts) == 2:
+                loop = asyncio.get_event_loop()
+                try:
+                    wav = await loop.run_in_executor(
+                        None, self.clip_wav, parts[1].split(".")[0])
+                except KeyError:
+                    return _json({"error": "no such clip"}, "404 Not Found")
+                return "200 OK", "audio/wav", wav
+            elif method == "POST" and parts == ["sessions"]:
+                request = _request(body)
+                return _json(await self.message(None, request))
+            elif parts[0] == "sessions" and len(parts) == 2:
+                if parts[1] not in self.sessions:
+                    return _json({"error": "no such session"},
+                                 "404 Not Found")
+                if method == "DELETE":
+                    self.close_session(parts[1])
+                    return _json({"session": parts[1], "done": True})
+                request = _request(body)
+                return _json(await self.message(self.sessions[parts[1]],
+                                                request))
+        except (ValueError, SystemExit) as e:  # bad JSON or game arguments
+            return _json({"error": str(e)}, "400 Bad Request")
+        except RuntimeError as e:
+            return _json({"error": str(e)}, "409 Conflict")
+        except Exception:
+            traceback.print_exc()
+            return _json({"error": "internal error"},
+                         "500 Internal Server Error")
+        return _json({"error": "not found"}, "404 Not Found")
+
+    async def message(self, session, request):
+        """Starts a session (if `session` is None) or answers its question,
+        and returns the response."""
+        if session is None:
+            from game_modes import game_modes
+            args, mode = request.get("args", []), request.get("mode")
+            if not isinstance(args, list) or \
+                    not all(isinstance(arg, str) for arg in args):
+                raise ValueError("args must be a list of strings")
+            if mode is not None and (not isinstance(mode, str) or
+                                     mode not in game_modes):
+                raise ValueError("no such mode: {!r}".format(mode))
+            session = self.new_session(args, mode)
+            return await session.step()
+        response = await session.step(str(request.get("answer", "")))
+        if response["done"]:
+            self.sessions.pop(session.id, None)
+        return response
+
+    # WebSocket (RFC 6455, text frames only)
+    async def websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(
+            (headers["sec-websocket-key"] +
+             "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\n"
+                     b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        session = None
+        try:
+            while True:
+                opcode, payload = await _read_frame(reader)
+                if opcode == 8:  # close
+                    writer.write(_frame(8, payload))
+                    break
+                elif opcode == 9:  # ping
+                    writer.write(_frame(10, payload))
+                elif opcode == 1:
+                    try:
+                        response = await self.message(
+                            session, _request(payload))
+                        session = self.sessions.get(response["session"])
+                    except (ValueError, SystemExit, RuntimeError) as e:
+                        response = {"error": str(e)}
+                    writer.write(_frame(1, json.dumps(response).encode()))
+                await writer.drain()
+        finally:
+            if session is not None:
+                self.close_session(session.id)
+
+
+def _request(body):
+    """Returns the JSON object in `body` (a dict, {} if it's empty), or
+    raises ValueError."""
+    request = json.loads(body.decode() or "{}")
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    return request
+
+
+def _json(obj, status="200 OK"):
+    return status, "application/json", json.dumps(obj).encode()
+
+
+async def _read_frame(reader):
+    head = await reader.readexactly(2)
+    opcode, length = head[0] & 0x0f, head[1] & 0x7f
+    if length == 126:
+        length, = struct.unpack(">H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack(">Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b"\0" * 4
+    payload = await reader.readexactly(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _frame(opcode, payload):
+    if len(payload) < 126:
+        head = struct.pack(">BB", 0x80 | opcode, len(payload))
+    elif len(payload) < 2**16:
+        head = struct.pack(">BBH", 0x80 | opcode, 126, len(payload))
+    else:
+        head = struct.pack(">BBQ", 0x80 | opcode, 127, len(payload))
+    return head + payload
+
+
+CLIENT_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>EarThoseChords</title></head>
+<body style="font-family: monospace; max-width: 50em; margin: auto">
+<pre id="out" style="white-space: pre-wrap"></pre>
+<form id="form"><input id="answer" autocomplete="off" autofocus>
+<button>Answer</button></form>
+<script>
+var ctx = new AudioContext(), playing = [], buffers = {};
+var ws = new WebSocket("ws://" + location.host + "/ws");
+var out = document.getElementById("out");
+function load(clip) {
+  if (!buffers[clip]) buffers[clip] = fetch("/clips/" + clip + ".wav")
+    .then(function (r) { return r.arrayBuffer(); })
+    .then(function (b) { return ctx.decodeAudioData(b); });
+  return buffers[clip];
+}
+ws.onopen = function () { ws.send(JSON.stringify({args: []})); };
+ws.onmessage = function (e) {
+  var r = JSON.parse(e.data);
+  if (r.stop) { playing.forEach(function (s) { s.stop(); }); playing = []; }
+  Promise.all(r.audio.map(function (a) { return load(a.clip); }))
+    .then(function (bufs) {
+      var t0 = ctx.currentTime + 0.05;
+      bufs.forEach(function (buf, i) {
+        var s = ctx.createBufferSource();
+        s.buffer = buf; s.connect(ctx.destination);
+        s.start(t0 + r.audio[i].start); playing.push(s);
+      });
+    });
+  out.textContent += (r.output || "") + (r.prompt || "") + (r.error || "");
+  if (r.done) out.textContent += "\\nGoodbye!";
+  window.scrollTo(0, document.body.scrollHeight);
+};
+document.getElementById("form").onsubmit = function (e) {
+  e.preventDefault(); ctx.resume();
+  var a = document.getElementById("answer");
+  out.textContent += a.value + "\\n";
+  ws.send(JSON.stringify({answer: a.value})); a.value = "";
+};
+</script></body></html>
+"""
+
+
+def setup(sf2=None, bank=None, cache_bytes=None):
+    """Prepares the game for serving sessions (call once, before making a
+    `Server`): sets up the renderer and the shared tables, and sends what
+    each session prints to that session."""
+    render.init(sf2, cache_bytes, bank=bank, play=False)
+    chord_name_index()
+    if not isinstance(sys.stdout, _ThreadOutput):
+        sys.stdout = _ThreadOutput(sys.stdout)
+
+
+def serve(host="127.0.0.1", port=8000, sf2=None, bank=None,
+          cache_bytes=None, **kwargs):
+    """Runs the server until interrupted."""
+    setup(sf2, bank, cache_bytes)
+    server = Server(**kwargs)
+
+    async def main():
+        listener = await asyncio.start_server(server.handle, host, port)
+        asyncio.ensure_future(server.reaper())
+        print("Serving EarThoseChords on http://{}:{}".format(host, port))
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('-f', '--sound_font', default=st.DEFAULT_SOUNDFONT,
+                        help="Sound font to render with, if there's no "
+                             "sample bank (see samplebank.py).")
+    parser.add_argument('-b', '--sample_bank', default=st.DEFAULT_SAMPLE_BANK)
+    parser.add_argument('--synth', action='store_true', default=False,
+                        help="Render with a simple built-in synth instead.")
+    parser.add_argument('--max_sessions', type=int, default=1000)
+    parser.add_argument('--idle_timeout', type=float, default=3600,
+                        help="Seconds before an idle session is closed.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Threads to play sessions' questions on "
+                             "(defaults to one per core).")
+    args = parser.parse_args()
+    if args.synth:
+        args.sound_font = args.sample_bank = None
+    serve(args.host, args.port, args.sound_font, args.sample_bank,
+          st.AUDIO_CACHE_MB * 2**20, max_sessions=args.max_sessions,
+          idle_timeout=args.idle_timeout, workers=args.workers)
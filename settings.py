@@ -4,11 +4,24 @@ try: input = raw_input
 except: pass
 
 # External Dependencies
-import argparse, os
-import mingus.core.notes as notes
+import os
+from collections import namedtuple
 
 
-def get_user_args():
+DEFAULT_SOUNDFONT = os.path.join(os.path.dirname(__file__), 
+                                 "fluid-soundfont", "FluidR3 GM2-2.SF2")
+DEFAULT_SAMPLE_BANK = os.path.join(os.path.dirname(__file__), 
+                                   "fluid-soundfont", "piano_bank.npy")
+DEFAULT_HISTORY = os.path.join(os.path.expanduser("~"), 
+                               ".earthosechords_history.sqlite")
+DEFAULT_SCHEDULE = os.path.join(os.path.expanduser("~"), 
+                                ".earthosechords_schedule.json")
+AUDIO_BACKENDS = ["fluidsynth", "render", "synth", "wav", "null"]
+
+
+def get_user_args(args=None):
+    """Parses `args` (defaults to `sys.argv[1:]`)."""
+    import argparse
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -41,53 +54,208 @@ def get_user_args():
 
     parser.add_argument(
         '-f', '--sound_font',
-        action='store_true',
-        default=os.path.join(os.path.dirname(__file__), "fluid-soundfont", 
-                "FluidR3 GM2-2.SF2"),
+        default=DEFAULT_SOUNDFONT,
         help=("You can use this flag to specify a sound font (.sf2) file. "
-              "By default ")
+              "By default the FluidR3 GM2 sound font is used.")
+        )
+
+    parser.add_argument(
+        '-b', '--sample_bank',
+        default=DEFAULT_SAMPLE_BANK,
+        help=("Piano samples extracted from the sound font by running "
+              "samplebank.py.  If this file exists, the -r flag will play "
+              "these instead of loading the sound font.")
         )
 
     parser.add_argument(
         '-d', '--delay',
-        action='store_true',
+        type=float,
         default=1.0,
         help=("Use this flag to specify the delay between chords.")
         )
 
-    return parser.parse_args()
+    parser.add_argument(
+        '-r', '--render',
+        action='store_true',
+        default=False,
+        help=("If this flag is included, audio will be rendered ahead of "
+              "time and streamed to the sound card (requires numpy and "
+              "sounddevice), instead of played by FluidSynth in real time.  "
+              "Same as '-a render'.")
+        )
 
+    parser.add_argument(
+        '-a', '--audio',
+        choices=AUDIO_BACKENDS,
+        default=None,
+        help=("How to play audio: live with FluidSynth (the default), "
+              "rendered ahead of time ('render', see -r), with a simple "
+              "built-in synth ('synth', requires numpy and sounddevice), "
+              "written to a WAV file ('wav', see --wav_file) or not at all "
+              "('null').")
+        )
 
-# Setup settings for use in other modules
-user_args = get_user_args()
-SOUNDFONT = user_args.sound_font
+    parser.add_argument(
+        '--wav_file', '--wav-file',
+        default="earthosechords.wav",
+        help="The file written with '-a wav'."
+        )
 
-if user_args.minor:
-    KEY = user_args.key.lower()
-else:
-    KEY = user_args.key.upper()
+    parser.add_argument(
+        '--progressions',
+        default="uniform",
+        help=("How progression mode picks its chords: 'uniform' (any chord "
+              "but the last, equally likely), 'functional' (mostly the "
+              "usual moves of functional harmony), or a file of example "
+              "progressions to learn from, one per line (e.g. 'I vi IV "
+              "V').  See progressions.py.")
+        )
 
-if user_args.sevenths:
-    [I, II, III, IV, V, VI, VII] = ["I7", "II7", "III7", "IV7", "V7", "VI7", 
-                                    "VII7"]
-    TONES = [1, 3, 5, 7]
-else:
-    [I, II, III, IV, V, VI, VII] = ["I", "II", "III", "IV", "V", "VI", "VII"]
-    TONES = [1, 3, 5]
+    parser.add_argument(
+        '--history',
+        nargs='?',
+        const=DEFAULT_HISTORY,
+        default=None,
+        help=("Save every answer to this file (to {} if no file is "
+              "given).  See history.py to summarize it."
+              "".format(DEFAULT_HISTORY))
+        )
 
-CADENCE = [I, IV, V, I]
-NUMERALS = [I, II, III, IV, V, VI, VII]
+    parser.add_argument(
+        '--schedule',
+        nargs='?',
+        const=DEFAULT_SCHEDULE,
+        default=None,
+        help=("Ask the questions you get wrong more often, saving how well "
+              "you know each one to this file (to {} if no file is given).  "
+              "Otherwise questions are uniformly random."
+              "".format(DEFAULT_SCHEDULE))
+        )
 
-if not notes.is_valid_note(KEY):
-    print("ATTENTION: User-input key, {}, not valid, using C Major "
-            "instead.".format(KEY))
-    KEY = "C"
+    parser.add_argument(
+        '--timing',
+        action='store_true',
+        default=False,
+        help="If this flag is included, each phase of every question is "
+             "timed, and histograms of the timings are printed on quitting "
+             "(or with the l command).  See timing.py."
+        )
 
-# Other user args
-MANY_OCTAVES = user_args.many_octaves
+    parser.add_argument(
+        '--profile_startup', '--profile-startup',
+        action='store_true',
+        default=False,
+        help="If this flag is included, a breakdown of the time spent "
+             "importing and initializing each part of the game is printed."
+        )
+
+    user_args = parser.parse_args(args)
+
+    # load the progression model now, so a bad corpus file is reported here
+    # rather than when progression mode first needs it
+    import progressions
+    try:
+        progressions.model(user_args.progressions)
+    except (IOError, OSError, ValueError) as e:
+        parser.error("--progressions {}: {}".format(user_args.progressions, e))
+    return user_args
+
+
+def parse(args=None):
+    """Returns the `Config` for the command-line arguments `args` (defaults
+    to `sys.argv[1:]`): the defaults below, changed as the arguments say.
+    Changes nothing, so it's safe to call for many sessions at once."""
+    user_args = get_user_args(args)
+    SOUNDFONT = user_args.sound_font
+
+    if user_args.minor:
+        KEY = user_args.key.lower()
+    else:
+        KEY = user_args.key[:1].upper() + user_args.key[1:]
+
+    if user_args.sevenths:
+        [I, II, III, IV, V, VI, VII] = ["I7", "II7", "III7", "IV7", "V7", 
+                                        "VI7", "VII7"]
+        TONES = [1, 3, 5, 7]
+    else:
+        [I, II, III, IV, V, VI, VII] = ["I", "II", "III", "IV", "V", "VI", 
+                                        "VII"]
+        TONES = [1, 3, 5]
+
+    CADENCE = [I, IV, V, I]
+    NUMERALS = [I, II, III, IV, V, VI, VII]
+
+    import mingus.core.notes as notes
+    if not notes.is_valid_note(KEY[0].upper() + KEY[1:]):
+        print("ATTENTION: User-input key, {}, not valid, using C Major "
+                "instead.".format(KEY))
+        KEY = "C"
+
+    # Other user args
+    MANY_OCTAVES = user_args.many_octaves
+    BPM = 60 * user_args.delay
+    if user_args.audio:
+        AUDIO_BACKEND = user_args.audio
+    elif user_args.render:
+        AUDIO_BACKEND = "render"
+    else:
+        AUDIO_BACKEND = "fluidsynth"
+    WAV_FILE = user_args.wav_file
+    SAMPLE_BANK = user_args.sample_bank
+    HISTORY_FILE = user_args.history
+    SCHEDULE_FILE = user_args.schedule
+    PROFILE_STARTUP = user_args.profile_startup
+    TIMING = user_args.timing
+    PROGRESSIONS = user_args.progressions
+
+    return _defaults._replace(
+        SOUNDFONT=SOUNDFONT, KEY=KEY, I=I, II=II, III=III, IV=IV, V=V, VI=VI,
+        VII=VII, TONES=tuple(TONES), CADENCE=tuple(CADENCE),
+        NUMERALS=tuple(NUMERALS), MANY_OCTAVES=MANY_OCTAVES, BPM=BPM,
+        AUDIO_BACKEND=AUDIO_BACKEND, WAV_FILE=WAV_FILE,
+        SAMPLE_BANK=SAMPLE_BANK, HISTORY_FILE=HISTORY_FILE,
+        SCHEDULE_FILE=SCHEDULE_FILE, PROFILE_STARTUP=PROFILE_STARTUP,
+        TIMING=TIMING, PROGRESSIONS=PROGRESSIONS)
+
+
+def init(args=None):
+    """Sets up the settings below from the command-line arguments `args`
+    (see `parse`), for the code that reads them from this module, and
+    returns them as a `Config`.  Nothing is parsed until this is called,
+    so importing `settings` has no side effects."""
+    config = parse(args)
+    globals().update(config._asdict())
+    return config
+
+
+def config():
+    """Returns the settings below as they are now, as a `Config`."""
+    return Config(*[_frozen(globals()[name]) for name in Config._fields])
+
+
+def _frozen(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+# Defaults, used until `init` is called
+SOUNDFONT = DEFAULT_SOUNDFONT
+KEY = "C"
+[I, II, III, IV, V, VI, VII] = ["I", "II", "III", "IV", "V", "VI", "VII"]
+TONES = [1, 3, 5]
+CADENCE = [I, IV, V, I]
+NUMERALS = [I, II, III, IV, V, VI, VII]
+MANY_OCTAVES = False
 # DELAY = user_args.delay
 PROGRESSION_MODE = False
-BPM = 60 * user_args.delay
+BPM = 60
+AUDIO_BACKEND = "fluidsynth"  # see `musictools.make_backend`
+WAV_FILE = "earthosechords.wav"
+SAMPLE_BANK = DEFAULT_SAMPLE_BANK
+HISTORY_FILE = None  # no answers are saved unless set
+SCHEDULE_FILE = None  # questions are uniformly random unless set
+PROFILE_STARTUP = False
+TIMING = False  # see `timing`
+PROGRESSIONS = "uniform"  # see `progressions`
 
 # Other args that should be user-adjustable, but aren't yet
 PROG_LENGTHS = range(2, 5)  # Number of strums in a progression
@@ -104,11 +272,16 @@ DEFAULT_IOCTAVE = 4
 INITIAL_MODE = 'interval'
 FIXED_ROOT = 0  # Fix root of interval, 0 for unfixed
 NAME_INTERVAL = False
+STOP_AUDIO_ON_ANSWER = True  # cut off the question's audio when answered
+PREFETCH_DEPTH = 3  # questions prepared ahead of time, 0 to disable
+AUDIO_CACHE_MB = 64  # memory for rendered clips (with the -r flag)
+
+ALTERNATIVE_CHORD_TONE_RESOLUTION = 2
+
 
-# Inelegant storage
-NEWQUESTION = True
-CURRENT_MODE = None
-CURRENT_Q_INFO = None
-SCORE = 0
-COUNT = 0
-ALTERNATIVE_CHORD_TONE_RESOLUTION = 2
\ No newline at end of file
+# Every setting above, as an immutable record.  Each game session starts
+# from one (see `game_structure.GameState`), so sessions never share what
+# they change.
+Config = namedtuple("Config", sorted(
+    name for name in list(globals()) if name.isupper()))
+_defaults = config()
\ No newline at end of file
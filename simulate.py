@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+
+"""
+Headless simulation of EarThoseChords sessions.
+
+Plays any game mode without a terminal or a synth: answers come from an
+answer source instead of the keyboard and audio is switched off.  Reports
+questions per second and the latency of each phase of a question:
+
+  setup     from the start of a question to its prompt (picking the
+            question, building its chords and queuing its audio)
+  answer    time spent in the answer source
+  evaluate  from the answer to the end of the question (grading and
+            queuing the resolution)
+
+Answer sources are "correct" (always right), "random" (a random answer of
+the right form) or the name of a file with one answer (or menu command) per
+line.  Game settings can be given as for earthosechords.py, e.g.
+
+$ python simulate.py --mode interval --questions 10000 --answers random -k Eb
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import argparse, json, os, random, sys, time
+
+import settings as st
+import audio
+from musictools import INTERVAL_NAMES
+
+
+PHASES = ("setup", "answer", "evaluate")
+
+
+class EndOfAnswers(Exception):
+    pass
+
+
+class CorrectAnswers(object):
+    def __call__(self, state, message, single_key):
+        from game_modes import correct_answer
+        return correct_answer(state)
+
+
+class RandomAnswers(object):
+    """Answers of the right form (numbers of the right count), at random."""
+    def __init__(self, rng=random):
+        self.rng = rng
+
+    def __call__(self, state, message, single_key):
+        mode, q = state.CURRENT_MODE.name, state.CURRENT_Q_INFO
+        degree = lambda: str(self.rng.randint(1, 7))
+        if mode == 'single_chord':
+            return degree()
+        elif mode == 'progression':
+            return " ".join(degree() for _ in q['prog'])
+        elif mode == 'chord_tone':
+            return str(self.rng.choice(state.TONES))
+        elif state.NAME_INTERVAL:
+            return self.rng.choice(INTERVAL_NAMES)
+        return degree() + " " + degree()
+
+
+class ScriptedAnswers(object):
+    """Answers read from a file, one per line."""
+    def __init__(self, filename):
+        with open(filename) as f:
+            self.answers = [line.rstrip("\n") for line in f]
+        self.position = 0
+
+    def __call__(self, state, message, single_key):
+        if self.position >= len(self.answers):
+            raise EndOfAnswers
+        self.position += 1
+        return self.answers[self.position - 1]
+
+
+class TimedAnswers(object):
+    """Wraps an answer source, timing the first prompt of a question and
+    the time spent answering."""
+    def __init__(self, source):
+        self.source = source
+        self.reset()
+
+    def reset(self):
+        self.prompted = None
+        self.answering = 0.0
+
+    def __call__(self, state, message, single_key):
+        start = time.perf_counter()
+        if self.prompted is None:
+            self.prompted = start
+        try:
+            return self.source(state, message, single_key)
+        finally:
+            self.answering += time.perf_counter() - start
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(p / 100 * len(sorted_values)))]
+
+
+def summarize(seconds):
+    us = sorted(1e6 * x for x in seconds)
+    return {"mean_us": sum(us) / len(us) if us else 0.0,
+            "p50_us": percentile(us, 50), "p90_us": percentile(us, 90),
+            "p99_us": percentile(us, 99), "max_us": us[-1] if us else 0.0}
+
+
+def simulate(mode, questions, source, state):
+    """Plays `questions` questions of `mode` answered by `source` (or until
+    a scripted source runs out or quits) in the game `state` (see
+    `game_modes.new_state`).  Returns a dict of results."""
+    from game_modes import game_modes
+
+    audio.use(audio.NullBackend())
+    timed = TimedAnswers(source)
+    state.ANSWER_SOURCE = timed
+    state.CURRENT_MODE = game_modes[mode]
+    state.NEWQUESTION = True
+    state.SCORE = state.COUNT = 0
+    state.prefetcher.invalidate()
+
+    phases = dict((phase, []) for phase in PHASES)
+    asked = 0
+    devnull = open(os.devnull, "w")
+    stdout, sys.stdout = sys.stdout, devnull
+    start = time.perf_counter()
+    try:
+        while asked < questions:
+            if state.NEWQUESTION:
+                asked += 1
+            timed.reset()
+            t0 = time.perf_counter()
+            try:
+                state.CURRENT_MODE.new_question(state)
+            except (EndOfAnswers, SystemExit):  # out of answers, or quit
+                break
+            total = time.perf_counter() - t0
+            setup = (timed.prompted or t0 + total) - t0
+            phases["setup"].append(setup)
+            phases["answer"].append(timed.answering)
+            phases["evaluate"].append(total - setup - timed.answering)
+    finally:
+        elapsed = time.perf_counter() - start
+        sys.stdout = stdout
+        devnull.close()
+        state.ANSWER_SOURCE = None
+
+    count = state.COUNT
+    return {"mode": mode, "questions": count, "score": state.SCORE,
+            "calls": len(phases["setup"]), "seconds": elapsed,
+            "questions_per_second": count / elapsed if elapsed else 0.0,
+            "phases": dict((p, summarize(t)) for p, t in phases.items())}
+
+
+def report(results):
+    print("{mode}: {questions} questions in {seconds:.2f} s "
+          "({questions_per_second:.0f} questions/s), "
+          "score {score}/{questions}".format(**results))
+    print("  {:<10} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "phase", "mean us", "p50 us", "p90 us", "p99 us", "max us"))
+    for phase in PHASES:
+        print("  {:<10} {mean_us:>10.1f} {p50_us:>10.1f} {p90_us:>10.1f} "
+              "{p99_us:>10.1f} {max_us:>10.1f}".format(
+                  phase, **results["phases"][phase]))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[1],
+        epilog="Other arguments are passed on to the game's settings.")
+    parser.add_argument('--mode', action='append',
+                        choices=['single_chord', 'progression', 'chord_tone',
+                                 'interval'],
+                        help="Game mode to play (may be repeated, defaults "
+                             "to all of them).")
+    parser.add_argument('--questions', type=int, default=1000,
+                        help="Questions to play in each mode.")
+    parser.add_argument('--answers', default="correct",
+                        help='"correct", "random" or a file of answers.')
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for picking questions and answers, so "
+                             "a run can be repeated exactly (questions are "
+                             "then never prepared ahead).")
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help="Questions to prepare ahead (defaults to the "
+                             "game's setting, or 0 with --seed).")
+    parser.add_argument('--output',
+                        help="JSON file to write the results to.")
+    parser.add_argument('--history',
+                        help="Save the answers to this history file (see "
+                             "history.py), as the game does.")
+    parser.add_argument('--schedule', nargs='?', const="",
+                        help="Pick questions with the spaced-repetition "
+                             "scheduler, saving it to this file if given.")
+    user_args, game_args = parser.parse_known_args(args)
+    if user_args.seed is not None:
+        # the prefetch thread would draw from the same rng as the game, in
+        # whatever order the two threads get to it
+        if user_args.prefetch:
+            parser.error("--seed can't be used with --prefetch")
+        user_args.prefetch = 0
+
+    config = st.init(game_args)
+    if user_args.prefetch is not None:
+        config = config._replace(PREFETCH_DEPTH=user_args.prefetch)
+    from game_modes import new_state
+    state = new_state(config, seed=user_args.seed)
+    rng = random.Random(user_args.seed)  # for random answers
+
+    if config.TIMING:
+        import timing
+        timing.enabled = True
+
+    if user_args.history:
+        import history
+        state.answer_log = history.AnswerLog(user_args.history)
+
+    if user_args.schedule is not None:
+        import scheduler
+        state.scheduler = scheduler.Scheduler(
+            user_args.schedule, rng=random.Random(user_args.seed))
+
+    all_results = []
+    for mode in user_args.mode or ['single_chord', 'progression',
+                                   'chord_tone', 'interval']:
+        if user_args.answers == "correct":
+            source = CorrectAnswers()
+        elif user_args.answers == "random":
+            source = RandomAnswers(rng)
+        else:
+            source = ScriptedAnswers(user_args.answers)
+        results = simulate(mode, user_args.questions, source, state)
+        report(results)
+        all_results.append(results)
+
+    if config.TIMING:
+        print("Time spent in each phase of a question:")
+        print(timing.report())
+
+    if user_args.history:
+        state.answer_log.close()
+
+    if user_args.output:
+        with open(user_args.output, "w") as f:
+            json.dump(all_results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
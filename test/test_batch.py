@@ -0,0 +1,82 @@
+import numpy as np
+
+import batch
+import progressions
+import settings as st
+from game_modes import new_state, correct_answer
+from musictools import random_chord, progression_chords, Diatonic
+
+
+def midi(notes):
+    return tuple(int(x) + 12 for x in notes)
+
+
+def test_seeded():
+    config = st.config()
+    for mode in batch.MODES:
+        a = batch.questions(config, mode, 100, seed=1)
+        assert (a == batch.questions(config, mode, 100, seed=1)).all()
+        assert not (a == batch.questions(config, mode, 100, seed=2)).all()
+
+
+def test_chords_match_game():
+    state = new_state(st.parse(['-o', '-s']), 'chord_tone')
+    keys = ('C', 'eb', 'F#')
+    for q in batch.questions(state, 'chord_tone', 500, seed=0, keys=keys):
+        state.KEY = str(q['key'])
+        numeral = state.NUMERALS[q['numeral']]
+        _, chord, Ioctave = random_chord(state, numeral, q['octave'])
+        assert midi(chord) == tuple(q['notes'][:len(chord)])
+        assert chord[0].octave == q['octave']
+        assert Ioctave == q['Ioctave']
+        state.CURRENT_Q_INFO = {'chord': chord, 'tone': chord[q['tone']]}
+        assert correct_answer(state) == str(q['answer'])
+    assert set(np.unique(batch.questions(state, 'chord_tone', 500, seed=0,
+                                         keys=keys)['key'])) == set(keys)
+
+
+def test_intervals_match_game():
+    state = new_state(st.parse(['-k', 'Eb', '-o']), 'interval')
+    state.INTERVAL_MODE = 'mixed'
+    for q in batch.questions(state, 'interval', 500, seed=0):
+        diatonic = Diatonic.for_key(state.KEY, int(q['Ioctave']))
+        low, high = (diatonic.num2note(int(d)) for d in q['answer'])
+        interval = diatonic.interval(int(q['number']),
+                                     root=low if q['ascending'] else high,
+                                     ascending=bool(q['ascending']))
+        if len(interval) == 1:
+            assert q['notes'][1] - q['notes'][0] == 12
+        else:
+            assert midi(interval) == tuple(q['notes'])
+        assert q['semitones'] == q['notes'][1] - q['notes'][0]
+
+
+def test_progressions_match_game():
+    state = new_state(st.config(), 'progression')
+    q = batch.questions(state, 'progression', 10000, seed=0)
+    for p in q[:500]:
+        prog = [state.NUMERALS[i] for i in p['numerals'][:p['chords']]]
+        assert all(a != b for a, b in zip(prog, prog[1:]))
+        assert (p['numerals'][p['chords']:] == -1).all()
+        assert [midi(c) for c in progression_chords(prog, state.KEY)] == \
+            [tuple(x for x in n if x >= 0) for n in p['notes'][:p['chords']]]
+        assert min(p['strums'][:p['chords']]) >= 1
+
+    assert set(q['strums'].sum(axis=1)) == set(state.PROG_LENGTHS)
+    counts = np.bincount(q['numerals'][:, 0], minlength=7) / len(q)
+    assert abs(counts - 1/7).max() < 0.02
+
+
+def test_progression_models():
+    state = new_state(st.config()._replace(PROGRESSIONS='functional'),
+                      'progression')
+    model = progressions.model('functional')
+    q = batch.questions(state, 'progression', 20000, seed=0)
+    first = np.bincount(q['numerals'][:, 0], minlength=7) / len(q)
+    assert abs(first - np.asarray(model.start) / sum(model.start)).max() \
+        < 0.02
+    after_V = q['numerals'][:, 1][q['numerals'][:, 0] == 4]
+    after_V = after_V[after_V >= 0]  # some are only one chord long
+    assert abs(np.bincount(after_V, minlength=7) / len(after_V) -
+               np.asarray(model.transitions[4]) / 
+               sum(model.transitions[4])).max() < 0.03
@@ -0,0 +1,50 @@
+import csv, os
+
+import export
+import settings as st
+from game_modes import new_state
+
+
+def test_drill_pack(tmpdir):
+    out = str(tmpdir)
+    files, seconds = export.export(new_state(st.config()), out, number=1,
+                                   modes=['chord_tone'], jobs=1)
+    assert files == 2 * 24  # a cadence and a question per key
+
+    with open(os.path.join(out, "answers.csv")) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 24
+    for row in rows:
+        assert os.path.exists(os.path.join(out, row["file"]))
+        assert row["answer"] == row["question"].split()[1]
+
+
+def test_midi(tmpdir):
+    import struct
+    filename = str(tmpdir.join("drills.mid"))
+    state = new_state(st.config())
+    assert export.export_midi(state, filename, 3, cadence=True,
+                              resolve=True) == 13
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"MThd" and data[14:18] == b"MTrk"
+    assert struct.unpack(">I", data[18:22])[0] == len(data) - 22
+    assert data.endswith(b"\xff\x2f\x00")
+    assert data.count(b"\xff\x06") == 13  # a marker per passage
+
+
+def test_midi_keys_out_of_range(tmpdir):
+    import io, pytest
+    import midifile
+    with pytest.raises(ValueError):
+        midifile.MidiWriter(io.BytesIO()).note_on(0, 130)
+
+    filename = str(tmpdir.join("high.mid"))
+    midifile.write_passages(filename, [("7 7", [(0.0, 1.0, (60, 130))])],
+                            120)
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert b"\x90\x3c" in data
+    assert b"\x90\x76\x64" in data  # 130, an octave down
+    assert b"\x82" not in data
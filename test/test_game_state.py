@@ -0,0 +1,41 @@
+import threading
+
+import settings as st
+from game_modes import new_state, correct_answer
+
+
+def play(key, seed, questions=200):
+    """Plays `questions` single chord questions in `key`, answering them
+    right, and returns the chords asked and the score."""
+    config = st.config()._replace(KEY=key, PREFETCH_DEPTH=0)
+    state = new_state(config, 'single_chord', seed)
+    asked = []
+
+    def answer(state, message, single_key):
+        asked.append(" ".join(n.name for n in state.CURRENT_Q_INFO['chord']))
+        return correct_answer(state)
+
+    state.ANSWER_SOURCE = answer
+    for _ in range(questions):
+        state.CURRENT_MODE.new_question(state)
+    return asked, state.SCORE
+
+
+def test_sessions_in_parallel():
+    games = [("C", 1), ("F#", 1), ("eb", 2)]
+    expected = [play(key, seed) for key, seed in games]
+    assert expected[0][1] == 200
+    assert expected[0][0] != expected[1][0]  # same numerals, other key
+
+    results = [None] * len(games)
+
+    def run(i):
+        results[i] = play(*games[i])
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(games))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
@@ -0,0 +1,45 @@
+import asyncio, os
+
+import pytest
+
+from getch import KeyReader
+
+
+@pytest.fixture
+def keys():
+    read, write = os.pipe()
+    reader = KeyReader(read)
+    yield reader, lambda data: os.write(write, data)
+    reader.close()
+    os.close(read)
+    os.close(write)
+
+
+def test_keys(keys):
+    reader, type_ = keys
+    assert reader.get(timeout=0) is None
+    type_("5\x1b[Aé".encode("utf-8"))
+    assert reader.poll() == 3
+    assert [reader.get(), reader.get(), reader.get()] == ["5", "\x1b[A", "é"]
+
+
+def test_readline(keys, capsys):
+    reader, type_ = keys
+    type_(b"1 4x\x7f5\nv")
+    assert reader.readline("> ", commands=["v"]) == "1 45"
+    assert reader.readline("> ", commands=["v"]) == "v"
+    assert capsys.readouterr().out == "> > "  # not a terminal, so no echo
+
+
+def test_async(keys):
+    reader, type_ = keys
+
+    async def read():
+        asyncio.get_event_loop().call_later(0.01, type_, b"ab")
+        got = []
+        async for key in reader:
+            got.append(key)
+            if len(got) == 2:
+                return got
+
+    assert asyncio.run(read()) == ["a", "b"]
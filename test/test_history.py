@@ -0,0 +1,14 @@
+import history
+
+
+def test_answers_are_saved(tmpdir):
+    filename = str(tmpdir.join("history.sqlite"))
+    log = history.AnswerLog(filename, batch_size=2)
+    log.record("single_chord", "C", "V", 4, "5", True, 1.5)
+    log.record("single_chord", "C", "V", 4, "4", False, 0.5)
+    log.record("interval", "C", "1 3", 4, "1 3", True)
+    log.close()
+
+    rows = history.summary(filename)
+    assert rows == [("interval", "C", "1 3", 1, 1, None),
+                    ("single_chord", "C", "V", 2, 1, 1000.0)]
@@ -1,15 +1,44 @@
-from musictools import *
-d = Diatonic('C')
-a = d.num2note(6)
-bla = [d.interval(x,a,ascending=True) for x in range(2,20)]
-bla2 = [x[1] for x in bla]
-for y in [(x, n, int(n), d.note2num(n))  for x, n in enumerate(bla2)]:
-    print y
-
-from musictools import *
-d = Diatonic('C')
-a = d.num2note(6)
-bla = [d.interval(x,a,ascending=False) for x in range(2,20)]
-bla2 = [x[0] for x in bla]
-for y in [(x, n, int(n), d.note2num(n))  for x, n in enumerate(bla2)]:
-    print y
\ No newline at end of file
+from musictools import Diatonic, IntervalTable, INTERVAL_NAMES
+
+
+def test_ascending_intervals():
+    d = Diatonic('C')
+    a = d.num2note(6)
+    bla = [d.interval(x, a, ascending=True) for x in range(2, 20)]
+    bla2 = [x[1] for x in bla]
+    for x, n in enumerate(bla2):
+        assert d.note2num(n) == (6 + x) % 7 + 1
+        assert int(n) > int(a)
+    assert [int(n) for n in bla2] == sorted(int(n) for n in bla2)
+
+
+def test_descending_intervals():
+    d = Diatonic('C')
+    a = d.num2note(6)
+    bla = [d.interval(x, a, ascending=False) for x in range(2, 20)]
+    bla2 = [x[0] for x in bla]
+    for x, n in enumerate(bla2):
+        assert d.note2num(n) == (4 - x) % 7 + 1
+        assert int(n) < int(a)
+    assert [int(n) for n in bla2] == sorted((int(n) for n in bla2),
+                                            reverse=True)
+
+
+def test_interval_table():
+    table = IntervalTable.for_key('Eb', 3)
+    assert IntervalTable.for_key('Eb', 3) is table
+    d = Diatonic.for_key('Eb', 3)
+    for number in range(1, 20):
+        for root in range(1, 8):
+            for ascending in (True, False):
+                q = table.question(number, root, ascending)
+                notes = d.interval(number, d.notes[root - 1], ascending)
+                if number == 1:
+                    assert int(q.notes[1]) - int(q.notes[0]) == 12
+                else:
+                    assert [int(n) for n in q.notes] == \
+                        [int(n) for n in notes]
+                assert q.answer == " ".join(str(d.note2num(n)) 
+                                            for n in q.notes)
+                assert q.name == INTERVAL_NAMES[
+                    (int(q.notes[1]) - int(q.notes[0])) % 12]
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+import progressions
+from progressions import ProgressionModel
+
+
+NUMERALS = ['I', 'II', 'III', 'IV', 'V', 'VI', 'VII']
+
+
+@pytest.mark.parametrize('name', sorted(progressions.PRESETS))
+def test_progression(name):
+    model = progressions.model(name)
+    rng = random.Random(0)
+    for number_strums in range(1, 30):
+        prog, prog_strums = model.progression(number_strums, NUMERALS,
+                                              [1, 2, 3], rng)
+        assert len(prog_strums) == number_strums
+        assert all(a != b for a, b in zip(prog, prog[1:]))
+        assert [a for i, a in enumerate(prog_strums)
+                if not i or a != prog_strums[i - 1]] == prog
+
+
+def test_from_corpus():
+    corpus = ["I IV V I  # plagal, then authentic", "", "ii7 V7 V7 I",
+              "1 6 4 5"]
+    model = ProgressionModel.from_corpus(corpus, smoothing=0)
+    assert model.start == [2, 1, 0, 0, 0, 0, 0]
+    assert model.transitions[4] == [2, 0, 0, 0, 0, 0, 0]
+    assert model.transitions[3] == [0, 0, 0, 0, 2, 0, 0]
+    assert model.progression(3, NUMERALS, rng=random.Random(1))[0] in (
+        ['I', 'IV', 'V'], ['I', 'VI', 'IV'], ['II', 'V', 'I'])
+
+    with pytest.raises(ValueError):
+        ProgressionModel.from_corpus(["I IV X"])
+
+
+def test_bad_corpus_is_an_argument_error(tmpdir):
+    import settings
+    corpus = tmpdir.join("corpus.txt")
+    corpus.write("I IV V\nI foo\n")
+    for name in (str(corpus), str(tmpdir.join("missing.txt"))):
+        with pytest.raises(SystemExit):
+            settings.parse(["--progressions", name])
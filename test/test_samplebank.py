@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+
+import samplebank
+from render import RELEASE
+
+
+def make_bank(filename, keys, sample_rate=1000, max_hold=1.0):
+    """Saves a bank of sine waves, one for each of `keys`."""
+    holds = [0.5, max_hold]
+    frames = int(round(max_hold * sample_rate)) + \
+        int(round(RELEASE * sample_rate)) * len(holds)
+    t = np.arange(frames) / sample_rate
+    bank = [1000 * np.sin(2 * np.pi * 440 * 2 ** ((k - 69) / 12) * t)
+            for k in keys]
+    np.save(filename, np.array(bank, np.int16))
+    with open(filename[:-len(".npy")] + ".json", "w") as f:
+        json.dump({"keys": list(keys), "holds": holds, "max_hold": max_hold,
+                   "release": RELEASE, "sample_rate": sample_rate,
+                   "sound_font": "test"}, f)
+
+
+def test_keys_outside_the_bank(tmpdir):
+    filename = str(tmpdir.join("bank.npy"))
+    make_bank(filename, range(48, 61), sample_rate=8000)
+    renderer = samplebank.SampleBankRenderer(filename)
+    inside = renderer.note(60, 0.5)
+    above = renderer.note(72, 0.5)  # an octave above the highest key
+    below = renderer.note(36, 0.5)
+    held = slice(0, 4000)
+    assert len(above[held]) == len(below[held]) == 4000
+    crossings = lambda x: np.count_nonzero(np.diff(np.sign(x[held])))
+    assert abs(crossings(above) - 2 * crossings(inside)) <= 2
+    assert abs(crossings(below) - crossings(renderer.note(48, 0.5)) / 2) <= 2
+
+    buf = renderer.render_events([(0.0, 0.5, (60, 130))])  # past MIDI's 127
+    assert buf.any()
@@ -0,0 +1,40 @@
+import random
+import pytest
+
+from scheduler import Scheduler
+
+
+def test_missed_items_come_back_sooner():
+    s = Scheduler(rng=random.Random(0))
+    items = lambda: ["I", "IV", "V"]
+    asked = []
+    for _ in range(60):
+        item = s.next("single_chord", "C", items)
+        asked.append(item)
+        s.update("single_chord", item, correct=(item != "V"))
+    assert asked.count("V") > asked.count("I") + asked.count("IV")
+
+
+def test_saved_and_loaded(tmpdir):
+    filename = str(tmpdir.join("schedule.json"))
+    s = Scheduler(rng=random.Random(0))
+    s.next("interval", None, lambda: [(3, 1, True, None)])
+    s.update("interval", (3, 1, True, None), False)
+    s.save(filename)
+
+    loaded = Scheduler(rng=random.Random(0))
+    loaded.load(filename)
+    assert loaded.clocks == {"interval": 1}
+    stats = loaded.stats["interval", (3, 1, True, None)]
+    assert (stats.lapses, stats.reviews) == (1, 1)
+
+
+def test_only_answers_reschedule():
+    s = Scheduler(rng=random.Random(0))
+    items = lambda: list(range(10))
+    item = s.next("single_chord", None, items)
+    due = s.stats["single_chord", item].due
+    assert s.next("single_chord", None, items) == item  # not answered yet
+    assert s.stats["single_chord", item].due == due
+    s.update("single_chord", item, False)
+    assert s.stats["single_chord", item].due == pytest.approx(3.5, abs=0.5)
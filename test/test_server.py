@@ -0,0 +1,84 @@
+import asyncio, json, threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+import server
+
+
+def test_sessions_are_independent():
+    server.setup()
+    srv = server.Server()
+
+    async def run():
+        listener = await asyncio.start_server(srv.handle, "127.0.0.1", 0)
+        url = "http://127.0.0.1:{}".format(listener.sockets[0].getsockname()[1])
+        loop = asyncio.get_event_loop()
+
+        def post(path, obj):
+            request = Request(url + path, data=json.dumps(obj).encode())
+            return json.loads(urlopen(request).read())
+
+        a = await loop.run_in_executor(None, post, "/sessions", 
+                                       {"args": ["-k", "Eb"], 
+                                        "mode": "single_chord"})
+        b = await loop.run_in_executor(None, post, "/sessions", 
+                                       {"mode": "interval"})
+        assert a["prompt"].startswith("Enter 1-7 or root")
+        assert b["prompt"].startswith("Enter 1-7 or note names")
+        assert "KEY: Eb Maj" in a["output"] and "KEY: C Maj" in b["output"]
+        assert a["audio"]
+
+        a = await loop.run_in_executor(None, post, 
+                                       "/sessions/" + a["session"], 
+                                       {"answer": "x"})
+        assert a["done"]
+        assert list(srv.sessions) == [b["session"]]
+
+        for body in (b"[]", b'"x"', b"1", b"{"):
+            request = Request(url + "/sessions/" + b["session"], data=body)
+            with pytest.raises(HTTPError) as error:
+                await loop.run_in_executor(None, urlopen, request)
+            assert error.value.code == 400
+
+        for obj in ({"args": [1]}, {"args": 5}, {"args": "-k"},
+                    {"mode": "bogus"}, {"mode": ["interval"]}):
+            request = Request(url + "/sessions", data=json.dumps(obj).encode())
+            with pytest.raises(HTTPError) as error:
+                await loop.run_in_executor(None, urlopen, request)
+            assert error.value.code == 400
+
+        c = await loop.run_in_executor(None, post, "/sessions",
+                                       {"args": ["-k", "H"]})
+        assert "ATTENTION" in c["output"]
+
+        clip = b["audio"][0]["clip"]
+        wav = await loop.run_in_executor(
+            None, lambda: urlopen(url + "/clips/" + clip + ".wav").read())
+        assert wav[:4] == b"RIFF"
+        listener.close()
+
+    asyncio.run(run())
+
+
+def test_sessions_share_workers():
+    server.setup()
+    srv = server.Server(workers=2)
+
+    async def run():
+        threads = threading.active_count()
+        started = [await srv.message(None, {"mode": "interval"})
+                   for _ in range(100)]
+        sessions = [srv.sessions[r["session"]] for r in started]
+        answered = await asyncio.gather(*[
+            srv.message(s, {"answer": "1 3"}) for s in sessions])
+        assert all(r["count"] == 2 for r in answered)
+        assert threading.active_count() <= threads + 2
+
+        r = await srv.message(sessions[0], {"answer": "w"})
+        assert r["prompt"] == "Enter the desired BPM: "
+        await srv.message(sessions[0], {"answer": "90"})
+        assert sessions[0].state.BPM == 90
+
+    asyncio.run(run())
@@ -0,0 +1,18 @@
+import simulate
+from history import connect
+
+
+def transcript(tmpdir, run, args):
+    filename = str(tmpdir.join("history{}.sqlite".format(run)))
+    simulate.main(args + ["--history", filename])
+    return connect(filename).execute(
+        "SELECT mode, key, question, octave, answer, correct FROM answers "
+        "ORDER BY id").fetchall()
+
+
+def test_seeded_runs_repeat(tmpdir):
+    args = ["--answers", "random", "--seed", "7", "--questions", "40",
+            "--schedule"]
+    first = transcript(tmpdir, 1, args)
+    assert len(first) >= 4 * 40
+    assert transcript(tmpdir, 2, args) == first
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import timeline
+from musictools import easy_bar, progression_chords
+from render import Mixer
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1e-7  # time passes
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_no_drift():
+    clock = Clock()
+    line = timeline.Timeline(clock)
+    bar = easy_bar(progression_chords(['I', 'IV', 'V', 'I'], 'C'))
+    events = timeline.bar_events(bar, 480)
+    first = line.add(events)[0][0]
+    for n in range(1, 1000):
+        clock.now = line.end + 0.01  # the next bar is queued late
+        assert line.add(events)[0][0] == pytest.approx(first + n*0.5,
+                                                       abs=1e-9)
+
+    clock.now = line.end + 1  # stopped for a while, so starts afresh
+    assert line.add(events)[0][0] == pytest.approx(clock.now)
+
+
+def test_sequencer():
+    clock = Clock()
+    played = []
+    sequencer = timeline.Sequencer(
+        lambda keys: played.append((clock.now, 'on', keys)),
+        lambda keys: played.append((clock.now, 'off', keys)),
+        clock.sleep, clock)
+    events = [(1.0, 0.5, (60, 64)), (1.5, 0.5, ()), (2.0, 1.0, (60, 64))]
+    assert sequencer.play(events)
+    assert clock.now == pytest.approx(3.0)
+    assert [(round(t, 3), on, keys) for t, on, keys in played] == [
+        (1.0, 'on', (60, 64)), (1.5, 'off', (60, 64)),
+        (2.0, 'on', (60, 64)), (3.0, 'off', (60, 64))]
+    assert sequencer.jitter.count == 4 and sequencer.jitter.max < 1
+
+    played[:] = []
+    sequencer.sleep = lambda seconds: False  # cancelled
+    assert not sequencer.play([(3.5, 1.0, (67,)), (4.5, 1.0, (69,))])
+    assert played == []
+
+
+def test_mixer():
+    mixer = Mixer(1000)
+    clip = np.ones((300, 2), np.int16)
+    mixer.play(clip, at=0.25)
+    mixer.play(2 * clip, at=0.55)  # right as the first ends
+    out = np.concatenate([mixer.mix(64) for _ in range(20)])
+    assert mixer.time() == 1.28
+    assert (out[:250] == 0).all()
+    assert (out[250:550] == 1).all()
+    assert (out[550:850] == 2).all()
+    assert (out[850:] == 0).all()
@@ -0,0 +1,16 @@
+import timing
+
+
+def test_histogram_percentiles():
+    h = timing.Histogram()
+    for us in range(1, 100001):
+        h.record(us)
+    assert h.count == 100000 and h.max == 100000
+    for p in (50, 90, 99):
+        assert abs(h.percentile(p) - 1000 * p) <= 0.03 * 1000 * p
+
+    for index in range(2000):  # buckets tile the values with no gaps
+        low, high = timing.Histogram.bucket_range(index)
+        assert timing.Histogram.bucket(low) == index
+        assert timing.Histogram.bucket(high) == index
+        assert timing.Histogram.bucket(high + 1) == index + 1
@@ -0,0 +1,44 @@
+import settings as st
+import tokens
+from game_modes import new_state, eval_single_chord, eval_interval, \
+    eval_interval_name, eval_progression
+from musictools import IntervalTable
+
+
+def test_tokens():
+    assert tokens.parse("3") == (3, 3, None, "3")
+    assert tokens.parse("9") == (9, None, None, None)
+    for name in ("Db", "db", "C#", "c#"):
+        assert tokens.parse(name).pitch == 1
+    assert tokens.parse("Cb").pitch == 11 and tokens.parse("E#").pitch == 5
+    assert tokens.parse("bb").pitch == 10 and tokens.parse("b").pitch == 11
+    assert tokens.parse("b3").interval == tokens.parse("3b").interval == "3b"
+    assert tokens.parse("H#") is tokens.UNKNOWN
+    assert tokens.split("145") == ["1", "4", "5"]
+    assert tokens.split(" C  f G ") == ["C", "f", "G"]
+    assert tokens.split("") == []
+
+
+def test_evaluators(capsys):
+    state = new_state(st.parse(['-k', 'Eb']), 'interval')
+    assert eval_single_chord(state, "5", "V", "Bb")
+    assert eval_single_chord(state, "a#", "V", "Bb")
+    assert not eval_single_chord(state, "x", "V", "Bb")
+
+    question = IntervalTable.for_key("Eb", 4).question(3, 2)  # F up to Ab
+    for ans, right in [("24", True), ("2 4", True), ("f ab", True),
+                       ("E# G#", True), ("2", False), ("", False),
+                       ("2 5", False), ("Err", False)]:
+        state.SCORE = 0
+        eval_interval(state, ans, question)
+        assert state.SCORE == right, ans
+    for ans, right in [("3b", True), ("b3", True), ("3", False)]:
+        state.SCORE = 0
+        eval_interval_name(state, ans, question)
+        assert state.SCORE == right, ans
+
+    for ans, right in [("145", True), ("Eb ab bb", True), ("14", False),
+                       ("", False), ("146", False)]:
+        state.SCORE = 0
+        eval_progression(state, ans, ["I", "IV", "V"], ["I", "IV", "V"])
+        assert state.SCORE == right, ans
@@ -0,0 +1,165 @@
+"""
+Playing bars on time.
+
+`fluidsynth.play_Bar` times a bar by sleeping for the length of each chord,
+and the pauses made with `play_wait` are empty bars slept through the same
+way.  Every sleep runs a little long, and so does getting from one bar to
+the next, so the lateness adds up: at high BPM, and over long progressions,
+the music drifts behind the beat.
+
+Instead, everything played back to back (the cadence, the pauses, a
+question and its resolution) is compiled onto one `Timeline` of timestamped
+events, each bar starting exactly where the last one ended, however late
+it was queued.  A `Sequencer` dispatches the note on and off events at
+those times on a monotonic clock, waiting for each deadline rather than for
+a length of time, so one late event doesn't make the rest late, and records
+how late each one was (its jitter, reported by `benchmark`).  Rendered
+audio is laid out on the sound card's own clock instead, to the sample
+(see `render.Mixer`).
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import time
+
+import timing
+
+
+clock = timing.clock
+
+GAP = 0.05  # a bar queued up to this many seconds after the last one ended
+            # still follows on from it, rather than starting afresh
+SPIN = 0.001  # sleeps can overshoot by about this much, so the last of the
+              # wait for an event is spent checking the clock instead
+
+
+def bar_events(bar, bpm):
+    """Returns a list of (start, length, midi_keys) tuples, in seconds, for
+    the NoteContainers in `bar`, timed the way `fluidsynth.play_Bar` plays
+    them.  Rests have no keys."""
+    qn_length = 60.0 / bpm
+    events = []
+    t = 0.0
+    for _, duration, nc in bar:
+        if hasattr(nc, "bpm"):
+            qn_length = 60.0 / nc.bpm
+        length = qn_length * (4.0 / duration)
+        keys = () if nc is None else tuple(int(x) + 12 for x in nc)
+        events.append((t, length, keys))
+        t += length
+    return events
+
+
+def duration(events):
+    """Returns the seconds from the start of `events` to the end of the
+    last one."""
+    return max(start + length for start, length, _ in events) \
+        if events else 0.0
+
+
+def sequence(bars):
+    """Returns the events of the (bar, bpm) pairs `bars` played one after
+    another, as one list timed from the start of the first."""
+    events = []
+    t = 0.0
+    for bar, bpm in bars:
+        bar = bar_events(bar, bpm)
+        events.extend((t + start, length, keys)
+                      for start, length, keys in bar)
+        t += duration(bar)
+    return events
+
+
+class Timeline(object):
+    """Lays bars out one after another on the clock `now` (in seconds).
+
+    A bar starts when the last one ends, unless that was more than `gap`
+    seconds ago (the music had stopped), in which case it starts now."""
+
+    def __init__(self, now=clock, gap=GAP):
+        self.now = now
+        self.gap = gap
+        self.end = None  # when the last bar added ends
+
+    def start(self):
+        """Returns when a bar added now would start."""
+        now = self.now()
+        if self.end is None or now > self.end + self.gap:
+            return now
+        return self.end
+
+    def add(self, events):
+        """Returns `events` (as from `bar_events`) timed on the clock, as
+        the next bar."""
+        start = self.start()
+        self.end = start + duration(events)
+        return [(start + t, length, keys) for t, length, keys in events]
+
+    def reset(self):
+        """Starts afresh, e.g. after the music was stopped."""
+        self.end = None
+
+
+class Sequencer(object):
+    """Dispatches note events at their times on `clock`, calling
+    `note_on(keys)` as each starts and `note_off(keys)` as it ends.
+
+    Waits with `sleep`, which may return False to cancel playback (as
+    `audio.AudioWorker.sleep` does).  `jitter` is a `timing.Histogram` of
+    how late each event was dispatched, in microseconds."""
+
+    def __init__(self, note_on, note_off, sleep=time.sleep, clock=clock):
+        self.note_on = note_on
+        self.note_off = note_off
+        self.sleep = sleep
+        self.clock = clock
+        self.jitter = timing.Histogram()
+
+    def wait_until(self, deadline):
+        """Waits until `deadline`, returning False if cancelled first."""
+        delay = deadline - self.clock() - SPIN
+        if delay > 0 and self.sleep(delay) is False:
+            return False
+        while self.clock() < deadline:
+            pass
+        return True
+
+    def _dispatch(self, t, fcn, keys):
+        self.jitter.record(1e6 * (self.clock() - t))
+        fcn(keys)
+
+    def play(self, events, end=None):
+        """Plays `events` (timed on the clock, as from `Timeline.add`) and
+        returns True at `end` (defaults to when the last one ends), or
+        False as soon as it's cancelled, stopping any notes it started."""
+        changes = []
+        for start, length, keys in events:
+            if keys:
+                changes.append((start, 1, keys))
+                changes.append((start + length, 0, keys))
+        changes.sort()  # at the same time, notes end before others start
+        sounding = []
+        for t, on, keys in changes:
+            if not self.wait_until(t):
+                for keys in sounding:
+                    self.note_off(keys)
+                return False
+            if on:
+                self._dispatch(t, self.note_on, keys)
+                sounding.append(keys)
+            else:
+                self._dispatch(t, self.note_off, keys)
+                sounding.remove(keys)
+        if end is None:
+            end = max(start + length for start, length, _ in events) \
+                if events else self.clock()
+        return self.wait_until(end)
+
+    def start(self, keys, at):
+        """Starts `keys` sounding at `at`, without stopping them."""
+        if self.wait_until(at):
+            self._dispatch(at, self.note_on, keys)
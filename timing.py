@@ -0,0 +1,171 @@
+"""
+Where the time goes in the game loop.
+
+With --timing, each phase of every question is timed and recorded in a
+histogram:
+
+  question         getting the next question (instant if it was prepared
+                   ahead, see `prefetch`)
+  chords           building a question's chords, interval or progression
+  naming           naming its chord
+  audio submit     handing the question's audio to the audio worker
+  audio queue      from handing audio to the worker to it starting to play
+  answer to sound  from an answer to the next sound starting
+  think            waiting for the user to answer
+  evaluate         grading an answer (and queuing any resolution)
+
+The histograms are printed on quitting, or with the "l" command.  When
+timing is off, `span` returns a shared do-nothing context manager and the
+other functions return at once, so the game runs at full speed.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+import threading, time
+
+
+clock = getattr(time, "perf_counter", time.time)
+
+PHASES = ("question", "chords", "naming", "audio submit", "audio queue",
+          "answer to sound", "think", "evaluate")
+SUB_BUCKET_BITS = 5  # 32 buckets per power of two, so values are kept to
+                     # within about 3%
+
+
+class Histogram(object):
+    """Counts microsecond values in log-linear buckets, as HdrHistogram
+    does: values below 2**(SUB_BUCKET_BITS + 1) get a bucket each, after
+    which every power of two is split into 2**SUB_BUCKET_BITS buckets.
+    Recording is O(1) and memory grows with the log of the largest value."""
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = max(value.bit_length() - SUB_BUCKET_BITS - 1, 0)
+        return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+    @staticmethod
+    def bucket_range(index):
+        """Returns the lowest and highest values counted in bucket
+        `index`."""
+        shift = max((index >> SUB_BUCKET_BITS) - 1, 0)
+        low = (index - (shift << SUB_BUCKET_BITS)) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, us):
+        us = max(int(us), 0)
+        index = self.bucket(us)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Returns (the middle of the bucket of) the `p`th percentile."""
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                low, high = self.bucket_range(index)
+                return min((low + high) / 2, self.max)
+        return 0.0
+
+
+enabled = False
+histograms = dict((phase, Histogram()) for phase in PHASES)
+_lock = threading.Lock()  # phases are timed on several threads
+_answered = None  # when the last answer was given, until the next sound
+
+
+def record(phase, seconds):
+    if enabled:
+        with _lock:
+            histograms[phase].record(1e6 * seconds)
+
+
+class _Span(object):
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = clock()
+
+    def __exit__(self, *exc_info):
+        record(self.phase, clock() - self.start)
+
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(phase):
+    """Returns a context manager timing its block as `phase`."""
+    return _Span(phase) if enabled else _no_span
+
+
+def answered(think_seconds):
+    """Records that the user answered, after thinking `think_seconds`."""
+    global _answered
+    if enabled:
+        record("think", think_seconds)
+        _answered = clock()
+
+
+def sound_started(submitted, audible=True):
+    """Records that audio handed over at `submitted` (a `clock` time)
+    started playing (`audible` is False for rests)."""
+    global _answered
+    if enabled:
+        now = clock()
+        record("audio queue", now - submitted)
+        if audible and _answered is not None:
+            record("answer to sound", now - _answered)
+            _answered = None
+
+
+def reset():
+    with _lock:
+        for phase in PHASES:
+            histograms[phase] = Histogram()
+
+
+def report():
+    """Returns the histograms as a table of milliseconds."""
+    lines = ["  {:<16} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "phase", "count", "mean ms", "p50 ms", "p90 ms", "p99 ms", "max ms")]
+    with _lock:
+        for phase in PHASES:
+            h = histograms[phase]
+            lines.append("  {:<16} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} "
+                         "{:>10.3f} {:>10.3f}".format(
+                             phase, h.count, h.mean() / 1e3,
+                             h.percentile(50) / 1e3, h.percentile(90) / 1e3,
+                             h.percentile(99) / 1e3, h.max / 1e3))
+    return "\n".join(lines)
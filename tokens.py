@@ -0,0 +1,79 @@
+"""
+Reading what the user typed.
+
+Every token an answer can be made of is compiled, once, into `TOKENS`, a
+dict from the token to what it means, so grading an answer is a lookup
+that never raises and never builds a mingus Note:
+
+  "0"-"9"         a number, and "1"-"7" a scale degree
+  note names      a pitch class (0 for C to 11 for B), in either case and
+                  with up to two sharps or flats, so "Db", "db" and "C#" all
+                  mean 1, and "Cb" means 11
+  interval names  an interval, named as in `musictools.INTERVAL_NAMES`
+                  ("3b" for a minor third, which can also be typed "b3")
+
+A token can mean several things ("3" is a degree and an interval): each is
+a `Token`, with None for whatever it doesn't mean.  `split` breaks up an
+answer of several tokens ("145", "1 4 5" or "C F G") and `parse` looks a
+token up.
+"""
+
+# For python 3 compatibility
+from __future__ import division, absolute_import, print_function
+try: input = raw_input
+except: pass
+
+# External Dependencies
+from collections import namedtuple
+
+from musictools import INTERVAL_NAMES
+
+
+Token = namedtuple("Token", ["number", "degree", "pitch", "interval"])
+UNKNOWN = Token(None, None, None, None)
+
+_LETTERS = (("C", 0), ("D", 2), ("E", 4), ("F", 5), ("G", 7), ("A", 9),
+            ("B", 11))
+_ACCIDENTALS = (("", 0), ("#", 1), ("##", 2), ("b", -1), ("bb", -2))
+
+
+def _compile():
+    meanings = {}
+
+    def add(token, **meaning):
+        meanings.setdefault(token, {}).update(meaning)
+
+    for n in range(10):
+        add(str(n), number=n, degree=n if 1 <= n <= 7 else None)
+    for letter, pitch in _LETTERS:
+        for accidental, shift in _ACCIDENTALS:
+            for name in (letter, letter.lower()):
+                add(name + accidental, pitch=(pitch + shift) % 12)
+    for name in INTERVAL_NAMES:
+        add(name, interval=name)
+        if name.endswith("b"):
+            add("b" + name[:-1], interval=name)
+    return dict((token, UNKNOWN._replace(**meaning))
+                for token, meaning in meanings.items())
+
+
+TOKENS = _compile()
+
+
+def parse(token):
+    """Returns the `Token` for `token` (`UNKNOWN` if it means nothing)."""
+    return TOKENS.get(token, UNKNOWN)
+
+
+def split(answer):
+    """Returns the tokens of `answer`: each digit if it's all digits (so
+    "145" is three answers), otherwise each word."""
+    if answer.isdigit():
+        return list(answer)
+    return answer.split()
+
+
+def is_note(token):
+    """Returns whether `token` is a scale degree or a note name."""
+    token = TOKENS.get(token, UNKNOWN)
+    return token.degree is not None or token.pitch is not None